@@ -0,0 +1,64 @@
+"""Benchmark for `OpenAIModel` against the local OpenAI stub server.
+
+Compares sequential sync calls, concurrent async calls and cached repeats:
+
+    python -m benchmarks.openai_client --requests 64 --latency 0.5
+"""
+import argparse
+import asyncio
+import time
+
+from models import open_ai
+from utils import openai_stub
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.25)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    server, config = openai_stub.start_stub_server(
+        latency=args.latency, failure_rate=args.failure_rate
+    )
+    model = open_ai.OpenAIModel(
+        "gpt-4o",
+        "stub-key",
+        base_url=f"http://127.0.0.1:{server.server_port}/v1",
+        max_concurrency=args.concurrency,
+        backoff_base=0.05,
+        cache_ttl=600,
+    )
+    prompts = [{"user": f"Scene number {i}"} for i in range(args.requests)]
+
+    start = time.perf_counter()
+    for prompt_dict in prompts:
+        model.generate_response(prompt_dict)
+    sync_time = time.perf_counter() - start
+
+    model.cache = open_ai.ResponseCache(ttl=600)
+    start = time.perf_counter()
+
+    async def run_async():
+        await asyncio.gather(*(model.agenerate_response(p) for p in prompts))
+
+    asyncio.run(run_async())
+    async_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for prompt_dict in prompts:
+        model.generate_response(prompt_dict)
+    cached_time = time.perf_counter() - start
+
+    print(f"requests: {args.requests}, stub latency: {args.latency}s")
+    print(f"sync sequential: {sync_time:.2f}s")
+    print(f"async concurrent (cap {args.concurrency}): {async_time:.2f}s")
+    print(f"cached repeats: {cached_time * 1000:.2f}ms")
+    print(f"stub requests served: {config.requests}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
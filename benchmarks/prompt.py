@@ -0,0 +1,105 @@
+"""Micro-benchmark of prompt construction per endpoint.
+
+Compares building fresh `jinja2.Template` objects per request (the previous
+behaviour) with the precompiled registry in `modules.prompt`:
+
+    python -m benchmarks.prompt --iterations 2000
+"""
+import argparse
+import time
+
+import jinja2
+
+from modules import prompt
+from modules import schema
+from presets import extract_shot_breakdown
+from presets import generate_character_profile
+from presets import generate_frame
+
+SCRIPT = "INT. HARBOUR - DAWN\nMAYA waits on the pier as the fog rolls in.\n" * 40
+
+
+def legacy_shot_breakdown(request: schema.ExtractShotBreakdownRequest):
+    jinja2.Template(source=extract_shot_breakdown.USER_SCRIPT).render(
+        {
+            "SCRIPT": request.script,
+            "ADDITIONAL_INFO": jinja2.Template(
+                source=extract_shot_breakdown.SCENE_ADDITIONAL_INFO
+            ).render(
+                {
+                    "LOCATION": request.location,
+                    "FRAMES": request.num_frames,
+                    "GENRE": request.genre,
+                }
+            ),
+        }
+    )
+    jinja2.Template(source=extract_shot_breakdown.PREAMBLE).render(
+        {"sample_output": extract_shot_breakdown.SAMPLE_OUTPUT}
+    )
+
+
+def legacy_frame(request: schema.GenerateSceneRequest):
+    jinja2.Template(generate_frame.STORYBOARD_PREAMBLE).render(
+        {
+            "SAMPLE_PROMPT": generate_frame.styles[request.parameters.visual_style][
+                "SAMPLE"
+            ]
+        }
+    )
+
+
+def legacy_character_profile(request: schema.CharacterProfileRequest):
+    jinja2.Template(source=generate_character_profile.PREAMBLE).render()
+
+
+def timed(build, request, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        build(request)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=1000)
+    args = parser.parse_args()
+
+    parameters = schema.ImageGenParameters(visual_style=schema.VisualStyle.CINEMATIC)
+    scene = schema.Scene(
+        scene_id="1",
+        prompt="Maya waits on the pier.",
+        location="Harbour",
+        character_expressions=[],
+    )
+    character = schema.Character(character_id="maya-1", name="Maya")
+    cases = [
+        (
+            "extract_shot_breakdown",
+            schema.ExtractShotBreakdownRequest(script=SCRIPT, num_frames=12),
+            legacy_shot_breakdown,
+            prompt.prepare_prompt_to_extract_shot_breakdown,
+        ),
+        (
+            "generate_scene",
+            schema.GenerateSceneRequest(scene=scene, parameters=parameters),
+            legacy_frame,
+            prompt.prepare_prompt_to_generate_frame,
+        ),
+        (
+            "generate_character_profile",
+            schema.CharacterProfileRequest(character=character, parameters=parameters),
+            legacy_character_profile,
+            prompt.prepare_prompt_to_generate_character_profile,
+        ),
+    ]
+
+    print(f"{'endpoint':<28}{'legacy us':>12}{'registry us':>14}")
+    for name, request, legacy, current in cases:
+        legacy_us = timed(legacy, request, args.iterations)
+        current_us = timed(current, request, args.iterations)
+        print(f"{name:<28}{legacy_us:>12.1f}{current_us:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
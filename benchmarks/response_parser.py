@@ -0,0 +1,101 @@
+"""Benchmark for the shot breakdown block parser.
+
+Compares the legacy regex + `eval` extraction with `response_parser` on
+synthetic responses, or on recorded ones (one JSON string per line):
+
+    python -m benchmarks.response_parser --frames 60 --iterations 200
+    python -m benchmarks.response_parser --responses recorded.jsonl
+"""
+import argparse
+import json
+import re
+import time
+
+from modules import response_parser
+
+
+def synthetic_response(num_frames: int) -> str:
+    characters = [
+        {
+            "name": f"Character {i}",
+            "age": 30 + i,
+            "gender": "female",
+            "description": "Tall, wears a red coat.",
+        }
+        for i in range(4)
+    ]
+    frames = [
+        {
+            "frame_id": f"{i}",
+            "description": f"Wide view of the harbour at dawn, frame {i}.",
+            "shot_type": "WIDE_SHOT",
+            "camera_angle": "High angle",
+            "location": "Harbour",
+            "character_expressions": [
+                ("Character 0", "worried"),
+                ("Character 1", "calm"),
+            ],
+            "director_tips": "Let the fog roll in slowly.",
+            "original_script_chunk": "EXT. HARBOUR - DAWN",
+        }
+        for i in range(num_frames)
+    ]
+    lines = ",\n".join(repr(frame) for frame in frames)
+    return (
+        f"```characters\ntotal: {len(characters)}\n{characters!r}\n```\n"
+        f"```frames\ntotal: {num_frames}\n[\n{lines},\n]\n```"
+    )
+
+
+def legacy_parse(model_response: str, name: str):
+    match_group = re.search(f"(```{name}[^```]*```)", model_response)
+    lines = match_group.group(0).strip(f"```{name}").strip().split("\n")
+    return eval("".join(lines[1:]))
+
+
+def new_parse(model_response: str, name: str):
+    return response_parser.parse_block(model_response, name).items
+
+
+def timed(parse, responses: list[str], iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for model_response in responses:
+            parse(model_response, "characters")
+            parse(model_response, "frames")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=40)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--responses", default="")
+    args = parser.parse_args()
+
+    if args.responses:
+        with open(args.responses, "r", encoding="utf-8") as file:
+            responses = [json.loads(line) for line in file if line.strip()]
+    else:
+        responses = [synthetic_response(args.frames)]
+
+    for model_response in responses:
+        try:
+            legacy = legacy_parse(model_response, "frames")
+        except Exception as exc:
+            print(f"legacy parser failed: {exc!r}")
+            continue
+        if legacy != new_parse(model_response, "frames"):
+            print("parsers disagree on a response")
+
+    legacy_time = timed(legacy_parse, responses, args.iterations)
+    new_time = timed(new_parse, responses, args.iterations)
+    total = len(responses) * args.iterations
+    print(
+        f"legacy eval:     {legacy_time:.3f}s ({total / legacy_time:.1f} responses/s)"
+    )
+    print(f"response_parser: {new_time:.3f}s ({total / new_time:.1f} responses/s)")
+
+
+if __name__ == "__main__":
+    main()
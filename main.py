@@ -1,38 +1,147 @@
 """Driver code for AI server."""
+import asyncio
+import base64
+import hashlib
 import json
+import os
 import re
 import tempfile
 import time
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from typing import Union
+from urllib.parse import quote
 from urllib.parse import urlparse
 
-import requests
 from fastapi import FastAPI
+from fastapi import HTTPException
 from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.responses import Response
+from fastapi.responses import StreamingResponse
+from PIL import Image
 
+from models import flux
 from models import hugging_face
 from models import open_ai
-# from models import stable_diffusion
-from models import flux
+from models import resolution
+from models import webui
 from modules import errors
 from modules import img2img
+from modules import jobs
+from modules import lama_inpaint
+from modules import model_registry
 from modules import parse
 from modules import prompt
+from modules import scheduler
 from modules import schema
+from modules import script_cache
 from utils import common
 from utils import constants
+from utils import image_buffer
+from utils import image_encoder
 from utils import logging as custom_logger
+from utils import prefetch
 
 app = FastAPI()
 
 # Global Model objects
-GPT_4_O_MODEL = open_ai.OpenAIModel("gpt-4o", constants.OPEN_AI_API_KEY)
+GPT_4_O_MODEL = open_ai.OpenAIModel(
+    "gpt-4o",
+    constants.OPEN_AI_API_KEY,
+    base_url=constants.OPEN_AI_BASE_URL,
+    max_concurrency=constants.OPEN_AI_MAX_CONCURRENCY,
+    timeout=constants.OPEN_AI_TIMEOUT,
+    cache_ttl=constants.OPEN_AI_CACHE_TTL,
+)
 # SDXL_MODEL = stable_diffusion.SDXLText2ImageModel(
 #     base_dir=constants.ModelBaseDir, cache_dir=constants.ModelCacheDir
 # )
 # Just to cache things in the start for faster iterations later.
 # SDXL_MODEL.load_ip_adapter()
-FLUX_MODEL = flux.FluxModel()
-FLUX_MODEL.load_ip_adapter()
+
+
+def load_ip_adapter() -> flux.FluxModel:
+    flux_model = MODELS.get("flux")
+    # A resident adapter is already loaded by the Flux warm-up.
+    if not flux_model.is_adapter_loaded:
+        flux_model.load_ip_adapter()
+    return flux_model
+
+
+def load_lama() -> lama_inpaint.LamaInpainter:
+    inpainter = lama_inpaint.get_inpainter()
+    inpainter.load()
+    return inpainter
+
+
+# GPU models load in the background once the server is up; see `/ready`.
+MODELS = model_registry.MODELS
+MODELS.register(
+    "flux",
+    lambda: flux.FluxModel(
+        weights=constants.FluxWeights,
+        resolution_buckets=constants.ResolutionBuckets,
+        compile=constants.FluxCompile,
+        max_batch_size=constants.FluxMaxBatchSize,
+    ),
+    warmup=flux.FluxModel.warm_up,
+    eager="flux" in constants.EagerModels,
+    variant=constants.FluxWeights,
+)
+MODELS.register(
+    "ip_adapter",
+    load_ip_adapter,
+    eager="ip_adapter" in constants.EagerModels,
+)
+MODELS.register(
+    "lama",
+    load_lama,
+    warmup=lama_inpaint.LamaInpainter.warm_up,
+    eager="lama" in constants.EagerModels,
+)
+MODELS.register(
+    "mask_model",
+    lambda: hugging_face.Resnet(
+        base_dir=constants.ModelBaseDir, cache_dir=constants.ModelCacheDir
+    ),
+    eager="mask_model" in constants.EagerModels,
+)
+MODELS.register(
+    "prompt_enhancer",
+    lambda: hugging_face.EnhancePrompt(
+        base_dir=constants.ModelBaseDir, cache_dir=constants.ModelCacheDir
+    ),
+    eager="prompt_enhancer" in constants.EagerModels,
+)
+FLUX_MODEL = MODELS.proxy("flux", "ip_adapter")
+# All GPU work goes through a single worker which also batches compatible jobs.
+FLUX_SCHEDULER = scheduler.GpuScheduler(
+    FLUX_MODEL,
+    max_batch_size=constants.FluxMaxBatchSize,
+    size_fn=resolution.generation_size if constants.ResolutionBuckets else None,
+)
+JOB_MANAGER = jobs.JobManager(
+    jobs.create_store(constants.JobStore),
+    ttl_seconds=constants.JobTTLSeconds,
+    max_records=constants.JobMaxRecords,
+)
+WEBUI_CLIENT = webui.WebUIClient(
+    webui.parse_hosts(constants.WEBUI_INSTANCE_IP),
+    timeout=constants.WEBUI_TIMEOUT,
+    max_retries=constants.WEBUI_MAX_RETRIES,
+    health_interval=constants.WEBUI_HEALTH_INTERVAL,
+)
+SCRIPT_CACHE = script_cache.ScriptCache(
+    max_entries=constants.ScriptCacheMaxEntries, cache_dir=constants.ScriptCacheDir
+)
+IMAGE_PREFETCHER = prefetch.ImagePrefetcher(
+    max_workers=constants.ImagePrefetchWorkers,
+    max_bytes=constants.ImagePrefetchCacheBytes,
+)
 # PROMPT_ENHANCER = hugging_face.EnhancePrompt(
 #     base_dir=constants.ModelBaseDir, cache_dir=constants.ModelCacheDir
 # )
@@ -55,9 +164,93 @@ async def add_request_id_header(request: Request, call_next):
     return response
 
 
+@app.on_event("startup")
+def load_models():
+    MODELS.start()
+
+
 @app.get("/")
 def read_root():
-    return "All models initialized"
+    return "All models initialized" if MODELS.ready() else "Models are loading"
+
+
+@app.get("/health")
+def read_health():
+    """Liveness: fails only when an eagerly loaded model could not be loaded."""
+    status_code = 200 if MODELS.healthy() else 503
+    return JSONResponse({"models": MODELS.status()}, status_code=status_code)
+
+
+@app.get("/ready")
+def read_ready():
+    """Readiness: 200 once every eagerly loaded model is loaded and warmed up."""
+    status_code = 200 if MODELS.ready() else 503
+    return JSONResponse(
+        {"ready": MODELS.ready(), "models": MODELS.status()}, status_code=status_code
+    )
+
+
+# Formats served to clients that ask for binary images via the Accept header.
+BINARY_IMAGE_FORMATS = {"image/webp": "WEBP", "image/png": "PNG", "image/jpeg": "JPEG"}
+
+
+def accepted_image_type(http_request: Optional[Request]) -> Optional[str]:
+    """Returns the binary image media type the client asked for, if any.
+
+    Old clients send no image type in Accept and keep getting base64 JSON.
+    """
+    if http_request is None:
+        return None
+    for part in http_request.headers.get("accept", "").split(","):
+        media_type = part.split(";")[0].strip().lower()
+        if media_type in BINARY_IMAGE_FORMATS:
+            return media_type
+    return None
+
+
+def binary_image_response(
+    image: Union[Image.Image, bytes],
+    media_type: str,
+    options: schema.ImageOutputOptions = None,
+    **metadata,
+) -> Response:
+    """Raw image response; short JSON fields travel as X-* headers (url quoted).
+
+    Long free text such as the scene description is left out, as proxies and
+    servers cap the header size; clients that need it request JSON.
+    """
+    if isinstance(image, bytes):
+        # Already encoded, e.g. WebUI output, served as is.
+        content, media_type = image, image_buffer.sniff_media_type(image)
+    else:
+        image_format = BINARY_IMAGE_FORMATS[media_type]
+        params = image_encoder.save_params(
+            options or schema.ImageOutputOptions(), image_format
+        )
+        content = image_buffer.to_bytes(image, image_format, **params)
+        if residual_cache := flux.residual_cache_stats(image):
+            skipped = f"{residual_cache['skipped_steps']}/{residual_cache['steps']}"
+            metadata["skipped_steps"] = skipped
+    headers = {
+        "X-" + name.replace("_", "-").title(): quote(str(value))
+        for name, value in metadata.items()
+    }
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+@app.get("/metrics")
+def read_metrics():
+    """Returns GPU scheduler metrics, cache hit rates and model load timings."""
+    flux_ready = MODELS.is_ready("flux") and MODELS.is_ready("ip_adapter")
+    return {
+        "gpu_scheduler": FLUX_SCHEDULER.metrics(),
+        "models": MODELS.status(),
+        "flux_caches": FLUX_MODEL.cache_stats() if flux_ready else {},
+        "flux_load_timings": FLUX_MODEL.load_timings if flux_ready else {},
+        "script_cache": SCRIPT_CACHE.stats(),
+        "webui_backends": WEBUI_CLIENT.metrics(),
+        "image_prefetcher": IMAGE_PREFETCHER.stats(),
+    }
 
 
 @app.post("/extract_shot_breakdown")
@@ -84,9 +277,15 @@ def extract_shot_breakdown(
         start_time = time.time()
         LOGGER.info(f"Processing request for extract_shot_breakdown endpoint!")
         prompt_dict = prompt.prepare_prompt_to_extract_shot_breakdown(request)
-        model_response = GPT_4_O_MODEL.generate_response(prompt_dict)
-        characters = parse.parse_characters(model_response)
-        frames, ts = parse.parse_frames(model_response, characters)
+        response_format = {"type": "json_object"} if request.json_mode else None
+        model_response = GPT_4_O_MODEL.generate_response(
+            prompt_dict, response_format=response_format
+        )
+        if request.json_mode:
+            characters, frames, ts = parse.parse_shot_breakdown_json(model_response)
+        else:
+            characters = parse.parse_characters(model_response)
+            frames, ts = parse.parse_frames(model_response, characters)
         total_frames = ts if request.num_frames == 0 else request.num_frames
         LOGGER.info(
             f"{len(frames)} frames extracted. {len(characters)} characters extracted."
@@ -101,15 +300,22 @@ def extract_shot_breakdown(
                 }
             )
             max_tries = 3
-            while len(frames) < total_frames or max_tries > 0:
+            while len(frames) < total_frames and max_tries > 0:
                 frames_left = total_frames - len(frames)
                 prompt_dict.update(
                     {
                         "user": f"Great! Can you generate the details for the remaining {frames_left} frames?"
                     }
                 )
-                model_response = GPT_4_O_MODEL.generate_response(prompt_dict)
-                sc, _ = parse.parse_frames(model_response, characters)
+                model_response = GPT_4_O_MODEL.generate_response(
+                    prompt_dict, response_format=response_format
+                )
+                if request.json_mode:
+                    _, sc, _ = parse.parse_shot_breakdown_json(
+                        model_response, characters
+                    )
+                else:
+                    sc, _ = parse.parse_frames(model_response, characters)
                 frames.extend(sc)
                 prompt_dict.update(
                     {
@@ -130,7 +336,7 @@ def extract_shot_breakdown(
         return schema.ExtractShotBreakdownResponse(
             script=request.script,
             scenes=frames,
-            characters=characters,
+            characters=characters.characters,
         )
     except errors.BaseCustomError as exc:
         custom_logger.log_exceptions(LOGGER, exc)
@@ -139,9 +345,96 @@ def extract_shot_breakdown(
         )
 
 
+@app.post("/extract_shot_breakdown_stream")
+def extract_shot_breakdown_stream(
+    request: schema.ExtractShotBreakdownRequest,
+) -> StreamingResponse:
+    """Streaming variant of /extract_shot_breakdown.
+
+    Consumes the completion token stream and emits NDJSON events as soon as
+    they are parsed:
+        {"event": "characters", "characters": [...]}
+        {"event": "scene", "scene": {...}}
+        {"event": "done", "total_frames": N, "num_frames": M}
+    Continuation requests are issued only for frames still missing once the
+    stream ends. Failures are reported as a final {"event": "error"} line.
+
+    Args:
+        request: A ExtractShotBreakdownRequest object.
+
+    Returns:
+        A streaming NDJSON response.
+    """
+
+    def event(name: str, **payload) -> str:
+        return json.dumps(jsonable_encoder({"event": name, **payload})) + "\n"
+
+    def stream_events():
+        start_time = time.time()
+        LOGGER.info(f"Processing request for extract_shot_breakdown_stream endpoint!")
+        try:
+            prompt_dict = prompt.prepare_prompt_to_extract_shot_breakdown(request)
+            stream_parser = parse.ShotBreakdownStreamParser()
+            seen_scene_ids = set()
+            total_frames = request.num_frames
+            max_tries = 3
+            while True:
+                model_response = []
+                for delta in GPT_4_O_MODEL.stream_response(prompt_dict):
+                    model_response.append(delta)
+                    for name, payload in stream_parser.feed(delta):
+                        if name == "characters":
+                            yield event("characters", characters=payload)
+                        elif name == "scene" and payload.scene_id not in seen_scene_ids:
+                            seen_scene_ids.add(payload.scene_id)
+                            yield event("scene", scene=payload)
+                        elif name == "total_frames" and request.num_frames == 0:
+                            total_frames = max(total_frames, payload)
+                stream_parser.close()
+                for exc in stream_parser.errors:
+                    custom_logger.log_exceptions(LOGGER, exc)
+                stream_parser.errors = []
+
+                frames_left = total_frames - len(seen_scene_ids)
+                if frames_left <= 0 or max_tries == 0:
+                    break
+                # Ask only for the frames that are genuinely missing.
+                prompt_dict.update({"assistant": "".join(model_response)})
+                prompt_dict.update(
+                    {
+                        "user": f"Great! Can you generate the details for the remaining {frames_left} frames?"
+                    }
+                )
+                stream_parser = parse.ShotBreakdownStreamParser(
+                    characters=stream_parser.characters
+                )
+                max_tries -= 1
+                LOGGER.info(f"Requesting {frames_left} more frames.")
+
+            if total_frames > len(seen_scene_ids):
+                LOGGER.warn(f"E-3-2-32:: Model generated less frames than desired.")
+            LOGGER.info(
+                f"Time taken to stream shot breakdown: {(time.time() - start_time):.2f} seconds"
+            )
+            LOGGER.info(
+                f"Processed request for extract_shot_breakdown_stream endpoint successfully!!"
+            )
+            yield event(
+                "done", total_frames=total_frames, num_frames=len(seen_scene_ids)
+            )
+        except errors.BaseCustomError as exc:
+            custom_logger.log_exceptions(LOGGER, exc)
+            yield event(
+                "error",
+                error="An error occured while generating shot breakdown. Please refer logs for more details.",
+            )
+
+    return StreamingResponse(stream_events(), media_type="application/x-ndjson")
+
+
 @app.post("/generate_character_profile")
-def generate_character_profile(
-    request: schema.CharacterProfileRequest,
+async def generate_character_profile(
+    request: schema.CharacterProfileRequest, http_request: Request = None
 ) -> schema.CharacterProfileResponse:
     """Callback function to generate profiles for a character.
 
@@ -161,7 +454,8 @@ def generate_character_profile(
     try:
         start_time = time.time()
         LOGGER.info(f"Processing request for generate_character_profile endpoint!")
-        model_response = GPT_4_O_MODEL.generate_response(
+        model_response = await run_in_threadpool(
+            GPT_4_O_MODEL.generate_response,
             prompt_dict=prompt.prepare_prompt_to_generate_character_profile(request),
         )
         modified_prompt, neg_prompt = prompt.enhance_prompt(
@@ -171,24 +465,44 @@ def generate_character_profile(
         if request.parameters.negative_prompt == "":
             request.parameters.negative_prompt = neg_prompt
 
-        image = FLUX_MODEL.predict(
-            prompt=modified_prompt,
-            params=request.parameters,
-            use_ip_adapter=False,
-            character_images=[],
+        priority, timeout = constants.GpuJobPolicies["generate_character_profile"]
+        image = await asyncio.wrap_future(
+            FLUX_SCHEDULER.submit(
+                prompt=modified_prompt,
+                params=request.parameters,
+                use_ip_adapter=False,
+                character_images=[],
+                priority=priority,
+                timeout=timeout,
+                on_step=JOB_MANAGER.progress_callback(),
+            )
         )
-        b64_results = common.convert_to_b64(image)
         end_time = time.time() - start_time
         LOGGER.info(f"Time taken to generate a frame: {end_time:.2f} seconds")
         LOGGER.info(
             f"Processed request for generate_character_profile endpoint successfully!!"
         )
+        if media_type := accepted_image_type(http_request):
+            return await run_in_threadpool(
+                binary_image_response,
+                image,
+                media_type,
+                request.parameters.output,
+                prompt=modified_prompt,
+                time_taken=end_time,
+            )
+        encoded = await asyncio.wrap_future(
+            image_encoder.encode_async(image, request.parameters.output)
+        )
         return schema.CharacterProfileResponse(
             description=model_response,
             result=schema.ImageGenResult(
                 prompt=modified_prompt,
-                data=b64_results,
+                data=encoded.data,
                 time_taken=str(end_time),
+                media_type=encoded.media_type,
+                preview=encoded.preview,
+                residual_cache=flux.residual_cache_stats(image),
             ),
         )
     except errors.BaseCustomError as exc:
@@ -199,8 +513,8 @@ def generate_character_profile(
 
 
 @app.post("/generate_scene")
-def generate_frame(
-    request: schema.GenerateSceneRequest,
+async def generate_frame(
+    request: schema.GenerateSceneRequest, http_request: Request = None
 ) -> schema.GenerateSceneResponse:
     """Callback function to handle frame generation.
 
@@ -221,7 +535,10 @@ def generate_frame(
     try:
         start_time = time.time()
         LOGGER.info(f"Processing request for generate_scene endpoint!")
-        model_response = GPT_4_O_MODEL.generate_response(
+        # Character references download while the prompt is being expanded.
+        prefetched = IMAGE_PREFETCHER.prefetch(request.characters)
+        model_response = await run_in_threadpool(
+            GPT_4_O_MODEL.generate_response,
             prompt_dict=prompt.prepare_prompt_to_generate_frame(request),
         )
         modified_prompt, neg_prompt = prompt.enhance_prompt(
@@ -232,30 +549,51 @@ def generate_frame(
         if request.parameters.negative_prompt == "":
             request.parameters.negative_prompt = neg_prompt
 
-        use_ip_adapter = False
-        character_images = []
-        if request.characters:
-            character_images = [
-                common.read_image_from_s3(img_path) for img_path in request.characters
-            ]
-            use_ip_adapter = True
+        # Character references are resolved to (cached) IP-Adapter embeds from
+        # their ETag-qualified S3 keys on the GPU worker; the prefetched images
+        # are only encoded on an embed cache miss.
+        use_ip_adapter = bool(request.characters)
+        character_keys, character_images = await run_in_threadpool(
+            IMAGE_PREFETCHER.resolve, request.characters, prefetched
+        )
 
-        image = FLUX_MODEL.predict(
-            prompt=modified_prompt,
-            params=request.parameters,
-            use_ip_adapter=use_ip_adapter,
-            character_images=character_images,
+        priority, timeout = constants.GpuJobPolicies["generate_scene"]
+        image = await asyncio.wrap_future(
+            FLUX_SCHEDULER.submit(
+                prompt=modified_prompt,
+                params=request.parameters,
+                use_ip_adapter=use_ip_adapter,
+                character_keys=character_keys,
+                character_images=character_images,
+                priority=priority,
+                timeout=timeout,
+                on_step=JOB_MANAGER.progress_callback(),
+            )
         )
-        b64_results = common.convert_to_b64(image)
         end_time = time.time() - start_time
         LOGGER.info(f"Time taken to generate a frame: {end_time:.2f} seconds")
         LOGGER.info(f"Processed request for generate_scene endpoint successfully!!")
+        if media_type := accepted_image_type(http_request):
+            return await run_in_threadpool(
+                binary_image_response,
+                image,
+                media_type,
+                request.parameters.output,
+                prompt=modified_prompt,
+                time_taken=end_time,
+            )
+        encoded = await asyncio.wrap_future(
+            image_encoder.encode_async(image, request.parameters.output)
+        )
         return schema.GenerateSceneResponse(
             description=model_response,
             result=schema.ImageGenResult(
                 prompt=modified_prompt,
-                data=b64_results,
+                data=encoded.data,
                 time_taken=str(end_time),
+                media_type=encoded.media_type,
+                preview=encoded.preview,
+                residual_cache=flux.residual_cache_stats(image),
             ),
         )
     except errors.BaseCustomError as exc:
@@ -265,9 +603,106 @@ def generate_frame(
         )
 
 
+@app.post("/generate_storyboard")
+def generate_storyboard(request: schema.GenerateStoryboardRequest) -> StreamingResponse:
+    """Callback function to render every frame of a shot breakdown in one call.
+
+    Per-frame prompt expansions run concurrently, each unique character image is
+    prefetched once, and frames sharing the same generation parameters are
+    coalesced into batched pipeline calls by the GPU scheduler. Frames are
+    streamed back as NDJSON lines of StoryboardFrameResult as they finish.
+
+    Args:
+        request: A GenerateStoryboardRequest object.
+
+    Returns:
+        A streaming NDJSON response with one StoryboardFrameResult per scene.
+    """
+    LOGGER.info(f"Processing request for generate_storyboard endpoint!")
+    start_time = time.time()
+
+    def render_frame(scene: schema.Scene) -> schema.StoryboardFrameResult:
+        try:
+            scene_request = schema.GenerateSceneRequest(
+                scene=scene,
+                characters=[
+                    request.character_images[exp.character_id]
+                    for exp in scene.character_expressions
+                    if exp.character_id in request.character_images
+                ],
+                use_refiner=request.use_refiner,
+                parameters=request.parameters.copy(deep=True),
+            )
+            frame_start = time.time()
+            prefetched = IMAGE_PREFETCHER.prefetch(scene_request.characters)
+            model_response = GPT_4_O_MODEL.generate_response(
+                prompt_dict=prompt.prepare_prompt_to_generate_frame(scene_request),
+            )
+            modified_prompt, neg_prompt = prompt.enhance_prompt(
+                model_response,
+                scene_request.parameters,
+            )
+            if scene_request.parameters.negative_prompt == "":
+                scene_request.parameters.negative_prompt = neg_prompt
+
+            character_keys, character_images = IMAGE_PREFETCHER.resolve(
+                scene_request.characters, prefetched
+            )
+            priority, timeout = constants.GpuJobPolicies["generate_storyboard"]
+            image = FLUX_SCHEDULER.predict(
+                prompt=modified_prompt,
+                params=scene_request.parameters,
+                use_ip_adapter=bool(scene_request.characters),
+                character_keys=character_keys,
+                character_images=character_images,
+                priority=priority,
+                timeout=timeout,
+            )
+            encoded = image_encoder.encode_async(
+                image, scene_request.parameters.output
+            ).result()
+            return schema.StoryboardFrameResult(
+                scene_id=scene.scene_id,
+                description=model_response,
+                result=schema.ImageGenResult(
+                    prompt=modified_prompt,
+                    data=encoded.data,
+                    time_taken=str(time.time() - frame_start),
+                    media_type=encoded.media_type,
+                    preview=encoded.preview,
+                    residual_cache=flux.residual_cache_stats(image),
+                ),
+            )
+        except (errors.BaseCustomError, Exception) as exc:
+            # A broken frame must not abort the frames still streaming.
+            custom_logger.log_exceptions(LOGGER, exc)
+            return schema.StoryboardFrameResult(scene_id=scene.scene_id, error=str(exc))
+
+    def stream_frames():
+        with ThreadPoolExecutor(
+            max_workers=constants.StoryboardConcurrency
+        ) as executor:
+            # Start every unique character reference before the prompt calls.
+            IMAGE_PREFETCHER.prefetch(set(request.character_images.values()))
+            futures = [
+                executor.submit(render_frame, scene)
+                for scene in request.breakdown.scenes
+            ]
+            for future in as_completed(futures):
+                yield json.dumps(jsonable_encoder(future.result())) + "\n"
+        LOGGER.info(
+            f"Time taken to generate storyboard: {(time.time() - start_time):.2f} seconds"
+        )
+        LOGGER.info(
+            f"Processed request for generate_storyboard endpoint successfully!!"
+        )
+
+    return StreamingResponse(stream_frames(), media_type="application/x-ndjson")
+
+
 @app.post("/regenerate_scene")
-def regenerate_scene(
-    request: schema.RegenerateSceneRequest,
+async def regenerate_scene(
+    request: schema.RegenerateSceneRequest, http_request: Request
 ) -> schema.ImageGenResult:
     """Callback function to regnerate frame based on the provided prompt.
 
@@ -286,6 +721,9 @@ def regenerate_scene(
     try:
         start_time = time.time()
         LOGGER.info(f"Processing request for regenerate_scene endpoint!")
+        prefetched = {}
+        if request.request.reference_image == "":
+            prefetched = IMAGE_PREFETCHER.prefetch(request.characters)
         modified_prompt, neg_prompt = prompt.enhance_prompt(
             request.request.prompt,
             request.request.parameters,
@@ -296,43 +734,60 @@ def regenerate_scene(
         b64_image = ""
         if request.request.reference_image != "":
             config = img2img.prepare_reference_image_config(request, modified_prompt)
-            config["url"] = config["url"].replace(
-                "WEB_UI_IP", constants.WEBUI_INSTANCE_IP
-            )
             LOGGER.info(f"It is a ReferenceImage request.")
             # LOGGER.info(f"Url: {config['url']} and payload:")
             # LOGGER.info(json.dumps(config["payload"], indent=2))
-            response = requests.request(
-                "POST",
-                config["url"],
-                headers={"Content-Type": "application/json"},
-                data=json.dumps(config["payload"]),
-            )
-            b64_image = response.json()["images"][0]
+            response = await WEBUI_CLIENT.apost(config["url"], config["payload"])
+            b64_image = response["images"][0]
         else:
             LOGGER.info(f"It is a Regenerate request.")
-            use_ip_adapter = False
-            character_images = []
-            if request.characters:
-                character_images = [
-                    common.read_image_from_s3(img_path)
-                    for img_path in request.characters
-                ]
-                use_ip_adapter = True
-            image = FLUX_MODEL.predict(
-                prompt=modified_prompt,
-                params=request.request.parameters,
-                use_ip_adapter=use_ip_adapter,
-                character_images=character_images,
+            use_ip_adapter = bool(request.characters)
+            character_keys, character_images = await run_in_threadpool(
+                IMAGE_PREFETCHER.resolve, request.characters, prefetched
+            )
+            priority, timeout = constants.GpuJobPolicies["regenerate_scene"]
+            image = await asyncio.wrap_future(
+                FLUX_SCHEDULER.submit(
+                    prompt=modified_prompt,
+                    params=request.request.parameters,
+                    use_ip_adapter=use_ip_adapter,
+                    character_keys=character_keys,
+                    character_images=character_images,
+                    priority=priority,
+                    timeout=timeout,
+                    on_step=JOB_MANAGER.progress_callback(),
+                )
             )
-            b64_image = common.convert_to_b64(image)
         end_time = time.time() - start_time
         LOGGER.info(f"Time taken to generate a frame: {end_time:.2f} seconds")
         LOGGER.info(f"Processed request for regenerate_scene endpoint successfully!!")
+        output = request.request.parameters.output
+        media_type = accepted_image_type(http_request)
+        if media_type:
+            return await run_in_threadpool(
+                binary_image_response,
+                base64.b64decode(b64_image) if b64_image else image,
+                media_type,
+                output,
+                prompt=modified_prompt,
+                time_taken=end_time,
+            )
+        if b64_image:
+            # WebUI output is already encoded (PNG).
+            return schema.ImageGenResult(
+                prompt=modified_prompt,
+                data=b64_image,
+                time_taken=str(end_time),
+                media_type="image/png",
+            )
+        encoded = await asyncio.wrap_future(image_encoder.encode_async(image, output))
         return schema.ImageGenResult(
             prompt=modified_prompt,
-            data=b64_image,
+            data=encoded.data,
             time_taken=str(end_time),
+            media_type=encoded.media_type,
+            preview=encoded.preview,
+            residual_cache=flux.residual_cache_stats(image),
         )
     except (errors.BaseCustomError, KeyError) as exc:
         custom_logger.log_exceptions(LOGGER, exc)
@@ -342,7 +797,9 @@ def regenerate_scene(
 
 
 @app.post("/inpaint_scene")
-def inpaint_frame(request: schema.InpaintSceneRequest) -> schema.ImageGenResult:
+async def inpaint_frame(
+    request: schema.InpaintSceneRequest, http_request: Request
+) -> schema.ImageGenResult:
     """Callback function to handle all inpaint scene requests.
 
     Responsible for handling requests for inpainting related requests e.g.
@@ -379,26 +836,34 @@ def inpaint_frame(request: schema.InpaintSceneRequest) -> schema.ImageGenResult:
 
         if request.parameters.negative_prompt == "":
             request.parameters.negative_prompt = neg_prompt
-        config = img2img.prepare_inpaint_config(request, request.inpainting_prompt)
-        config["url"] = config["url"].replace("WEB_UI_IP", constants.WEBUI_INSTANCE_IP)
+        # REMOVE_OBJECT inpaints locally with LaMa, keep it off the event loop.
+        config = await run_in_threadpool(
+            img2img.prepare_inpaint_config, request, request.inpainting_prompt
+        )
 
         if request.inpaint_action == request.inpaint_action.REMOVE_OBJECT:
             base64_image = config["data"]
+            media_type, preview = config["media_type"], config["preview"]
         else:
             # LOGGER.info(f"Url: {config['url']} and pa`yload:")
             # LOGGER.info(json.dumps(config["payload"], indent=2))
-            response = requests.request(
-                "POST",
-                config["url"],
-                headers={"Content-Type": "application/json"},
-                data=json.dumps(config["payload"]),
-            )
-            base64_image = response.json()["images"][0]
+            response = await WEBUI_CLIENT.apost(config["url"], config["payload"])
+            base64_image = response["images"][0]
+            media_type, preview = "image/png", ""
         LOGGER.info(f"Processed request for inpaint_scene endpoint successfully!!")
+        if accepted_image_type(http_request):
+            return binary_image_response(
+                base64.b64decode(base64_image),
+                "image/png",
+                prompt=modified_prompt,
+                time_taken=time.time() - start,
+            )
         return schema.ImageGenResult(
             prompt=modified_prompt,
             data=base64_image,
             time_taken=str(time.time() - start),
+            media_type=media_type,
+            preview=preview,
         )
     except (errors.BaseCustomError, KeyError) as exc:
         custom_logger.log_exceptions(LOGGER, exc)
@@ -407,42 +872,99 @@ def inpaint_frame(request: schema.InpaintSceneRequest) -> schema.ImageGenResult:
         )
 
 
-@app.post("/split_script")
-def split_script(request: schema.ExtractScenesRequest) -> schema.ExtractScenesResponse:
+def validate_script_url(filename_url: str) -> str:
+    """Checks the url scheme and file type; returns the S3 key."""
+    parsed_url = urlparse(filename_url)
+    if parsed_url.scheme != "https":
+        LOGGER.info("Unsupported URL scheme. Only 'https' URLs are supported for S3.")
+        raise errors.HTTPException(
+            "Unsupported URL scheme. Only 'https' URLs are supported for S3",
+            "E-3-1-11",
+        )
+
+    file_path = parsed_url.path.lstrip("/")
+    if not file_path.endswith((".fountain", ".pdf", ".txt")):
+        LOGGER.info("Unsupported file format.")
+        raise errors.UnsupportedFileFormat(
+            "Unsupported file format, only .pdf, .txt and .fountain are supported.",
+            "E-3-1-12",
+        )
+    return file_path
+
+
+def fetch_script(request: schema.ExtractScenesRequest) -> tuple[str, str, str]:
+    """Downloads the script to a temp file.
+
+    Returns the temp file path, the S3 key and the sha256 of the content. The
+    caller owns the temp file and must remove it.
+    """
+    file_path = validate_script_url(request.filename_url)
+
+    # Fetch the file content using the URL string
+    file_content = common.fetch_s3_file(request.filename_url)
+    LOGGER.info("File fetched successfully from S3.")
+
+    # The splitter reads this file in place (page workers open the same path).
+    with tempfile.NamedTemporaryFile(delete=False) as temp_file:
+        temp_file.write(file_content)
+    return temp_file.name, file_path, hashlib.sha256(file_content).hexdigest()
+
+
+def iter_script_scenes(temp_file_path: str, file_path: str):
+    if file_path.endswith(".fountain"):
+        LOGGER.info("Parsing .fountain script.")
+        return iter(parse.split_script_fountain(temp_file_path))
+    LOGGER.info("Parsing .pdf or .txt script.")
+    return parse.iter_split_script(temp_file_path, file_path)
+
+
+def split_script_scenes(request: schema.ExtractScenesRequest) -> list[dict]:
+    """Splits the script, reusing cached results for known revisions."""
+    url = request.filename_url
+    validate_script_url(url)
     try:
-        LOGGER.info("Received request to split script.")
+        revision = common.fetch_s3_etag(url)
+    except Exception as exc:
+        # Fall back to the content hash once the file is downloaded.
+        LOGGER.warning(f"Unable to fetch ETag for {url}: {exc}")
+        revision = None
+
+    cache_key = SCRIPT_CACHE.make_key(url, revision) if revision else None
+    scenes = SCRIPT_CACHE.get(cache_key) if cache_key else None
+    if scenes is None:
+        temp_file_path, file_path, content_hash = fetch_script(request)
+        try:
+            cache_key = cache_key or SCRIPT_CACHE.make_key(url, content_hash)
+            scenes = SCRIPT_CACHE.get(cache_key)
+            if scenes is None:
+                scenes = [
+                    {**scene, "text_hash": script_cache.scene_hash(scene)}
+                    for scene in iter_script_scenes(temp_file_path, file_path)
+                ]
+                SCRIPT_CACHE.put(cache_key, scenes)
+        finally:
+            os.remove(temp_file_path)
+    else:
+        LOGGER.info("Serving split script from cache.")
 
-        parsed_url = urlparse(request.filename_url)
-        if parsed_url.scheme != "https":
+    if request.incremental:
+        baseline = SCRIPT_CACHE.baseline(url)
+        if baseline is not None and baseline[0] == cache_key:
+            return [{**scene, "changed": False} for scene in baseline[1]]
+        if baseline is not None:
+            scenes = script_cache.reconcile(baseline[1], scenes)
             LOGGER.info(
-                "Unsupported URL scheme. Only 'https' URLs are supported for S3."
-            )
-            raise errors.HTTPException(
-                "Unsupported URL scheme. Only 'https' URLs are supported for S3",
-                "E-3-1-11",
+                f"{sum(scene['changed'] for scene in scenes)} of {len(scenes)} scenes changed."
             )
+        SCRIPT_CACHE.set_baseline(url, cache_key, scenes)
+    return scenes
 
-        # Fetch the file content using the URL string
-        file_content = common.fetch_s3_file(request.filename_url)
-        LOGGER.info("File fetched successfully from S3.")
-
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            temp_file.write(file_content)
-            temp_file_path = temp_file.name
-
-        file_path = parsed_url.path.lstrip("/")
-        if file_path.endswith(".fountain"):
-            LOGGER.info("Parsing .fountain script.")
-            scenes = parse.split_script_fountain(temp_file_path)
-        elif file_path.endswith((".pdf", ".txt")):
-            LOGGER.info("Parsing .pdf or .txt script.")
-            scenes = parse.split_script(temp_file_path, file_path)
-        else:
-            LOGGER.info("Unsupported file format.")
-            raise errors.UnsupportedFileFormat(
-                "Unsupported file format, only .pdf, .txt and .fountain are supported.",
-                "E-3-1-12",
-            )
+
+@app.post("/split_script")
+def split_script(request: schema.ExtractScenesRequest) -> schema.ExtractScenesResponse:
+    try:
+        LOGGER.info("Received request to split script.")
+        scenes = split_script_scenes(request)
 
         # formatted_scene = parse.format_scenes(scenes)
         LOGGER.info("Script parsed and formatted successfully.")
@@ -454,41 +976,101 @@ def split_script(request: schema.ExtractScenesRequest) -> schema.ExtractScenesRe
             "An error occurred while Scene exctration. Please refer to the logs for more details."
         )
 
+
+@app.post("/split_script_stream")
+def split_script_stream(request: schema.ExtractScenesRequest) -> StreamingResponse:
+    """Streams scenes of a script as NDJSON lines while it is being split.
+
+    Each line is `{"event": "scene", "scene": {...}}`; a final
+    `{"event": "done", "total_scenes": n}` or `{"event": "error", ...}` line
+    ends the stream. The temp file is removed once the stream finishes.
+    """
+    try:
+        LOGGER.info("Received request to stream split script.")
+        temp_file_path, file_path, _ = fetch_script(request)
+    except errors.BaseCustomError as exc:
+        custom_logger.log_exceptions(LOGGER, exc)
+        raise errors.InternalServerError(
+            "An error occurred while Scene exctration. Please refer to the logs for more details."
+        )
+
+    def event(name: str, **payload) -> str:
+        return json.dumps(jsonable_encoder({"event": name, **payload})) + "\n"
+
+    def stream_events():
+        total_scenes = 0
+        try:
+            for scene in iter_script_scenes(temp_file_path, file_path):
+                total_scenes += 1
+                yield event("scene", scene=scene)
+            LOGGER.info("Script parsed and streamed successfully.")
+            yield event("done", total_scenes=total_scenes)
+        except errors.BaseCustomError as exc:
+            custom_logger.log_exceptions(LOGGER, exc)
+            yield event(
+                "error",
+                error="An error occurred while Scene exctration. Please refer to the logs for more details.",
+            )
+        finally:
+            os.remove(temp_file_path)
+
+    return StreamingResponse(stream_events(), media_type="application/x-ndjson")
+
+
 @app.post("/generate_image")
-def generate_image(
-    request: schema.FrameGenerationRequest,
+async def generate_image(
+    request: schema.FrameGenerationRequest, http_request: Request = None
 ) -> schema.FrameGenerationResponse:
     try:
         start_time = time.time()
         LOGGER.info("Processing request for generate_image endpoint!")
+        prefetched = IMAGE_PREFETCHER.prefetch(request.characters)
         modified_prompt, neg_prompt = prompt.enhance_prompt(
             request.prompt, request.parameters
         )
         request.parameters.negative_prompt += neg_prompt
-        use_ip_adapter = False
-        character_images = []
-        
-        if request.characters:
-            LOGGER.info("Loading character images from S3...")
-            character_images = [
-                common.read_image_from_s3(img_path) for img_path in request.characters
-            ]
-            use_ip_adapter = True
+        use_ip_adapter = bool(request.characters)
+        character_keys, character_images = await run_in_threadpool(
+            IMAGE_PREFETCHER.resolve, request.characters, prefetched
+        )
 
         LOGGER.info("Generating image with modified prompt and parameters...")
-        image = FLUX_MODEL.predict(
-            prompt=modified_prompt,
-            params=request.parameters,
-            use_ip_adapter=use_ip_adapter,
-            character_images=character_images,
+        priority, timeout = constants.GpuJobPolicies["generate_image"]
+        image = await asyncio.wrap_future(
+            FLUX_SCHEDULER.submit(
+                prompt=modified_prompt,
+                params=request.parameters,
+                use_ip_adapter=use_ip_adapter,
+                character_keys=character_keys,
+                character_images=character_images,
+                priority=priority,
+                timeout=timeout,
+                on_step=JOB_MANAGER.progress_callback(),
+            )
         )
 
-        b64_results = common.convert_to_b64(image)
         end_time = time.time() - start_time
         LOGGER.info(f"Time taken to generate image: {end_time:.2f} seconds")
         LOGGER.info("Processed request for generate_image endpoint successfully!!")
+        if media_type := accepted_image_type(http_request):
+            return await run_in_threadpool(
+                binary_image_response,
+                image,
+                media_type,
+                request.parameters.output,
+                prompt=modified_prompt,
+            )
+        encoded = await asyncio.wrap_future(
+            image_encoder.encode_async(image, request.parameters.output)
+        )
 
-        return schema.FrameGenerationResponse(prompt=modified_prompt, image=b64_results)
+        return schema.FrameGenerationResponse(
+            prompt=modified_prompt,
+            image=encoded.data,
+            media_type=encoded.media_type,
+            preview=encoded.preview,
+            residual_cache=flux.residual_cache_stats(image),
+        )
     except errors.BaseCustomError as exc:
         custom_logger.log_exceptions(LOGGER, exc)
         raise errors.InternalServerError(
@@ -501,6 +1083,51 @@ def generate_image(
         )
 
 
+def submit_job(
+    kind: str, handler, request, callback_url: str
+) -> schema.JobSubmissionResponse:
+    try:
+        record = JOB_MANAGER.submit(kind, handler, request, callback_url)
+    except errors.InvalidConfigError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    return schema.JobSubmissionResponse(job_id=record.job_id, status=record.status)
+
+
+@app.post("/jobs/generate_scene")
+def submit_generate_scene_job(
+    request: schema.GenerateSceneRequest, callback_url: str = None
+) -> schema.JobSubmissionResponse:
+    """Queues a /generate_scene request and returns its job id immediately."""
+    return submit_job("generate_scene", generate_frame, request, callback_url)
+
+
+@app.post("/jobs/generate_character_profile")
+def submit_generate_character_profile_job(
+    request: schema.CharacterProfileRequest, callback_url: str = None
+) -> schema.JobSubmissionResponse:
+    """Queues a /generate_character_profile request and returns its job id immediately."""
+    return submit_job(
+        "generate_character_profile", generate_character_profile, request, callback_url
+    )
+
+
+@app.post("/jobs/generate_image")
+def submit_generate_image_job(
+    request: schema.FrameGenerationRequest, callback_url: str = None
+) -> schema.JobSubmissionResponse:
+    """Queues a /generate_image request and returns its job id immediately."""
+    return submit_job("generate_image", generate_image, request, callback_url)
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str) -> schema.JobStatusResponse:
+    """Returns status, step progress and (once finished) the result of a job."""
+    record = JOB_MANAGER.get(job_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job id: {job_id}")
+    return record
+
+
 # @app.post("/generate_image")
 # def generate_image(
 #     request: schema.FrameGenerationRequest,
@@ -0,0 +1,218 @@
+r"""Sharded safetensors packaging of model components and a fast loader.
+
+Pickled modules (`torch.load(..., weights_only=False)`) are slow to load and
+always go through a full CPU copy. Package them once:
+
+    python -m models.checkpoint /home/immer-dev/model2 /home/immer-dev/model2/safetensors
+
+Every component gets its own directory with `config.json` (class and config to
+rebuild the module without weights), size-capped `model-XXXXX-of-XXXXX.safetensors`
+shards, `model.safetensors.index.json` and, for optimum-quanto quantized
+modules, `quantization_map.json`.
+
+`--quantize int8|float8` quantizes the weights before packaging, so the server
+loads the quantized artifact as is instead of quantizing at every startup:
+
+    python -m models.checkpoint /home/immer-dev/model2 \
+        /home/immer-dev/model2/quantized/float8 --quantize float8 --device cuda
+"""
+import argparse
+import importlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+from optimum.quanto import freeze
+from optimum.quanto import qfloat8
+from optimum.quanto import qint8
+from optimum.quanto import quantization_map
+from optimum.quanto import quantize
+from optimum.quanto import requantize
+from safetensors import safe_open
+from safetensors.torch import save_file
+
+CONFIG_NAME = "config.json"
+INDEX_NAME = "model.safetensors.index.json"
+QUANTIZATION_MAP_NAME = "quantization_map.json"
+DEFAULT_COMPONENTS = ("transformer", "text_encoder_2")
+DEFAULT_SHARD_BYTES = 2 * 1024**3
+QUANTIZED_WEIGHTS = {"int8": qint8, "float8": qfloat8}
+
+
+def _class_path(module: torch.nn.Module) -> str:
+    cls = type(module)
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def _import_class(path: str) -> type:
+    module_name, _, name = path.rpartition(".")
+    return getattr(importlib.import_module(module_name), name)
+
+
+def _module_spec(module: torch.nn.Module) -> dict:
+    config = module.config
+    # transformers configs are PretrainedConfig objects, diffusers ones FrozenDicts.
+    if hasattr(config, "to_dict"):
+        library, config = "transformers", config.to_dict()
+    else:
+        library, config = "diffusers", dict(config)
+    return {"class": _class_path(module), "library": library, "config": config}
+
+
+def _shards(tensors: dict[str, torch.Tensor], max_shard_bytes: int) -> list[dict]:
+    shards, current, size = [], {}, 0
+    for name, tensor in tensors.items():
+        nbytes = tensor.numel() * tensor.element_size()
+        if current and size + nbytes > max_shard_bytes:
+            shards.append(current)
+            current, size = {}, 0
+        current[name] = tensor
+        size += nbytes
+    if current:
+        shards.append(current)
+    return shards
+
+
+def package_module(
+    module: torch.nn.Module, directory: str, max_shard_bytes: int = DEFAULT_SHARD_BYTES
+):
+    """Writes `module` as sharded safetensors that `load_module` can rebuild."""
+    os.makedirs(directory, exist_ok=True)
+    tensors, aliases, seen = {}, {}, {}
+    for name, tensor in module.state_dict().items():
+        # safetensors refuses shared storage, so tied weights are stored once.
+        key = (tensor.data_ptr(), tuple(tensor.shape), tensor.dtype)
+        if tensor.numel() and key in seen:
+            aliases[name] = seen[key]
+            continue
+        seen[key] = name
+        tensors[name] = tensor.detach().contiguous()
+
+    shards = _shards(tensors, max_shard_bytes)
+    weight_map = {}
+    for idx, shard in enumerate(shards, start=1):
+        filename = f"model-{idx:05d}-of-{len(shards):05d}.safetensors"
+        shard = {name: tensor.cpu() for name, tensor in shard.items()}
+        save_file(shard, os.path.join(directory, filename), metadata={"format": "pt"})
+        weight_map.update({name: filename for name in shard})
+
+    index = {
+        "metadata": {
+            "total_size": sum(t.numel() * t.element_size() for t in tensors.values())
+        },
+        "weight_map": weight_map,
+        "aliases": aliases,
+    }
+    with open(os.path.join(directory, INDEX_NAME), "w") as f:
+        json.dump(index, f, indent=2)
+    with open(os.path.join(directory, CONFIG_NAME), "w") as f:
+        json.dump(_module_spec(module), f, indent=2)
+    qmap = quantization_map(module)
+    if qmap:
+        with open(os.path.join(directory, QUANTIZATION_MAP_NAME), "w") as f:
+            json.dump(qmap, f, indent=2)
+
+
+def quantize_module(module: torch.nn.Module, weights: str) -> torch.nn.Module:
+    """Quantizes the weights of every linear layer in place to int8 or float8."""
+    quantize(module, weights=QUANTIZED_WEIGHTS[weights])
+    freeze(module)
+    return module
+
+
+def _load_shard(path: str, device: str) -> dict[str, torch.Tensor]:
+    # The shard is memory-mapped and each tensor is copied straight to `device`.
+    with safe_open(path, framework="pt", device=device) as f:
+        return {name: f.get_tensor(name) for name in f.keys()}
+
+
+def _empty_module(spec: dict) -> torch.nn.Module:
+    cls = _import_class(spec["class"])
+    # `torch.device` is thread-local, unlike accelerate's `init_empty_weights`
+    # which patches `nn.Module` globally and would race with parallel loads.
+    with torch.device("meta"):
+        if spec["library"] == "transformers":
+            return cls(cls.config_class.from_dict(spec["config"]))
+        return cls.from_config(spec["config"])
+
+
+def load_module(
+    directory: str, device: str = "cuda", workers: int = 4
+) -> torch.nn.Module:
+    """Rebuilds a module packaged by `package_module`, loading shards in parallel.
+
+    The module skeleton is created on the meta device and the loaded tensors are
+    assigned to it as-is, so weights are never allocated twice.
+    """
+    with open(os.path.join(directory, CONFIG_NAME)) as f:
+        spec = json.load(f)
+    with open(os.path.join(directory, INDEX_NAME)) as f:
+        index = json.load(f)
+    qmap_path = os.path.join(directory, QUANTIZATION_MAP_NAME)
+    quantized = os.path.exists(qmap_path)
+
+    shard_names = sorted(set(index["weight_map"].values()))
+    # quanto allocates the quantized module on `device` itself and copies into
+    # it, so its shards stay on the (memory-mapped) CPU side.
+    shard_device = "cpu" if quantized else device
+    state_dict = {}
+    workers = max(1, min(workers, len(shard_names)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for tensors in pool.map(
+            lambda name: _load_shard(os.path.join(directory, name), shard_device),
+            shard_names,
+        ):
+            state_dict.update(tensors)
+    for alias, source in index.get("aliases", {}).items():
+        state_dict[alias] = state_dict[source]
+
+    module = _empty_module(spec)
+    if quantized:
+        with open(qmap_path) as f:
+            requantize(module, state_dict, json.load(f), device=torch.device(device))
+    else:
+        module.load_state_dict(state_dict, strict=True, assign=True)
+    if hasattr(module, "tie_weights"):
+        module.tie_weights()
+
+    tensors = list(module.named_parameters()) + list(module.named_buffers())
+    leftover = [name for name, tensor in tensors if tensor.is_meta]
+    if leftover:
+        raise ValueError(f"{directory} has no weights for {', '.join(leftover[:5])}.")
+    return module.eval()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("src", help="Directory with the pickled <component>.pt files.")
+    parser.add_argument("dst", help="Directory to write one package per component to.")
+    parser.add_argument("--components", nargs="+", default=list(DEFAULT_COMPONENTS))
+    parser.add_argument(
+        "--max-shard-gb", type=float, default=DEFAULT_SHARD_BYTES / 1024**3
+    )
+    parser.add_argument("--quantize", choices=sorted(QUANTIZED_WEIGHTS))
+    parser.add_argument(
+        "--device", default="cpu", help="Device to quantize on; cuda is much faster."
+    )
+    args = parser.parse_args()
+
+    for component in args.components:
+        start_time = time.time()
+        module = torch.load(
+            os.path.join(args.src, f"{component}.pt"),
+            weights_only=False,
+            map_location=torch.device(args.device),
+        )
+        if args.quantize:
+            quantize_module(module, args.quantize)
+        package_module(
+            module,
+            os.path.join(args.dst, component),
+            max_shard_bytes=int(args.max_shard_gb * 1024**3),
+        )
+        print(f"Packaged {component} in {time.time() - start_time:.1f}s")
+        del module
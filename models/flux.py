@@ -1,43 +1,183 @@
 """Model wrapper to interact with Flux based models."""
+import hashlib
+import logging
 import os
-import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from typing import Optional
 
-import torch
+import numpy as np
+import torch._dynamo
+import torch._inductor.config
 from diffusers.pipelines.flux.pipeline_flux import FluxPipeline
 
+from models import checkpoint
+from models import flux_cache
+from models import resolution
 from modules import errors
 from modules import schema
+from modules import tensor_cache
+from utils import common
 from utils import constants
 
+LOGGER = logging.getLogger(__name__)
+
 torch.backends.cuda.matmul.allow_tf32 = True
-LOCK = threading.Lock()
 
 
 class FluxModel:
-    def __init__(self):
+    def __init__(
+        self,
+        keep_ip_adapter_resident: bool = True,
+        weights: str = "bf16",
+        resolution_buckets: bool = False,
+        compile: bool = False,
+        max_batch_size: int = 1,
+    ):
+        # When resident, the IP-Adapter stays loaded for requests without
+        # characters and is switched off per call (scale 0 + null image embeds)
+        # instead of being unloaded and reloaded from disk.
+        self.keep_ip_adapter_resident = keep_ip_adapter_resident
         self.is_adapter_loaded = False
+        self.null_image_embeds = None
+        self.image_embeds_cache = tensor_cache.TensorCache(
+            max_bytes=constants.ImageEmbedsCacheMaxBytes,
+            cache_dir=constants.ImageEmbedsCacheDir,
+        )
+        self.prompt_embeds_cache = tensor_cache.TensorCache(
+            max_bytes=constants.PromptEmbedsCacheMaxBytes
+        )
         self.dtype = torch.bfloat16
+        # `int8`/`float8` load the transformer and T5 from the quantized
+        # packages; the rest of the pipeline stays in bfloat16.
+        self.weights = weights
+        # Generate at the nearest `resolution.BUCKETS` shape and fit the image
+        # back to the requested size; `compile` compiles the transformer blocks
+        # during `warm_up`, once per bucket and batch size up to `max_batch_size`.
+        self.resolution_buckets = resolution_buckets
+        self.compile = compile
+        self.max_batch_size = max_batch_size
+        self.load_timings: dict[str, float] = {}
         try:
-            transformer = torch.load(os.path.join(constants.FluxModelPath, "transformer.pt"), weights_only=False, map_location=torch.device("cuda"))
-            transformer.eval()
-            text_encoder_2 = torch.load(os.path.join(constants.FluxModelPath, "text_encoder_2.pt"), weights_only=False, map_location=torch.device("cuda"))
-
-            self.pipe = FluxPipeline.from_pretrained(
-                os.path.join(constants.ModelBaseDir, "hf_repos/flux-dev"),
-                text_encoder_2=None,
-                transformer=None,
-                cache_dir=constants.ModelCacheDir,
-                torch_dtype=self.dtype,
-            ).to('cuda')
-            self.pipe.text_encoder_2 = text_encoder_2
-            self.pipe.transformer = transformer
+            start_time = time.perf_counter()
+            # The pipeline, the transformer and T5 load concurrently; packaged
+            # components are memory-mapped straight onto the GPU.
+            with ThreadPoolExecutor(3, thread_name_prefix="flux-load") as pool:
+                pipe = pool.submit(self._timed, "pipeline", self._load_pipeline)
+                transformer = pool.submit(
+                    self._timed, "transformer", self.load_component, "transformer"
+                )
+                text_encoder_2 = pool.submit(
+                    self._timed, "text_encoder_2", self.load_component, "text_encoder_2"
+                )
+                self.pipe = pipe.result()
+                self.pipe.transformer = transformer.result()
+                self.pipe.text_encoder_2 = text_encoder_2.result()
+            self.load_timings["total"] = time.perf_counter() - start_time
+            LOGGER.info(f"Flux model loaded in {self.load_timings['total']:.2f}s")
+            self.text_encoder_id = self.checkpoint_fingerprint(
+                self.component_checkpoint("text_encoder_2")
+            )
         except Exception as exc:
             raise errors.ModelInitializationFailedError(
                 f"Failed to initialize Flux Model. Check traceback for more info.",
                 "E-4-3-01",
             ) from exc
 
+    def _timed(self, name: str, load: Callable, *args):
+        start_time = time.perf_counter()
+        result = load(*args)
+        self.load_timings[name] = time.perf_counter() - start_time
+        LOGGER.info(f"Loaded Flux {name} in {self.load_timings[name]:.2f}s")
+        return result
+
+    def _load_pipeline(self) -> FluxPipeline:
+        return FluxPipeline.from_pretrained(
+            os.path.join(constants.ModelBaseDir, "hf_repos/flux-dev"),
+            text_encoder_2=None,
+            transformer=None,
+            cache_dir=constants.ModelCacheDir,
+            torch_dtype=self.dtype,
+            # `low_cpu_mem_usage` patches `nn.Module` globally while loading,
+            # which would race with the components loading in parallel.
+            low_cpu_mem_usage=False,
+        ).to("cuda")
+
+    def component_checkpoint(self, name: str) -> str:
+        """Safetensors index of a packaged component, else its legacy pickle."""
+        if self.weights in checkpoint.QUANTIZED_WEIGHTS:
+            directory = os.path.join(constants.FluxQuantizedDir, self.weights, name)
+            if not os.path.exists(os.path.join(directory, checkpoint.INDEX_NAME)):
+                raise FileNotFoundError(
+                    f"No {self.weights} package of Flux {name} in {directory}. Create "
+                    f"it with `python -m models.checkpoint --quantize {self.weights}`."
+                )
+            return os.path.join(directory, checkpoint.INDEX_NAME)
+        index = os.path.join(constants.FluxSafetensorsDir, name, checkpoint.INDEX_NAME)
+        if os.path.exists(index):
+            return index
+        return os.path.join(constants.FluxModelPath, f"{name}.pt")
+
+    def load_component(self, name: str) -> torch.nn.Module:
+        path = self.component_checkpoint(name)
+        if os.path.basename(path) == checkpoint.INDEX_NAME:
+            return checkpoint.load_module(
+                os.path.dirname(path),
+                device="cuda",
+                workers=constants.FluxShardLoadWorkers,
+            )
+        LOGGER.warning(
+            f"No safetensors package for Flux {name}, loading {path}. "
+            "Package it with `python -m models.checkpoint` for faster startup."
+        )
+        module = torch.load(path, weights_only=False, map_location=torch.device("cuda"))
+        return module.eval()
+
+    def checkpoint_fingerprint(self, checkpoint_path: str) -> str:
+        """Cheap identity of the text encoders: checkpoint path, size and mtime."""
+        stat = os.stat(checkpoint_path)
+        identity = "|".join(
+            [
+                self.pipe.text_encoder.config._name_or_path,
+                checkpoint_path,
+                str(stat.st_size),
+                str(stat.st_mtime_ns),
+            ]
+        )
+        return hashlib.sha256(identity.encode("utf-8")).hexdigest()[:16]
+
+    def prompt_embeds(self, prompts: list[str]) -> tuple[torch.Tensor, torch.Tensor]:
+        """Returns batched (prompt_embeds, pooled_prompt_embeds) for `prompts`.
+
+        Embeds are cached per exact prompt text, so reseeds and regenerations of
+        the same prompt skip the CLIP and T5 text encoders.
+        """
+        prompt_embeds, pooled_prompt_embeds = [], []
+        for prompt in prompts:
+            key = f"{self.text_encoder_id}|{prompt}"
+            cached = self.prompt_embeds_cache.get(key)
+            if cached is None:
+                embeds, pooled, _ = self.pipe.encode_prompt(
+                    prompt=prompt,
+                    prompt_2=None,
+                    device="cuda",
+                    num_images_per_prompt=1,
+                )
+                cached = {"prompt_embeds": embeds, "pooled_prompt_embeds": pooled}
+                self.prompt_embeds_cache.put(key, cached)
+            prompt_embeds.append(cached["prompt_embeds"])
+            pooled_prompt_embeds.append(cached["pooled_prompt_embeds"])
+        return torch.cat(prompt_embeds), torch.cat(pooled_prompt_embeds)
+
+    def cache_stats(self) -> dict:
+        return {
+            "prompt_embeds": self.prompt_embeds_cache.stats(),
+            "image_embeds": self.image_embeds_cache.stats(),
+        }
+
     def load_ip_adapter(self):
+        start_time = time.perf_counter()
         self.pipe.load_ip_adapter(
             os.path.join(constants.ModelBaseDir, "hf_repos/flux-ip-adapter"),
             cache_dir=constants.ModelCacheDir,
@@ -46,55 +186,237 @@ class FluxModel:
         )
         self.pipe.set_ip_adapter_scale(0.5)
         self.is_adapter_loaded = True
+        if self.keep_ip_adapter_resident:
+            with torch.no_grad():
+                self.null_image_embeds = self.pipe.prepare_ip_adapter_image_embeds(
+                    ip_adapter_image=[np.zeros((224, 224, 3), dtype=np.uint8)],
+                    ip_adapter_image_embeds=None,
+                    device="cuda",
+                    num_images_per_prompt=1,
+                )
+        self.load_timings["ip_adapter"] = time.perf_counter() - start_time
+        LOGGER.info(f"Loaded Flux IP-Adapter in {self.load_timings['ip_adapter']:.2f}s")
+
+    def compile_transformer(self):
+        """Compiles every transformer block in place (regional compilation).
+
+        The identical blocks share one graph per shape, so compiling is quick and
+        the module layout is kept for the IP-Adapter and the residual cache.
+        Inductor artifacts are cached on disk and reused across restarts.
+        """
+        os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", constants.TorchCompileCacheDir)
+        torch._inductor.config.fx_graph_cache = True
+        # One graph per bucket and batch size, plus sizes above the buckets.
+        torch._dynamo.config.cache_size_limit = max(
+            torch._dynamo.config.cache_size_limit,
+            2 * len(resolution.BUCKETS) * self.max_batch_size,
+        )
+        transformer = self.pipe.transformer
+        for block in [
+            *transformer.transformer_blocks,
+            *transformer.single_transformer_blocks,
+        ]:
+            block.compile(dynamic=False)
+
+    def warm_up(self):
+        """Runs a short generation per resolution bucket and batch size.
+
+        Compiles (if enabled), autotunes kernels and grows the allocator pools
+        for every shape the scheduler can run: each bucket at batch sizes
+        1..`max_batch_size`, as the blocks are compiled with static shapes. A
+        resident IP-Adapter is loaded first so its attention processors are
+        part of the warmed-up graphs.
+        """
+        if self.keep_ip_adapter_resident and not self.is_adapter_loaded:
+            self.load_ip_adapter()
+        if self.compile:
+            self.compile_transformer()
+        sizes = resolution.BUCKETS if self.resolution_buckets else [(1024, 1024)]
+        for width, height in sizes:
+            start_time = time.perf_counter()
+            params = schema.ImageGenParameters(
+                width=width, height=height, num_inference_steps=2
+            )
+            for batch_size in range(1, self.max_batch_size + 1):
+                self.predict_batch(
+                    ["warm-up"] * batch_size, params, seeds=[1] * batch_size
+                )
+            self.load_timings[f"warm_up_{width}x{height}"] = (
+                time.perf_counter() - start_time
+            )
 
     def unload_ip_adapter(self):
         self.pipe.unload_ip_adapter()
         self.is_adapter_loaded = False
+        self.null_image_embeds = None
 
-    def predict(
+    def image_encoder_id(self) -> str:
+        encoder = self.pipe.image_encoder
+        return f"{encoder.config._name_or_path}:{encoder.dtype}"
+
+    def character_image_embeds(
+        self, character_keys: list[str], character_images: list = None
+    ) -> list[torch.Tensor]:
+        """Returns IP-Adapter image embeds for S3 hosted character references.
+
+        `character_keys` are ETag-qualified S3 keys (`common.s3_etag_key`),
+        resolved by the image prefetcher so the GPU worker makes no S3 round
+        trip. Embeds are cached by key + image encoder, so repeated characters
+        skip the CLIP forward pass. On a miss the matching `character_images`
+        entry is encoded; it is only fetched here if that entry is missing.
+        """
+        encoder_id = self.image_encoder_id()
+        image_embeds = []
+        for idx, character_key in enumerate(character_keys):
+            image_url, etag = common.split_s3_etag_key(character_key)
+            key = f"{character_key}|{encoder_id}"
+            # Unqualified keys can't tell revisions apart and are never cached.
+            cached = self.image_embeds_cache.get(key) if etag else None
+            if cached is None:
+                image = None
+                if character_images and idx < len(character_images):
+                    image = character_images[idx]
+                if image is None:
+                    image = common.read_image_from_s3(image_url)
+                # Same layout as `FluxPipeline.prepare_ip_adapter_image_embeds`.
+                embeds = self.pipe.encode_image(image, "cuda", 1)[None, :]
+                cached = {"image_embeds": embeds}
+                if etag:
+                    self.image_embeds_cache.put(key, cached)
+            image_embeds.append(cached["image_embeds"])
+        return image_embeds
+
+    def ip_adapter_kwargs(
         self,
-        prompt: str,
+        use_ip_adapter: bool,
+        character_images: list,
+        scale: float,
+        character_keys: list[str] = None,
+    ) -> dict:
+        """Prepares the adapter for the next call and returns the pipeline kwargs."""
+        if use_ip_adapter:
+            if not self.is_adapter_loaded:
+                self.load_ip_adapter()
+            self.pipe.set_ip_adapter_scale(scale)
+            if character_keys:
+                return {
+                    "ip_adapter_image_embeds": self.character_image_embeds(
+                        character_keys, character_images
+                    )
+                }
+            return {"ip_adapter_image": character_images}
+
+        if not self.is_adapter_loaded:
+            return {}
+        if self.keep_ip_adapter_resident:
+            # The adapter attention processors always expect image embeds, so
+            # feed cached embeds of a blank image and zero out their scale.
+            self.pipe.set_ip_adapter_scale(0.0)
+            return {"ip_adapter_image_embeds": self.null_image_embeds}
+        self.unload_ip_adapter()
+        return {}
+
+    def predict_batch(
+        self,
+        prompts: list[str],
         params: schema.ImageGenParameters,
         use_ip_adapter: bool = False,
         character_images: list[str] = [],
-    ) -> schema.ImageGenResult:
+        seeds: list[int] = None,
+        negative_prompts: list[str] = None,
+        character_keys: list[str] = None,
+        on_step: Callable[[int, int], None] = None,
+        sizes: list[tuple[int, int]] = None,
+    ) -> list:
+        """Generates one image per prompt in a single pipeline call.
+
+        All prompts share the size, steps, guidance and adapter inputs in
+        `params`/`character_images`; `seeds` and `negative_prompts` are per prompt.
+        When `character_keys` (ETag-qualified S3 keys of the references) are
+        given, cached image embeds are used and `character_images` may be left
+        empty. With resolution buckets, `sizes` are the per prompt (width,
+        height) to fit the images to.
+        """
         try:
-            LOCK.acquire()
-            if params.seed:
-                g = torch.Generator(device="cuda")
-                g.manual_seed(params.seed)
+            width, height = params.width, params.height
+            if self.resolution_buckets:
+                width, height = resolution.generation_size(width, height)
+            seeds = seeds or [params.seed] * len(prompts)
+            generators = None
+            if any(seeds):
+                generators = []
+                for seed in seeds:
+                    g = torch.Generator(device="cuda")
+                    if seed:
+                        g.manual_seed(seed)
+                    else:
+                        g.seed()
+                    generators.append(g)
             with torch.no_grad():
+                adapter_kwargs = self.ip_adapter_kwargs(
+                    use_ip_adapter,
+                    character_images,
+                    params.ip_adapter_scale,
+                    character_keys=character_keys,
+                )
                 if use_ip_adapter:
-                    if not self.is_adapter_loaded:
-                        self.load_ip_adapter()
-                    image = self.pipe(
-                        prompt=prompt,
-                        negative_prompt=params.negative_prompt,
-                        width=params.width,
-                        height=params.height,
-                        num_inference_steps=params.num_inference_steps,
-                        generator=g if params.seed else None,
-                        guidance_scale=params.guidance_scale,
-                        ip_adapter_image=character_images,
-                    ).images[0]
-                else:
-                    if self.is_adapter_loaded:
-                        self.unload_ip_adapter()
-                    image = self.pipe(
-                        prompt=prompt,
-                        width=params.width,
-                        height=params.height,
+                    adapter_kwargs["negative_prompt"] = negative_prompts or [
+                        params.negative_prompt
+                    ] * len(prompts)
+                prompt_embeds, pooled_prompt_embeds = self.prompt_embeds(prompts)
+                if on_step is not None:
+
+                    def step_callback(pipe, step_index, timestep, callback_kwargs):
+                        on_step(step_index + 1, params.num_inference_steps)
+                        return callback_kwargs
+
+                    adapter_kwargs["callback_on_step_end"] = step_callback
+                with flux_cache.first_block_cache(
+                    self.pipe.transformer, params.residual_cache_threshold
+                ) as residual_cache:
+                    images = self.pipe(
+                        prompt_embeds=prompt_embeds,
+                        pooled_prompt_embeds=pooled_prompt_embeds,
+                        width=width,
+                        height=height,
                         num_inference_steps=params.num_inference_steps,
-                        generator=g if params.seed else None,
+                        generator=generators,
                         guidance_scale=params.guidance_scale,
-                    ).images[0]
-
-            LOCK.release()
-            return image
-        except Exception as e:
+                        **adapter_kwargs,
+                    ).images
+            if self.resolution_buckets:
+                sizes = sizes or [(params.width, params.height)] * len(images)
+                images = [
+                    resolution.fit(image, *size) for image, size in zip(images, sizes)
+                ]
+            if params.residual_cache_threshold > 0:
+                # Travels with the image through the scheduler to the handler.
+                for image in images:
+                    image.info["residual_cache"] = residual_cache.stats()
+            return images
+        except Exception as exc:
             raise errors.ModelResponseError(
-                f"Failed to generate response for given prompt: {prompt}",
+                f"Failed to generate response for given prompts: {prompts}",
                 "E-4-3-02",
-            )
+            ) from exc
+
+    def predict(
+        self,
+        prompt: str,
+        params: schema.ImageGenParameters,
+        use_ip_adapter: bool = False,
+        character_images: list[str] = [],
+        character_keys: list[str] = None,
+    ) -> schema.ImageGenResult:
+        return self.predict_batch(
+            prompts=[prompt],
+            params=params,
+            use_ip_adapter=use_ip_adapter,
+            character_images=character_images,
+            character_keys=character_keys,
+        )[0]
 
 
+def residual_cache_stats(image) -> Optional[dict]:
+    """Skipped-step statistics of an image generated with the residual cache."""
+    return getattr(image, "info", {}).get("residual_cache")
@@ -0,0 +1,121 @@
+"""First-block residual cache for the Flux transformer.
+
+Between neighbouring denoising steps the output of the transformer changes
+little. Every step still runs the first double-stream block; when its residual
+moved less than `threshold` (relative L1) since the last fully computed step,
+the remaining blocks are skipped and their cached residual is reused.
+"""
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator
+
+import torch
+
+
+@dataclass
+class ResidualCacheState:
+    threshold: float
+    steps: int = 0
+    skipped_steps: int = 0
+    first_residual: torch.Tensor = None
+    hidden_residual: torch.Tensor = None
+    encoder_residual: torch.Tensor = None
+
+    def stats(self) -> dict:
+        return {
+            "threshold": self.threshold,
+            "steps": self.steps,
+            "skipped_steps": self.skipped_steps,
+        }
+
+
+def relative_change(current: torch.Tensor, previous: torch.Tensor) -> float:
+    return ((current - previous).abs().mean() / previous.abs().mean()).item()
+
+
+class CachedTransformerBlocks(torch.nn.Module):
+    """Runs all double and single stream blocks as one unit, with caching.
+
+    Takes the place of `transformer_blocks` (with `single_transformer_blocks`
+    emptied), so it has the same call signature and return value as a
+    `FluxTransformerBlock`.
+    """
+
+    def __init__(
+        self,
+        transformer_blocks: torch.nn.ModuleList,
+        single_transformer_blocks: torch.nn.ModuleList,
+        state: ResidualCacheState,
+    ):
+        super().__init__()
+        self.transformer_blocks = transformer_blocks
+        self.single_transformer_blocks = single_transformer_blocks
+        self.state = state
+
+    def forward(self, hidden_states, encoder_hidden_states, **kwargs):
+        state = self.state
+        state.steps += 1
+        original_hidden_states = hidden_states
+        encoder_hidden_states, hidden_states = self.transformer_blocks[0](
+            hidden_states=hidden_states,
+            encoder_hidden_states=encoder_hidden_states,
+            **kwargs,
+        )
+        first_residual = hidden_states - original_hidden_states
+        if (
+            state.first_residual is not None
+            and relative_change(first_residual, state.first_residual) < state.threshold
+        ):
+            state.skipped_steps += 1
+            return (
+                encoder_hidden_states + state.encoder_residual,
+                hidden_states + state.hidden_residual,
+            )
+
+        # Only fully computed steps become the reference, so skips can't drift.
+        state.first_residual = first_residual
+        hidden_start, encoder_start = hidden_states, encoder_hidden_states
+        for block in self.transformer_blocks[1:]:
+            encoder_hidden_states, hidden_states = block(
+                hidden_states=hidden_states,
+                encoder_hidden_states=encoder_hidden_states,
+                **kwargs,
+            )
+        text_length = encoder_hidden_states.shape[1]
+        hidden_states = torch.cat([encoder_hidden_states, hidden_states], dim=1)
+        for block in self.single_transformer_blocks:
+            hidden_states = block(hidden_states=hidden_states, **kwargs)
+        encoder_hidden_states = hidden_states[:, :text_length]
+        hidden_states = hidden_states[:, text_length:]
+
+        state.hidden_residual = hidden_states - hidden_start
+        state.encoder_residual = encoder_hidden_states - encoder_start
+        return encoder_hidden_states, hidden_states
+
+
+@contextmanager
+def first_block_cache(
+    transformer: torch.nn.Module, threshold: float
+) -> Iterator[ResidualCacheState]:
+    """Enables the cache on `transformer` for one pipeline call.
+
+    The block lists are only swapped for the duration of the call so weights,
+    attention processors and the IP-Adapter see the usual module layout.
+    A `threshold` of 0 leaves the transformer untouched.
+    """
+    state = ResidualCacheState(threshold)
+    if threshold <= 0:
+        yield state
+        return
+
+    transformer_blocks = transformer.transformer_blocks
+    single_transformer_blocks = transformer.single_transformer_blocks
+    transformer.transformer_blocks = torch.nn.ModuleList(
+        [CachedTransformerBlocks(transformer_blocks, single_transformer_blocks, state)]
+    )
+    transformer.single_transformer_blocks = torch.nn.ModuleList()
+    try:
+        yield state
+    finally:
+        transformer.transformer_blocks = transformer_blocks
+        transformer.single_transformer_blocks = single_transformer_blocks
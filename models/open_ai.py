@@ -1,65 +1,299 @@
-"""Model wrapper to interact with OpenAI models."""
-import abc
-from typing import Mapping
-
-import openai
-
-from modules import errors
-
-
-class OpenAIModel(abc.ABC):
-    API_KEY = ""
-    # TODO(Maani): Add support for more generation options like:
-    # 1. temperature
-    # 2. top-p
-    # 3. stop sequences
-    # 4. num_outputs
-    # 5. response_format
-    # 6. seed
-
-    def __init__(self, model_name: str, API_KEY: str):
-        try:
-            self.client = openai.OpenAI(
-                # This is the default and can be omitted
-                api_key=API_KEY,
-            )
-            self.model_name = model_name
-        except Exception as exc:
-            raise errors.ModelInitializationFailedError(
-                f"Failed to initialize OpenAI model client. See traceback for more details.",
-                "E-3-1-02",
-            ) from exc
-
-    def prepare_input(self, prompt_dict: Mapping[str, str]) -> str:
-        conversation = []
-        try:
-            for role, content in prompt_dict.items():
-                conversation.append(
-                    {
-                        "role": role,
-                        "content": content,
-                    }
-                )
-            return conversation
-        except Exception as exc:
-            raise errors.IncompletePromptDictionaryError(
-                f"Incomplete Prompt Dictionary Passed. Expected to have atleast a role and it's content.\nPassed dict: {prompt_dict}",
-                "E-3-1-01",
-            ) from exc
-
-    def generate_response(
-        self, prompt_dict: Mapping[str, str], max_output_tokens: int = None
-    ) -> str:
-        conversation = self.prepare_input(prompt_dict)
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model_name,
-                messages=conversation,
-                max_tokens=max_output_tokens if max_output_tokens else None,
-            )
-            return response.choices[0].message.content
-        except Exception as exc:
-            raise errors.ModelResponseError(
-                f"Exception in generating model response.\nModel name: {self.model_name}\nInput prompt: {str(conversation)}",
-                "E-3-2-20",
-            ) from exc
+"""Model wrapper to interact with OpenAI models."""
+import abc
+import asyncio
+import hashlib
+import json
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator
+from typing import Mapping
+
+import httpx
+import openai
+
+from modules import errors
+
+# Errors worth retrying: rate limits, 5xx responses, timeouts and dropped connections.
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+)
+
+# Marks the end of an upstream stream in the chunk queue of `stream_response`.
+_STREAM_END = object()
+
+
+class ResponseCache:
+    """Thread safe LRU cache of model responses with a per-entry TTL."""
+
+    def __init__(self, ttl: float, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model_name: str, conversation: list, params: dict) -> str:
+        payload = json.dumps([model_name, conversation, params], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class OpenAIModel(abc.ABC):
+    API_KEY = ""
+    # TODO(Maani): Add support for more generation options like:
+    # 1. temperature
+    # 2. top-p
+    # 3. stop sequences
+    # 4. num_outputs
+    # 5. response_format
+    # 6. seed
+
+    def __init__(
+        self,
+        model_name: str,
+        API_KEY: str,
+        base_url: str = None,
+        max_concurrency: int = 16,
+        timeout: float = 120.0,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        cache_ttl: float = 0.0,
+    ):
+        try:
+            limits = httpx.Limits(
+                max_connections=max_concurrency,
+                max_keepalive_connections=max_concurrency,
+            )
+            # Retries are handled here (with jitter), not by the SDK.
+            self.client = openai.OpenAI(
+                # This is the default and can be omitted
+                api_key=API_KEY,
+                base_url=base_url,
+                max_retries=0,
+                timeout=timeout,
+                http_client=httpx.Client(limits=limits, timeout=timeout),
+            )
+            self.async_client = openai.AsyncOpenAI(
+                api_key=API_KEY,
+                base_url=base_url,
+                max_retries=0,
+                timeout=timeout,
+                http_client=httpx.AsyncClient(limits=limits, timeout=timeout),
+            )
+            self.model_name = model_name
+        except Exception as exc:
+            raise errors.ModelInitializationFailedError(
+                f"Failed to initialize OpenAI model client. See traceback for more details.",
+                "E-3-1-02",
+            ) from exc
+
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency = max_concurrency
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._async_semaphore = None
+        self.cache = ResponseCache(cache_ttl) if cache_ttl > 0 else None
+
+    def prepare_input(self, prompt_dict: Mapping[str, str]) -> str:
+        conversation = []
+        try:
+            for role, content in prompt_dict.items():
+                conversation.append(
+                    {
+                        "role": role,
+                        "content": content,
+                    }
+                )
+            return conversation
+        except Exception as exc:
+            raise errors.IncompletePromptDictionaryError(
+                f"Incomplete Prompt Dictionary Passed. Expected to have atleast a role and it's content.\nPassed dict: {prompt_dict}",
+                "E-3-1-01",
+            ) from exc
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter."""
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2**attempt)
+        )
+
+    def _request(
+        self,
+        conversation: list,
+        max_output_tokens: int,
+        timeout: float,
+        response_format: dict = None,
+    ):
+        request = dict(
+            model=self.model_name,
+            messages=conversation,
+            max_tokens=max_output_tokens if max_output_tokens else None,
+            timeout=timeout or self.timeout,
+        )
+        if response_format:
+            request["response_format"] = response_format
+        return request
+
+    def _cache_key(
+        self, conversation: list, max_output_tokens: int, response_format: dict = None
+    ):
+        if self.cache is None:
+            return None
+        return self.cache.make_key(
+            self.model_name,
+            conversation,
+            {"max_tokens": max_output_tokens, "response_format": response_format},
+        )
+
+    def _response_error(self, conversation: list) -> errors.ModelResponseError:
+        return errors.ModelResponseError(
+            f"Exception in generating model response.\nModel name: {self.model_name}\nInput prompt: {str(conversation)}",
+            "E-3-2-20",
+        )
+
+    def generate_response(
+        self,
+        prompt_dict: Mapping[str, str],
+        max_output_tokens: int = None,
+        timeout: float = None,
+        response_format: dict = None,
+    ) -> str:
+        conversation = self.prepare_input(prompt_dict)
+        cache_key = self._cache_key(conversation, max_output_tokens, response_format)
+        if cache_key and (cached := self.cache.get(cache_key)) is not None:
+            return cached
+
+        request = self._request(
+            conversation, max_output_tokens, timeout, response_format
+        )
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._semaphore:
+                    response = self.client.chat.completions.create(**request)
+                content = response.choices[0].message.content
+                if cache_key:
+                    self.cache.put(cache_key, content)
+                return content
+            except RETRYABLE_ERRORS as exc:
+                if attempt == self.max_retries:
+                    raise self._response_error(conversation) from exc
+                time.sleep(self.backoff(attempt))
+            except Exception as exc:
+                raise self._response_error(conversation) from exc
+
+    async def agenerate_response(
+        self,
+        prompt_dict: Mapping[str, str],
+        max_output_tokens: int = None,
+        timeout: float = None,
+        response_format: dict = None,
+    ) -> str:
+        """Async variant of `generate_response` on the shared connection pool."""
+        conversation = self.prepare_input(prompt_dict)
+        cache_key = self._cache_key(conversation, max_output_tokens, response_format)
+        if cache_key and (cached := self.cache.get(cache_key)) is not None:
+            return cached
+
+        if self._async_semaphore is None:
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+        request = self._request(
+            conversation, max_output_tokens, timeout, response_format
+        )
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._async_semaphore:
+                    response = await self.async_client.chat.completions.create(
+                        **request
+                    )
+                content = response.choices[0].message.content
+                if cache_key:
+                    self.cache.put(cache_key, content)
+                return content
+            except RETRYABLE_ERRORS as exc:
+                if attempt == self.max_retries:
+                    raise self._response_error(conversation) from exc
+                await asyncio.sleep(self.backoff(attempt))
+            except Exception as exc:
+                raise self._response_error(conversation) from exc
+
+    def stream_response(
+        self,
+        prompt_dict: Mapping[str, str],
+        max_output_tokens: int = None,
+        timeout: float = None,
+    ) -> Iterator[str]:
+        """Yields the completion text as it is generated.
+
+        Failures before the first token are retried like `generate_response`;
+        once text has been yielded an interruption is raised to the caller.
+        The upstream stream is drained on a separate thread which holds the
+        concurrency slot only until the model is done, so a slow consumer
+        doesn't keep other requests waiting.
+        """
+        conversation = self.prepare_input(prompt_dict)
+        request = self._request(conversation, max_output_tokens, timeout)
+        for attempt in range(self.max_retries + 1):
+            started = False
+            chunks = queue.Queue()
+            threading.Thread(
+                target=self._read_stream,
+                args=(request, chunks),
+                name="openai-stream",
+                daemon=True,
+            ).start()
+            try:
+                while (delta := chunks.get()) is not _STREAM_END:
+                    if isinstance(delta, Exception):
+                        raise delta
+                    started = True
+                    yield delta
+                return
+            except RETRYABLE_ERRORS as exc:
+                if started or attempt == self.max_retries:
+                    raise self._response_error(conversation) from exc
+                time.sleep(self.backoff(attempt))
+            except Exception as exc:
+                raise self._response_error(conversation) from exc
+
+    def _read_stream(self, request: dict, chunks: queue.Queue):
+        """Puts the text deltas of one streamed completion into `chunks`.
+
+        Ends with `_STREAM_END`, or with the exception that interrupted it.
+        """
+        try:
+            with self._semaphore:
+                stream = self.client.chat.completions.create(stream=True, **request)
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        chunks.put(chunk.choices[0].delta.content)
+            chunks.put(_STREAM_END)
+        except Exception as exc:
+            chunks.put(exc)
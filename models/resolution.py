@@ -0,0 +1,69 @@
+"""Resolution buckets for Flux generation.
+
+Arbitrary client sizes are snapped to a fixed set of shapes so compiled
+kernels, autotuning results and allocator pools are reused and requests of
+different sizes can share a batch. The image is scaled and center-cropped back
+to the requested size afterwards. Sizes larger than every bucket are generated
+as requested, since snapping them would mean upscaling.
+"""
+import math
+
+from PIL import Image
+
+# (width, height), multiples of 64 at roughly 1 MP and 0.4 MP.
+BUCKETS = [
+    (1024, 1024),  # 1:1
+    (1344, 768),  # 16:9
+    (768, 1344),  # 9:16
+    (1152, 896),  # 4:3
+    (896, 1152),  # 3:4
+    (1216, 832),  # 3:2
+    (832, 1216),  # 2:3
+    (640, 640),  # 1:1
+    (832, 480),  # 16:9
+    (480, 832),  # 9:16
+    (704, 544),  # 4:3
+    (544, 704),  # 3:4
+]
+
+
+def nearest_bucket(
+    width: int, height: int, buckets: list[tuple[int, int]] = BUCKETS
+) -> tuple[int, int]:
+    """Bucket closest in aspect ratio first and in area second (log scale)."""
+    aspect = math.log(width / height)
+    area = math.log(width * height)
+
+    def distance(bucket: tuple[int, int]) -> float:
+        bucket_width, bucket_height = bucket
+        return abs(math.log(bucket_width / bucket_height) - aspect) + 0.5 * abs(
+            math.log(bucket_width * bucket_height) - area
+        )
+
+    return min(buckets, key=distance)
+
+
+def generation_size(
+    width: int, height: int, buckets: list[tuple[int, int]] = BUCKETS
+) -> tuple[int, int]:
+    """Nearest bucket, or the requested size if it's larger than every bucket."""
+    if width * height > max(w * h for w, h in buckets):
+        return width, height
+    return nearest_bucket(width, height, buckets)
+
+
+def fit(image: Image.Image, width: int, height: int) -> Image.Image:
+    """Scales `image` to cover `width`x`height` and center-crops the overflow."""
+    if image.size == (width, height):
+        return image
+    scale = max(width / image.width, height / image.height)
+    resized = image.resize(
+        (
+            max(width, round(image.width * scale)),
+            max(height, round(image.height * scale)),
+        ),
+        Image.LANCZOS,
+    )
+    left = (resized.width - width) // 2
+    top = (resized.height - height) // 2
+    return resized.crop((left, top, left + width, top + height))
@@ -0,0 +1,232 @@
+"""Client for the Stable Diffusion WebUI (img2img/txt2img) backends."""
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import httpx
+
+from modules import errors
+
+LOGGER = logging.getLogger(__name__)
+
+# Placeholder for the backend host in the preset urls, e.g.
+# `http://WEB_UI_IP:7860/sdapi/v1/img2img`.
+HOST_PLACEHOLDER = "WEB_UI_IP"
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class Backend:
+    """One WebUI instance and its routing state."""
+
+    def __init__(self, host: str):
+        self.host = host
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+
+    def url(self, url_template: str) -> str:
+        if ":" in self.host:
+            # `host:port` entries override the port of the preset url.
+            return re.sub(rf"{HOST_PLACEHOLDER}(:\d+)?", self.host, url_template)
+        return url_template.replace(HOST_PLACEHOLDER, self.host)
+
+
+class WebUIClient:
+    """Pooled client spreading requests over several WebUI instances.
+
+    Each request goes to the healthy backend with the least outstanding
+    requests. Connection errors, timeouts and 5xx responses mark the backend
+    unhealthy and are retried on another one with jittered backoff. A
+    background thread pings every backend so recovered instances rejoin.
+    `post` is for sync handlers, `apost` shares the routing state and uses a
+    keep-alive async pool.
+    """
+
+    def __init__(
+        self,
+        hosts: list[str],
+        timeout: float = 300.0,
+        connect_timeout: float = 5.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 10.0,
+        max_connections: int = 32,
+        health_url: str = "http://WEB_UI_IP:7860/internal/ping",
+        health_interval: float = 15.0,
+    ):
+        self.backends = [Backend(host) for host in hosts]
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.health_url = health_url
+        self.health_interval = health_interval
+        self._lock = threading.Lock()
+        self._next = 0
+
+        timeouts = httpx.Timeout(timeout, connect=connect_timeout)
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        )
+        self.client = httpx.Client(timeout=timeouts, limits=limits)
+        self.async_client = httpx.AsyncClient(timeout=timeouts, limits=limits)
+
+        self._stop = threading.Event()
+        if self.backends and health_interval > 0:
+            threading.Thread(
+                target=self._health_loop, name="webui-health", daemon=True
+            ).start()
+
+    def backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter."""
+        return random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2**attempt)
+        )
+
+    def _pick(self, exclude: set) -> Backend:
+        with self._lock:
+            candidates = [b for b in self.backends if b not in exclude] or self.backends
+            if not candidates:
+                raise errors.InvalidConfigError(
+                    "No WebUI backends configured. Set WEBUI_INSTANCE_IP.",
+                    "E-3-5-03",
+                )
+            healthy = [b for b in candidates if b.healthy] or candidates
+            # Rotate the start so ties are spread round robin.
+            self._next = (self._next + 1) % len(healthy)
+            rotated = healthy[self._next :] + healthy[: self._next]
+            backend = min(rotated, key=lambda b: b.outstanding)
+            backend.outstanding += 1
+            return backend
+
+    def _release(self, backend: Backend, healthy: Optional[bool]):
+        with self._lock:
+            backend.outstanding -= 1
+            if healthy:
+                backend.healthy = True
+                backend.failures = 0
+            elif healthy is False:
+                backend.healthy = False
+                backend.failures += 1
+
+    @contextmanager
+    def _route(self, exclude: set):
+        backend = self._pick(exclude)
+        try:
+            yield backend
+        except BaseException as exc:
+            # A rejected request says nothing about the backend's health.
+            self._release(backend, None if _is_client_error(exc) else False)
+            raise
+        self._release(backend, True)
+
+    @staticmethod
+    def _check(response: httpx.Response) -> dict:
+        if response.status_code in RETRYABLE_STATUS:
+            raise httpx.HTTPStatusError(
+                f"WebUI returned {response.status_code}",
+                request=response.request,
+                response=response,
+            )
+        response.raise_for_status()
+        try:
+            return response.json()
+        except ValueError as exc:
+            raise errors.ModelResponseError(
+                f"WebUI returned an invalid JSON response from {response.request.url}.",
+                "E-3-5-02",
+            ) from exc
+
+    def _failed(self, url_template: str, exc: Exception) -> errors.ModelResponseError:
+        return errors.ModelResponseError(
+            f"WebUI request to {url_template} failed on every backend: {exc}",
+            "E-3-5-01",
+        )
+
+    def post(self, url_template: str, payload: dict) -> dict:
+        """POSTs `payload` to a backend and returns the decoded JSON response."""
+        tried = set()
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._route(tried) as backend:
+                    tried.add(backend)
+                    return self._check(
+                        self.client.post(backend.url(url_template), json=payload)
+                    )
+            except (httpx.TransportError, httpx.HTTPStatusError) as exc:
+                LOGGER.warning(f"WebUI backend {backend.host} failed: {exc}")
+                if attempt == self.max_retries or _is_client_error(exc):
+                    raise self._failed(url_template, exc) from exc
+                time.sleep(self.backoff(attempt))
+
+    async def apost(self, url_template: str, payload: dict) -> dict:
+        """Async variant of `post` on the shared keep-alive pool."""
+        tried = set()
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._route(tried) as backend:
+                    tried.add(backend)
+                    response = await self.async_client.post(
+                        backend.url(url_template), json=payload
+                    )
+                    return self._check(response)
+            except (httpx.TransportError, httpx.HTTPStatusError) as exc:
+                LOGGER.warning(f"WebUI backend {backend.host} failed: {exc}")
+                if attempt == self.max_retries or _is_client_error(exc):
+                    raise self._failed(url_template, exc) from exc
+                await asyncio.sleep(self.backoff(attempt))
+
+    def check_health(self) -> dict[str, bool]:
+        """Pings every backend and updates its health."""
+        for backend in self.backends:
+            try:
+                healthy = self.client.get(
+                    backend.url(self.health_url), timeout=5.0
+                ).is_success
+            except httpx.HTTPError:
+                healthy = False
+            with self._lock:
+                if healthy != backend.healthy:
+                    LOGGER.info(
+                        f"WebUI backend {backend.host} is {'up' if healthy else 'down'}."
+                    )
+                backend.healthy = healthy
+        return {backend.host: backend.healthy for backend in self.backends}
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            self.check_health()
+
+    def metrics(self) -> list[dict]:
+        with self._lock:
+            return [
+                {
+                    "host": backend.host,
+                    "healthy": backend.healthy,
+                    "outstanding": backend.outstanding,
+                    "failures": backend.failures,
+                }
+                for backend in self.backends
+            ]
+
+    def close(self):
+        self._stop.set()
+        self.client.close()
+
+
+def _is_client_error(exc: Exception) -> bool:
+    """4xx (other than 429) responses are not worth retrying elsewhere."""
+    return (
+        isinstance(exc, httpx.HTTPStatusError)
+        and exc.response.status_code not in RETRYABLE_STATUS
+    )
+
+
+def parse_hosts(value: Optional[str]) -> list[str]:
+    """Splits a comma separated WEBUI_INSTANCE_IP value."""
+    return [host.strip() for host in (value or "").split(",") if host.strip()]
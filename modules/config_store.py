@@ -0,0 +1,117 @@
+"""In-memory store of the WebUI request presets with hot reload."""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any
+from typing import Mapping
+
+from modules import errors
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _load_preset(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as file:
+        preset = json.load(file)
+    if (
+        not isinstance(preset, dict)
+        or not isinstance(preset.get("url"), str)
+        or not isinstance(preset.get("payload"), dict)
+    ):
+        raise ValueError("Preset must have a `url` string and a `payload` object.")
+    return preset
+
+
+def overlay(template: dict, updates: Mapping[tuple, Any]) -> dict:
+    """Returns `template` with `updates` applied, without mutating it.
+
+    Each update maps a key path, e.g. `("payload", "prompt")`, to its new value.
+    Only the dicts/lists along the updated paths are copied; everything else is
+    shared with the template. A missing key on a path raises KeyError.
+    """
+    result = dict(template)
+    copied = {(): result}
+    for path, value in updates.items():
+        node = result
+        for depth, key in enumerate(path[:-1]):
+            prefix = path[: depth + 1]
+            child = copied.get(prefix)
+            if child is None:
+                original = node[key]
+                child = list(original) if isinstance(original, list) else dict(original)
+                node[key] = child
+                copied[prefix] = child
+            node = child
+        node[path[-1]] = value
+    return result
+
+
+class PresetStore:
+    """Loads every `<name>.json` preset of a directory once and serves it from memory.
+
+    The directory is re-scanned at most every `reload_interval` seconds and
+    changed files are reloaded; a preset that fails to load keeps its previous
+    version. Presets handed out are shared and must not be mutated, use
+    `overlay` to derive per-request configs.
+    """
+
+    def __init__(self, directory: str, reload_interval: float = 2.0):
+        self.directory = directory
+        self.reload_interval = reload_interval
+        self._presets: dict[str, dict] = {}
+        self._mtimes: dict[str, float] = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._scan(strict=True)
+
+    def _scan(self, strict: bool = False):
+        mtimes = {}
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".json"):
+                path = os.path.join(self.directory, filename)
+                try:
+                    mtimes[filename[: -len(".json")]] = os.stat(path).st_mtime
+                except OSError:
+                    continue  # Removed while scanning.
+
+        presets = dict(self._presets)
+        for name, mtime in mtimes.items():
+            if self._mtimes.get(name) == mtime:
+                continue
+            try:
+                presets[name] = _load_preset(
+                    os.path.join(self.directory, f"{name}.json")
+                )
+                LOGGER.info(f"Loaded preset {name} from {self.directory}.")
+            except (OSError, ValueError) as exc:
+                if strict:
+                    raise errors.InvalidConfigError(
+                        f"Invalid preset {name}.json in {self.directory}: {exc}",
+                        "E-3-1-14",
+                    ) from exc
+                LOGGER.error(f"Keeping previous version of preset {name}: {exc}")
+            # Not retried until the file changes again.
+            self._mtimes[name] = mtime
+        for name in set(presets) - set(mtimes):
+            presets.pop(name)
+            self._mtimes.pop(name, None)
+        self._presets = presets
+        self._checked_at = time.monotonic()
+
+    def get(self, name: str) -> dict:
+        if time.monotonic() - self._checked_at > self.reload_interval:
+            with self._lock:
+                if time.monotonic() - self._checked_at > self.reload_interval:
+                    self._scan()
+        preset = self._presets.get(name)
+        if preset is None:
+            raise errors.InvalidConfigError(
+                f"No preset named {name} in {self.directory}.",
+                "E-3-1-15",
+            )
+        return preset
+
+    def names(self) -> list[str]:
+        return sorted(self._presets)
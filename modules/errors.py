@@ -70,3 +70,15 @@ class HTTPException(BaseCustomError):
 
 class UnsupportedFileFormat(BaseCustomError):
     """Unsupported file format, only .txt, .pdf and .fountain are supported"""
+
+
+class SchedulerQueueFullError(BaseCustomError):
+    """Indicates that the GPU job queue is at capacity."""
+
+
+class DeadlineExceededError(BaseCustomError):
+    """Indicates that a job didn't complete before its deadline."""
+
+
+class JobCancelledError(BaseCustomError):
+    """Indicates that a queued job was cancelled before it ran."""
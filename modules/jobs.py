@@ -0,0 +1,291 @@
+"""Background job subsystem for long running generation requests."""
+import abc
+import asyncio
+import contextvars
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from typing import Callable
+from typing import Optional
+from urllib.parse import urlparse
+
+import requests
+from fastapi.encoders import jsonable_encoder
+
+from modules import errors
+from modules import schema
+
+JobStatus = schema.JobStatus
+JobRecord = schema.JobStatusResponse
+
+LOGGER = logging.getLogger(__name__)
+
+# Id of the job executing in the current thread, used for progress reporting.
+current_job_var = contextvars.ContextVar("current_job", default=None)
+
+FINISHED_STATUSES = (JobStatus.SUCCEEDED.value, JobStatus.FAILED.value)
+
+
+class JobStore(abc.ABC):
+    """Persistence for job records."""
+
+    @abc.abstractmethod
+    def create(self, record: JobRecord) -> None:
+        ...
+
+    @abc.abstractmethod
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        ...
+
+    @abc.abstractmethod
+    def update(self, job_id: str, **fields: Any) -> Optional[JobRecord]:
+        ...
+
+    @abc.abstractmethod
+    def prune(self, ttl_seconds: float, max_records: int) -> int:
+        """Deletes finished records older than `ttl_seconds`, then the oldest
+        finished ones beyond `max_records` in total. Returns the number deleted.
+        """
+
+
+class InMemoryJobStore(JobStore):
+    """Process local job store; records are lost on restart."""
+
+    def __init__(self):
+        self._records: dict[str, JobRecord] = {}
+        self._lock = threading.Lock()
+
+    def create(self, record: JobRecord) -> None:
+        with self._lock:
+            self._records[record.job_id] = record
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        with self._lock:
+            record = self._records.get(job_id)
+            return record.copy(deep=True) if record else None
+
+    def update(self, job_id: str, **fields: Any) -> Optional[JobRecord]:
+        with self._lock:
+            record = self._records.get(job_id)
+            if record is None:
+                return None
+            for name, value in fields.items():
+                setattr(record, name, value)
+            record.updated_at = time.time()
+            return record.copy(deep=True)
+
+    def prune(self, ttl_seconds: float, max_records: int) -> int:
+        with self._lock:
+            finished = sorted(
+                (
+                    record
+                    for record in self._records.values()
+                    if record.status in FINISHED_STATUSES
+                ),
+                key=lambda record: record.updated_at,
+            )
+            cutoff = time.time() - ttl_seconds
+            expired = [record for record in finished if record.updated_at < cutoff]
+            excess = len(self._records) - len(expired) - max_records
+            if excess > 0:
+                expired = finished[: len(expired) + excess]
+            for record in expired:
+                del self._records[record.job_id]
+            return len(expired)
+
+
+class SqliteJobStore(JobStore):
+    """Job store backed by a single SQLite file, shared across restarts."""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, record TEXT NOT NULL)"
+            )
+
+    def create(self, record: JobRecord) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (job_id, record) VALUES (?, ?)",
+                (record.job_id, json.dumps(jsonable_encoder(record))),
+            )
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT record FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return JobRecord(**json.loads(row[0])) if row else None
+
+    def update(self, job_id: str, **fields: Any) -> Optional[JobRecord]:
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT record FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            record = JobRecord(**{**json.loads(row[0]), **jsonable_encoder(fields)})
+            record.updated_at = time.time()
+            self._conn.execute(
+                "UPDATE jobs SET record = ? WHERE job_id = ?",
+                (json.dumps(jsonable_encoder(record)), job_id),
+            )
+        return record
+
+    def prune(self, ttl_seconds: float, max_records: int) -> int:
+        finished = (
+            "json_extract(record, '$.status') IN ("
+            + ", ".join("?" * len(FINISHED_STATUSES))
+            + ")"
+        )
+        with self._lock, self._conn:
+            deleted = self._conn.execute(
+                f"DELETE FROM jobs WHERE {finished}"
+                " AND json_extract(record, '$.updated_at') < ?",
+                (*FINISHED_STATUSES, time.time() - ttl_seconds),
+            ).rowcount
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM jobs").fetchone()
+            if count > max_records:
+                deleted += self._conn.execute(
+                    f"DELETE FROM jobs WHERE job_id IN (SELECT job_id FROM jobs"
+                    f" WHERE {finished} ORDER BY json_extract(record, '$.updated_at')"
+                    " LIMIT ?)",
+                    (*FINISHED_STATUSES, count - max_records),
+                ).rowcount
+        return deleted
+
+
+def validate_callback_url(callback_url: str):
+    """Only absolute http(s) urls are accepted as job callbacks.
+
+    The server POSTs the job record to this url itself, so a client can make it
+    reach hosts on its private network (server-side request forgery). The scheme
+    check keeps out `file:` and friends; restricting hosts is left to the
+    network (egress rules) the server is deployed in.
+    """
+    parsed = urlparse(callback_url)
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        raise errors.InvalidConfigError(
+            f"Invalid callback url: {callback_url}. Use an http(s) url.",
+            "E-3-4-02",
+        )
+
+
+def create_store(spec: str) -> JobStore:
+    """Builds a store from a spec: `memory` or `sqlite:<path to db file>`."""
+    if not spec or spec == "memory":
+        return InMemoryJobStore()
+    if spec.startswith("sqlite:"):
+        return SqliteJobStore(spec[len("sqlite:") :])
+    raise errors.InvalidConfigError(
+        f"Unsupported job store: {spec}. Use `memory` or `sqlite:<path>`.",
+        "E-3-4-01",
+    )
+
+
+class JobManager:
+    """Runs request handlers in the background and tracks their state.
+
+    Finished jobs are kept for `ttl_seconds` and at most `max_records` records
+    are stored; both are enforced whenever a job is submitted.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        max_workers: int = 16,
+        ttl_seconds: float = 3600,
+        max_records: int = 1000,
+    ):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.max_records = max_records
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="job"
+        )
+
+    def submit(
+        self,
+        kind: str,
+        handler: Callable[..., Any],
+        request: Any,
+        callback_url: str = None,
+    ) -> JobRecord:
+        """Queues `handler(request)` and returns the freshly created job record."""
+        if callback_url:
+            validate_callback_url(callback_url)
+        now = time.time()
+        record = JobRecord(
+            job_id=uuid.uuid4().hex,
+            kind=kind,
+            status=JobStatus.QUEUED,
+            callback_url=callback_url or "",
+            created_at=now,
+            updated_at=now,
+        )
+        self.store.create(record)
+        pruned = self.store.prune(self.ttl_seconds, self.max_records)
+        if pruned:
+            LOGGER.info(f"Evicted {pruned} finished job records.")
+        # Carry the request id (logging context) over to the worker thread.
+        context = contextvars.copy_context()
+        self._executor.submit(context.run, self._run, record.job_id, handler, request)
+        return record
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        return self.store.get(job_id)
+
+    def report_progress(self, job_id: str, step: int, total_steps: int):
+        self.store.update(
+            job_id, progress=schema.JobProgress(step=step, total_steps=total_steps)
+        )
+
+    def progress_callback(self) -> Optional[Callable[[int, int], None]]:
+        """Progress reporter for the job running in this thread, if any."""
+        job_id = current_job_var.get()
+        if job_id is None:
+            return None
+        return lambda step, total: self.report_progress(job_id, step, total)
+
+    def _run(self, job_id: str, handler: Callable[..., Any], request: Any):
+        token = current_job_var.set(job_id)
+        self.store.update(job_id, status=JobStatus.RUNNING)
+        try:
+            result = handler(request)
+            if asyncio.iscoroutine(result):
+                # Async request handlers get an event loop of their own.
+                result = asyncio.run(result)
+            record = self.store.update(
+                job_id,
+                status=JobStatus.SUCCEEDED,
+                result=jsonable_encoder(result),
+            )
+        except BaseException as exc:
+            LOGGER.error(f"Job {job_id} failed: {exc}")
+            record = self.store.update(job_id, status=JobStatus.FAILED, error=str(exc))
+        finally:
+            current_job_var.reset(token)
+
+        if record is not None and record.callback_url:
+            self._notify(record)
+
+    def _notify(self, record: JobRecord, max_tries: int = 3):
+        """POSTs the final job record to its callback url."""
+        for attempt in range(max_tries):
+            try:
+                response = requests.post(
+                    record.callback_url, json=jsonable_encoder(record), timeout=10
+                )
+                if response.status_code < 500:
+                    return
+            except requests.RequestException as exc:
+                LOGGER.warning(f"Callback for job {record.job_id} failed: {exc}")
+            time.sleep(2**attempt)
+        LOGGER.error(f"Giving up on callback for job {record.job_id}.")
@@ -1,56 +1,175 @@
+"""Resident LaMa inpainting service used for object removal."""
 import sys
+import threading
+from io import BytesIO
 from pathlib import Path
+from urllib.parse import urlparse
 
 import numpy as np
 import torch
 import yaml
 from omegaconf import OmegaConf
 
+from modules import errors
 from utils import common
 from utils import constants
 
 sys.path.insert(0, str(Path(__file__).resolve().parent / "models/lama"))
-from models.lama.saicinpainting.evaluation.utils import move_to_device
-from models.lama.saicinpainting.training.trainers import load_checkpoint
 from models.lama.saicinpainting.evaluation.data import pad_tensor_to_modulo
+from models.lama.saicinpainting.training.modules import make_generator
+
+DEFAULT_PREDICT_CONFIG = "models/lama/configs/prediction/default.yaml"
+GENERATOR_PREFIX = "generator."
+
+
+class LamaInpainter:
+    """Keeps a frozen LaMa generator resident in memory.
+
+    Only the generator weights are materialized; the discriminator, losses and
+    evaluators of the training module are never built. The generator is loaded
+    lazily on the first `inpaint` call (or eagerly via `load`) and can be swapped
+    for a fresh checkpoint at runtime through `reload`.
+    """
+
+    def __init__(
+        self,
+        config_p: str = DEFAULT_PREDICT_CONFIG,
+        device: str = "cuda",
+        mod: int = 8,
+    ):
+        self.config_p = config_p
+        self.device = torch.device(device)
+        self.mod = mod
+        self.predict_config = OmegaConf.load(config_p)
+        self.generator = None
+        self.concat_mask = True
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self.generator is not None
+
+    def _build_generator(self) -> tuple[torch.nn.Module, bool]:
+        """Fetches the train config + checkpoint and builds a frozen generator."""
+        try:
+            yaml_content = common.fetch_s3_file(
+                constants.S3_BUCKET_PATH + "/" + "config.yaml"
+            )
+            train_config = OmegaConf.create(yaml.safe_load(yaml_content))
+            training_model = train_config.training_model
+            if training_model.get("add_noise_kwargs") is not None:
+                raise ValueError("Noise conditioned LaMa generators are unsupported.")
+
+            generator = make_generator(train_config, **train_config.generator)
+            model_bytes = common.fetch_s3_file(
+                {
+                    "bucket_name": urlparse(constants.S3_BUCKET_PATH).hostname.split(
+                        "."
+                    )[0],
+                    "file_key": urlparse(constants.S3_MODEL_PATH).path.lstrip("/"),
+                }
+            )
+            state = torch.load(BytesIO(model_bytes), map_location=torch.device("cpu"))
+            generator_state = {
+                key[len(GENERATOR_PREFIX) :]: value
+                for key, value in state["state_dict"].items()
+                if key.startswith(GENERATOR_PREFIX)
+            }
+            del state
+            generator.load_state_dict(generator_state, strict=True)
+            generator.eval()
+            generator.requires_grad_(False)
+            generator.to(self.device)
+            return generator, training_model.get("concat_mask", True)
+        except Exception as exc:
+            raise errors.ModelInitializationFailedError(
+                f"Failed to initialize LaMa inpainting model. Check traceback for more info.",
+                "E-4-4-01",
+            ) from exc
+
+    def load(self) -> None:
+        """Loads the generator if it isn't resident already."""
+        with self._lock:
+            if self.generator is None:
+                self.generator, self.concat_mask = self._build_generator()
+
+    def reload(self) -> None:
+        """Loads the latest checkpoint and atomically swaps it in."""
+        generator, concat_mask = self._build_generator()
+        with self._lock:
+            self.generator, self.concat_mask = generator, concat_mask
+        if self.device.type == "cuda":
+            torch.cuda.empty_cache()
+
+    def warm_up(self) -> None:
+        """Inpaints a blank image so the first request doesn't pay for CUDA init."""
+        self.inpaint(
+            np.zeros((64, 64, 3), dtype=np.uint8), np.zeros((64, 64), dtype=np.uint8)
+        )
+
+    @torch.no_grad()
+    def inpaint(self, image: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """Inpaints the masked region of `image` and returns a uint8 HxWx3 array."""
+        assert len(mask.shape) == 2
+        if not self.is_loaded:
+            self.load()
+        generator, concat_mask = self.generator, self.concat_mask
+
+        try:
+            if np.max(mask) == 1:
+                mask = mask * 255
+            img = torch.from_numpy(image).float().div(255.0)
+            mask = torch.from_numpy(mask).float()
+
+            img = img.permute(2, 0, 1).unsqueeze(0)
+            mask = mask[None, None]
+            orig_height, orig_width = img.shape[2], img.shape[3]
+            img = pad_tensor_to_modulo(img, self.mod).to(self.device)
+            mask = (pad_tensor_to_modulo(mask, self.mod).to(self.device) > 0) * 1
+
+            masked_img = img * (1 - mask)
+            if concat_mask:
+                masked_img = torch.cat([masked_img, mask], dim=1)
+            predicted = generator(masked_img)
+            inpainted = mask * predicted + (1 - mask) * img
+
+            cur_res = inpainted[0].permute(1, 2, 0).detach().cpu().numpy()
+            cur_res = cur_res[:orig_height, :orig_width]
+            return np.clip(cur_res * 255, 0, 255).astype("uint8")
+        except Exception as exc:
+            raise errors.ModelResponseError(
+                f"Failed to inpaint the given image with LaMa.",
+                "E-4-4-02",
+            ) from exc
+
+
+# Process wide cache of inpainters keyed by (prediction config, device).
+_INPAINTERS: dict[tuple[str, str], LamaInpainter] = {}
+_INPAINTERS_LOCK = threading.Lock()
+
+
+def get_inpainter(
+    config_p: str = DEFAULT_PREDICT_CONFIG, device: str = "cuda"
+) -> LamaInpainter:
+    """Returns the shared `LamaInpainter` for the given config and device."""
+    key = (config_p, device)
+    with _INPAINTERS_LOCK:
+        if key not in _INPAINTERS:
+            _INPAINTERS[key] = LamaInpainter(config_p, device=device)
+        return _INPAINTERS[key]
 
 
-@torch.no_grad()
 def inpaint_img_with_lama(
-    img: np.ndarray, mask: np.ndarray, config_p: str, ckpt_p: str, mod=8, device="cuda"
+    img: np.ndarray,
+    mask: np.ndarray,
+    config_p: str = DEFAULT_PREDICT_CONFIG,
+    ckpt_p: str = None,
+    mod=8,
+    device="cuda",
 ):
-    assert len(mask.shape) == 2
-    if np.max(mask) == 1:
-        mask = mask * 255
-    img = torch.from_numpy(img).float().div(255.0)
-    mask = torch.from_numpy(mask).float()
-    predict_config = OmegaConf.load(config_p)
-    predict_config.model.path = ckpt_p
-    device = torch.device(device)
-    yaml_content = common.fetch_s3_file(constants.S3_BUCKET_PATH + "/" + "config.yaml")
-    train_config = OmegaConf.create(yaml.safe_load(yaml_content))
-    train_config.training_model.predict_only = True
-    train_config.visualizer.kind = "noop"
-    model = load_checkpoint(train_config, strict=False, map_location="cuda")
-    model.freeze()
-    if not predict_config.get("refine", False):
-        model.to(device)
-
-    batch = {}
-    batch["image"] = img.permute(2, 0, 1).unsqueeze(0)
-    batch["mask"] = mask[None, None]
-    unpad_to_size = [batch["image"].shape[2], batch["image"].shape[3]]
-    batch["image"] = pad_tensor_to_modulo(batch["image"], mod)
-    batch["mask"] = pad_tensor_to_modulo(batch["mask"], mod)
-    batch = move_to_device(batch, device)
-    batch["mask"] = (batch["mask"] > 0) * 1
-
-    batch = model(batch)
-    cur_res = batch[predict_config.out_key][0].permute(1, 2, 0)
-    cur_res = cur_res.detach().cpu().numpy()
-    if unpad_to_size is not None:
-        orig_height, orig_width = unpad_to_size
-        cur_res = cur_res[:orig_height, :orig_width]
-
-    cur_res = np.clip(cur_res * 255, 0, 255).astype("uint8")
-    return cur_res
+    """Backwards compatible wrapper around the shared `LamaInpainter`.
+
+    `ckpt_p` and `mod` are ignored; the checkpoint location comes from
+    `S3_MODEL_PATH` and the padding modulo is fixed per inpainter.
+    """
+    return get_inpainter(config_p, device).inpaint(img, mask)
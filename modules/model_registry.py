@@ -0,0 +1,186 @@
+"""Registry of the server's models, loaded in the background or on first use."""
+import enum
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Callable
+from typing import Optional
+
+from modules import errors
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ModelState(str, enum.Enum):
+    PENDING = "pending"
+    LOADING = "loading"
+    WARMING = "warming"
+    READY = "ready"
+    FAILED = "failed"
+
+
+@dataclass
+class ModelEntry:
+    name: str
+    loader: Callable[[], Any]
+    warmup: Optional[Callable[[Any], None]] = None
+    eager: bool = True
+    variant: Optional[str] = None  # e.g. the weight precision, for `status`.
+    state: ModelState = ModelState.PENDING
+    model: Any = None
+    error: Optional[str] = None
+    load_seconds: Optional[float] = None
+    warmup_seconds: Optional[float] = None
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+
+class ModelRegistry:
+    """Declares every model with a loader and an optional warm-up routine.
+
+    Eager models are loaded in registration order by a background thread
+    started with `start`, so the server can bind and answer `/health` while
+    they load; the server is ready once all of them are warm. Lazy models load
+    on their first `get`. A model that failed to load keeps failing fast.
+    """
+
+    def __init__(self):
+        self._entries: dict[str, ModelEntry] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def register(
+        self,
+        name: str,
+        loader: Callable[[], Any],
+        warmup: Optional[Callable[[Any], None]] = None,
+        eager: bool = True,
+        variant: Optional[str] = None,
+    ):
+        self._entries[name] = ModelEntry(
+            name, loader, warmup=warmup, eager=eager, variant=variant
+        )
+
+    def _entry(self, name: str) -> ModelEntry:
+        entry = self._entries.get(name)
+        if entry is None:
+            raise errors.InvalidConfigError(
+                f"Model {name} is not registered.", "E-4-6-01"
+            )
+        return entry
+
+    def get(self, name: str) -> Any:
+        """Returns the loaded model, loading and warming it up first if needed."""
+        entry = self._entry(name)
+        with entry.lock:
+            if entry.state == ModelState.READY:
+                return entry.model
+            if entry.state == ModelState.FAILED:
+                raise errors.ModelInitializationFailedError(
+                    f"Model {name} failed to load: {entry.error}", "E-4-6-02"
+                )
+            self._load(entry)
+            return entry.model
+
+    def _load(self, entry: ModelEntry):
+        try:
+            entry.state = ModelState.LOADING
+            LOGGER.info(f"Loading model {entry.name}...")
+            start_time = time.perf_counter()
+            model = entry.loader()
+            entry.load_seconds = time.perf_counter() - start_time
+            if entry.warmup is not None:
+                entry.state = ModelState.WARMING
+                start_time = time.perf_counter()
+                entry.warmup(model)
+                entry.warmup_seconds = time.perf_counter() - start_time
+            entry.model = model
+            entry.state = ModelState.READY
+            LOGGER.info(
+                f"Model {entry.name} ready (load {entry.load_seconds:.2f}s, "
+                f"warm-up {entry.warmup_seconds or 0:.2f}s)"
+            )
+        except (errors.BaseCustomError, Exception) as exc:
+            entry.state = ModelState.FAILED
+            entry.error = str(exc)
+            LOGGER.exception(f"Failed to load model {entry.name}")
+            if isinstance(exc, errors.BaseCustomError):
+                raise
+            raise errors.ModelInitializationFailedError(
+                f"Model {entry.name} failed to load: {exc}", "E-4-6-02"
+            ) from exc
+
+    def load_eager(self):
+        for entry in list(self._entries.values()):
+            if entry.eager:
+                try:
+                    self.get(entry.name)
+                except errors.BaseCustomError:
+                    # Recorded on the entry and reported by `status`.
+                    pass
+
+    def start(self):
+        """Loads the eager models on a background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self.load_eager, name="model-loader", daemon=True
+            )
+            self._thread.start()
+
+    def is_ready(self, name: str) -> bool:
+        return self._entry(name).state == ModelState.READY
+
+    def ready(self) -> bool:
+        """True once every eager model is loaded and warmed up."""
+        return all(
+            entry.state == ModelState.READY
+            for entry in self._entries.values()
+            if entry.eager
+        )
+
+    def healthy(self) -> bool:
+        """False if an eager model failed; the process needs a restart."""
+        return not any(
+            entry.state == ModelState.FAILED
+            for entry in self._entries.values()
+            if entry.eager
+        )
+
+    def status(self) -> dict[str, dict]:
+        return {
+            entry.name: {
+                "state": entry.state.value,
+                "eager": entry.eager,
+                "variant": entry.variant,
+                "load_seconds": entry.load_seconds,
+                "warmup_seconds": entry.warmup_seconds,
+                "error": entry.error,
+            }
+            for entry in self._entries.values()
+        }
+
+    def proxy(self, name: str, *requires: str) -> "LazyModel":
+        return LazyModel(self, name, requires)
+
+
+class LazyModel:
+    """Stand-in for a registered model; attribute access waits until it's ready.
+
+    Lets long-lived objects such as the GPU scheduler hold on to a model that is
+    still loading. `requires` are other models that must be ready as well.
+    """
+
+    def __init__(self, registry: ModelRegistry, name: str, requires: tuple = ()):
+        self._registry = registry
+        self._name = name
+        self._requires = requires
+
+    def __getattr__(self, attr: str):
+        for name in self._requires:
+            self._registry.get(name)
+        return getattr(self._registry.get(self._name), attr)
+
+
+# Process wide registry; models are registered by the server at startup.
+MODELS = ModelRegistry()
@@ -1,12 +1,23 @@
 """Code for model response parsing logic."""
+import difflib
 import hashlib
+import logging
+import multiprocessing
 import re
+import threading
 import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable
+from typing import Iterator
+from typing import Optional
+from typing import Union
 
 import pdfplumber
 
 from modules import errors
+from modules import response_parser
 from modules import schema
+from utils import constants
 
 Gender = schema.Gender
 Character = schema.Character
@@ -15,6 +26,13 @@ Characters = list[Character]
 Scene = schema.Scene
 Scenes = list[Scene]
 
+LOGGER = logging.getLogger(__name__)
+
+# Pages handed to one worker of the PDF splitter's process pool at a time.
+PDF_PAGES_PER_TASK = 8
+_PDF_POOL: Optional[ProcessPoolExecutor] = None
+_PDF_POOL_LOCK = threading.Lock()
+
 
 def generate_character_id(name: str) -> str:
     """Generates a unique character id for each character."""
@@ -29,20 +47,115 @@ def get_shot_type(shot_type: str):
         return "MEDIUM_SHOT"
 
 
+# Titles dropped when normalizing names so that "Dr. Sarah Lee" matches "Sarah Lee".
+HONORIFICS = frozenset(
+    [
+        "mr", "mrs", "ms", "miss", "mx", "dr", "prof", "professor", "sir",
+        "madam", "lady", "lord", "captain", "capt", "detective", "det",
+        "officer", "agent", "sergeant", "sgt", "uncle", "aunt", "the",
+    ]
+)  # fmt: skip
+FUZZY_CUTOFF = 0.85
+
+
+def normalize_name(name: str) -> str:
+    """Lower cases a name and strips punctuation, cues like (V.O.) and honorifics."""
+    name = re.sub(r"\(.*?\)", " ", str(name).lower())
+    tokens = re.sub(r"[^\w\s]", " ", name).split()
+    return " ".join(token for token in tokens if token not in HONORIFICS)
+
+
+class CharacterIndex:
+    """Name lookup over the characters of one shot breakdown.
+
+    Built once per breakdown and shared by every `parse_frames` call. Names are
+    resolved by normalized exact match, then by the tokens they share with a
+    single character (first names, surnames, aliases), then by a fuzzy match.
+    Resolutions are memoized, so assembling frames is linear in the number of
+    character expressions.
+    """
+
+    def __init__(self, characters: Characters = None):
+        self.characters: Characters = []
+        self._names: dict[str, Character] = {}
+        self._tokens: dict[str, list[Character]] = {}
+        self._resolved: dict[str, Optional[Character]] = {}
+        for character in characters or []:
+            self.add(character)
+
+    def __iter__(self):
+        return iter(self.characters)
+
+    def __len__(self) -> int:
+        return len(self.characters)
+
+    def add(self, character: Character, aliases: list[str] = ()):
+        self.characters.append(character)
+        for name in [character.name, *aliases]:
+            normalized = normalize_name(name)
+            if not normalized:
+                continue
+            self._names.setdefault(normalized, character)
+            for token in normalized.split():
+                matches = self._tokens.setdefault(token, [])
+                if character not in matches:
+                    matches.append(character)
+        self._resolved.clear()
+
+    def _match_tokens(self, normalized: str) -> Optional[Character]:
+        scores: dict[str, int] = {}
+        by_id: dict[str, Character] = {}
+        for token in normalized.split():
+            for character in self._tokens.get(token, []):
+                scores[character.character_id] = (
+                    scores.get(character.character_id, 0) + 1
+                )
+                by_id[character.character_id] = character
+        if not scores:
+            return None
+        ranked = sorted(scores.values(), reverse=True)
+        if len(ranked) > 1 and ranked[0] == ranked[1]:
+            # Ambiguous, e.g. "John" with both "John Smith" and "John Doe".
+            return None
+        best = max(scores, key=scores.get)
+        return by_id[best]
+
+    def lookup(self, name: str) -> Optional[Character]:
+        normalized = normalize_name(name)
+        if normalized in self._resolved:
+            return self._resolved[normalized]
+        character = self._names.get(normalized)
+        if character is None and normalized:
+            character = self._match_tokens(normalized)
+        if character is None and normalized:
+            close = difflib.get_close_matches(
+                normalized, self._names.keys(), n=1, cutoff=FUZZY_CUTOFF
+            )
+            character = self._names[close[0]] if close else None
+        self._resolved[normalized] = character
+        return character
+
+
 def map_character_ids(
-    character_expressions: list[tuple[str]], characters: Characters
+    character_expressions: list[tuple[str]],
+    characters: Union[CharacterIndex, Characters],
 ) -> list[CharacterExpression]:
+    if not isinstance(characters, CharacterIndex):
+        characters = CharacterIndex(characters)
     character_exps = []
     try:
         for char in character_expressions:
-            for c in characters:
-                if char[0] == c.name:
-                    character_exps.append(
-                        CharacterExpression(
-                            character_id=c.character_id, expression=char[1]
-                        )
-                    )
-                    break
+            character = characters.lookup(char[0])
+            if character is None:
+                LOGGER.warning(
+                    f"No character profile matches {char[0]!r}; dropping its expression."
+                )
+                continue
+            character_exps.append(
+                CharacterExpression(
+                    character_id=character.character_id, expression=char[1]
+                )
+            )
         return character_exps
     except Exception as exc:
         raise errors.InvalidFrameBreakdownError(
@@ -51,111 +164,305 @@ def map_character_ids(
         ) from exc
 
 
-def parse_characters(model_response: str) -> Characters:
-    """Parses the model response to extract out character profiles."""
-    match_group = re.search("(```characters[^```]*```)", model_response)
-    if not match_group:
-        raise errors.ModelResponseParseError(
-            f"No character profiles found in model response.\nModel response: {model_response}",
-            "E-3-2-21",
+def build_character(character: dict) -> Character:
+    """Creates a Character profile from a single parsed model response dict."""
+    try:
+        char_id = generate_character_id(character["name"])
+        if not char_id:
+            raise errors.InvalidCharacterIdError(
+                f"Unable to generate a character-id.\nCharacter profile was: {character}",
+                "E-3-2-23",
+            )
+
+        return Character(
+            character_id=char_id,
+            name=character["name"],
+            age=str(character["age"]),
+            gender=str(character["gender"]),
+            description=character["description"],
         )
+    except KeyError as exc:
+        raise errors.InvalidCharacterProfileError(
+            f"Missing key in Character profile: {character}",
+            "E-3-2-24",
+        ) from exc
+    except errors.InvalidCharacterIdError as exc:
+        raise exc
+    except Exception as exc:
+        raise errors.InvalidCharacterProfileError(
+            f"Invalid Character Profile: {character}",
+            "E-3-2-25",
+        )
+
 
+def build_scene(scene: dict, characters: Union[CharacterIndex, Characters]) -> Scene:
+    """Creates a Scene from a single parsed frame dict of the model response."""
     try:
-        match_string = match_group.group(0).strip("```characters").strip()
-        lines = match_string.split("\n")
-        total_characters = int(re.search("[0-9]+", lines[0]).group(0))
-        characters = eval("".join(lines[1:]))
+        return Scene(
+            scene_id=scene["frame_id"],
+            prompt=scene["description"],
+            shot_type=get_shot_type(scene["shot_type"]),
+            camera_angle=scene.get("camera_angle", ""),
+            location=scene["location"],
+            character_expressions=map_character_ids(
+                scene["character_expressions"], characters
+            ),
+            director_tips=scene.get("director_tips", ""),
+            original_script_chunk=scene.get("original_script_chunk", ""),
+        )
+    except KeyError as exc:
+        raise errors.InvalidFrameBreakdownError(
+            f"Missing key in Frame breakdown: {scene}",
+            "E-3-2-29",
+        ) from exc
+    except errors.InvalidFrameBreakdownError as exc:
+        raise exc
     except Exception as exc:
+        raise errors.InvalidFrameBreakdownError(
+            f"Invalid Frame breakdown: {scene}",
+            "E-3-2-30",
+        )
+
+
+def _block_items(
+    model_response: str, name: str, missing_code: str, invalid_code: str
+) -> tuple[list, int]:
+    """Returns the items of a ```<name> block and its declared total."""
+    result = response_parser.parse_block(model_response, name)
+    if result is None:
         raise errors.ModelResponseParseError(
-            f"Faced an error while trying to parse character profiles.\nModel response: {model_response}",
-            "E-3-2-22",
-        ) from exc
+            f"No {name} found in model response.\nModel response: {model_response}",
+            missing_code,
+        )
+    if not result.complete:
+        if not result.items:
+            raise errors.ModelResponseParseError(
+                f"Faced an error while trying to parse {name}: {result.error}.\nModel response: {model_response}",
+                invalid_code,
+            ) from result.error
+        # Keep what was recovered; callers top up missing frames anyway.
+        LOGGER.warning(
+            f"Recovered {len(result.items)} {name} from a malformed block: {result.error}"
+        )
+    total = re.search("[0-9]+", result.header)
+    return result.items, int(total.group(0)) if total else len(result.items)
 
-    character_profiles = []
-    for character in characters:
-        try:
-            char_id = generate_character_id(character["name"])
-            if not char_id:
-                raise errors.InvalidCharacterIdError(
-                    f"Unable to generate a character-id.\nCharacter profile was: {character}",
-                    "E-3-2-23",
-                )
 
-            character_profiles.append(
-                Character(
-                    character_id=char_id,
-                    name=character["name"],
-                    age=str(character["age"]),
-                    gender=str(character["gender"]),
-                    description=character["description"],
-                )
-            )
-        except KeyError as exc:
-            raise errors.InvalidCharacterProfileError(
-                f"Missing key in Character profile: {character}",
-                "E-3-2-24",
-            ) from exc
-        except errors.InvalidCharacterIdError as exc:
-            raise exc
-        except Exception as exc:
-            raise errors.InvalidCharacterProfileError(
-                f"Invalid Character Profile: {character}",
-                "E-3-2-25",
-            )
+def parse_characters(model_response: str) -> CharacterIndex:
+    """Parses the model response to extract out character profiles.
+
+    The profiles are returned as a `CharacterIndex` (`.characters` holds the
+    list) so the same index is reused by every `parse_frames` call.
+    """
+    characters, _ = _block_items(model_response, "characters", "E-3-2-21", "E-3-2-22")
+
+    character_profiles = CharacterIndex()
+    for character in characters:
+        character_profiles.add(build_character(character))
 
     return character_profiles
 
 
-def parse_frames(model_response: str, characters: Characters) -> list[Scenes, int]:
+def parse_frames(
+    model_response: str, characters: Union[CharacterIndex, Characters]
+) -> list[Scenes, int]:
     """Parses the model response to extract out frame details."""
-    match_group = re.search("(```frames[^```]*```)", model_response)
-    if not match_group:
-        raise errors.ModelResponseParseError(
-            f"No frame breakdowns found in model response.\nModel response: {model_response}",
-            "E-3-2-27",
-        )
-    try:
-        match_string = match_group.group(0).strip("```frames").strip()
-        lines = match_string.split("\n")
-        total_frames = int(re.search("[0-9]+", lines[0]).group(0))
-        frames_dict = eval("".join(lines[1:]))
-    except Exception as exc:
-        raise errors.ModelResponseParseError(
-            f"Faced an error while trying to parse frame breakdown.\nModel response: {model_response}",
-            "E-3-2-28",
-        ) from exc
+    frames_dict, total_frames = _block_items(
+        model_response, "frames", "E-3-2-27", "E-3-2-28"
+    )
+    if not isinstance(characters, CharacterIndex):
+        characters = CharacterIndex(characters)
 
     frames = []
     for scene in frames_dict:
+        frames.append(build_scene(scene, characters))
+
+    return frames, total_frames
+
+
+def parse_shot_breakdown_json(
+    model_response: str, characters: CharacterIndex = None
+) -> tuple[CharacterIndex, Scenes, int]:
+    """Parses a JSON mode shot breakdown response.
+
+    When `characters` is given (continuation calls) the response's own
+    character list is ignored and frames are mapped onto the given profiles.
+    """
+    breakdown = response_parser.parse_json_object(model_response)
+    if characters is None:
+        characters = CharacterIndex(
+            [
+                build_character(character)
+                for character in breakdown.get("characters") or []
+            ]
+        )
+    frames = [build_scene(scene, characters) for scene in breakdown.get("frames") or []]
+    try:
+        total_frames = int(breakdown.get("total_frames") or len(frames))
+    except (TypeError, ValueError):
+        total_frames = len(frames)
+    return characters, frames, total_frames
+
+
+class ShotBreakdownStreamParser:
+    """Incrementally parses a streamed shot breakdown response.
+
+    Text is fed chunk by chunk as it arrives from the model. Every dict inside
+    the ```characters and ```frames blocks is parsed as soon as its closing
+    brace arrives, so scenes can be forwarded before the completion finishes.
+    `feed` returns a list of `(event, payload)` tuples:
+
+        ("characters", Characters)  once the characters block is closed
+        ("total_frames", int)       when the frames block header is read
+        ("scene", Scene)            for every parsed frame
+
+    Malformed items are skipped and recorded in `errors`.
+    """
+
+    FENCE = "```"
+    SECTIONS = ("characters", "frames")
+
+    def __init__(self, characters: Union[CharacterIndex, Characters] = None):
+        # Continuation parsers share the index of the first one.
+        if not isinstance(characters, CharacterIndex):
+            characters = CharacterIndex(characters)
+        self.characters = characters
+        self.scenes: Scenes = []
+        self.total_frames = 0
+        self.errors: list[errors.BaseCustomError] = []
+        self._buffer = ""
+        self._pos = 0
+        self._section = None
+        self._header_pending = False
+        self._depth = 0
+        self._quote = None
+        self._escaped = False
+        self._item_start = None
+        self._items: list[dict] = []
+
+    def _consume(self, upto: int):
+        self._buffer = self._buffer[upto:]
+        self._pos = 0
+        if self._item_start is not None:
+            self._item_start -= upto
+
+    def _find_section(self) -> bool:
+        idx = self._buffer.find(self.FENCE, self._pos)
+        if idx == -1:
+            # Keep a tail so a fence split across chunks is still found.
+            self._consume(max(0, len(self._buffer) - len(self.FENCE) - 16))
+            return False
+        line_end = self._buffer.find("\n", idx)
+        if line_end == -1:
+            self._consume(idx)
+            return False
+        name = self._buffer[idx + len(self.FENCE) : line_end].strip()
+        self._consume(line_end + 1)
+        if name in self.SECTIONS:
+            self._section = name
+            self._header_pending = True
+        return True
+
+    def _read_header(self, events: list) -> bool:
+        line_end = self._buffer.find("\n", self._pos)
+        if line_end == -1:
+            return False
+        total = re.search("[0-9]+", self._buffer[self._pos : line_end])
+        self._header_pending = False
+        if total is None:
+            # No count line; the list starts right away.
+            return True
+        if self._section == "frames":
+            self.total_frames = int(total.group(0))
+            events.append(("total_frames", self.total_frames))
+        self._consume(line_end + 1)
+        return True
+
+    def _emit_item(self, text: str, events: list):
         try:
-            frames.append(
-                Scene(
-                    scene_id=scene["frame_id"],
-                    prompt=scene["description"],
-                    shot_type=get_shot_type(scene["shot_type"]),
-                    camera_angle=scene.get("camera_angle", ""),
-                    location=scene["location"],
-                    character_expressions=map_character_ids(
-                        scene["character_expressions"], characters
-                    ),
-                    director_tips=scene.get("director_tips", ""),
-                    original_script_chunk=scene.get("original_script_chunk", ""),
+            item = response_parser.parse_literal(text)
+        except response_parser.LiteralSyntaxError:
+            self.errors.append(
+                errors.ModelResponseParseError(
+                    f"Unable to parse streamed {self._section} item: {text}",
+                    "E-3-2-37",
                 )
             )
-        except KeyError as exc:
-            raise errors.InvalidFrameBreakdownError(
-                f"Missing key in Frame breakdown: {scene}",
-                "E-3-2-29",
-            ) from exc
-        except errors.InvalidFrameBreakdownError as exc:
-            raise exc
-        except Exception as exc:
-            raise errors.InvalidFrameBreakdownError(
-                f"Invalid Frame breakdown: {scene}",
-                "E-3-2-30",
-            )
+            return
+        if self._section == "characters":
+            self._items.append(item)
+            return
+        try:
+            scene = build_scene(item, self.characters)
+        except errors.BaseCustomError as exc:
+            self.errors.append(exc)
+            return
+        self.scenes.append(scene)
+        events.append(("scene", scene))
+
+    def _close_section(self, events: list):
+        if self._section == "characters":
+            for item in self._items:
+                try:
+                    self.characters.add(build_character(item))
+                except errors.BaseCustomError as exc:
+                    self.errors.append(exc)
+            self._items = []
+            events.append(("characters", self.characters.characters))
+        self._section = None
+
+    def feed(self, text: str) -> list[tuple[str, object]]:
+        self._buffer += text
+        events = []
+        while self._pos < len(self._buffer):
+            if self._section is None:
+                if not self._find_section():
+                    break
+                continue
+            if self._header_pending:
+                if not self._read_header(events):
+                    break
+                continue
 
-    return frames, total_frames
+            char = self._buffer[self._pos]
+            if self._quote:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == self._quote:
+                    self._quote = None
+            elif char in "\"'" and self._depth > 0:
+                self._quote = char
+            elif char == "{":
+                if self._depth == 0:
+                    self._item_start = self._pos
+                self._depth += 1
+            elif char == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit_item(
+                        self._buffer[self._item_start : self._pos + 1], events
+                    )
+                    self._item_start = None
+                    self._consume(self._pos + 1)
+                    continue
+            elif char == "`" and self._depth == 0:
+                if len(self._buffer) - self._pos < len(self.FENCE):
+                    break
+                if self._buffer.startswith(self.FENCE, self._pos):
+                    self._consume(self._pos + len(self.FENCE))
+                    self._close_section(events)
+                    continue
+            self._pos += 1
+        return events
+
+    def close(self) -> list[tuple[str, object]]:
+        """Flushes a section left open by a truncated response."""
+        events = []
+        if self._section is not None:
+            self._close_section(events)
+        return events
 
 
 def split_script_fountain(filename):
@@ -167,7 +474,7 @@ def split_script_fountain(filename):
 
     Returns:
     - list of dicts: List of scenes extracted from the Fountain script file. Each scene is represented as a dictionary with keys:
-        - "id" (int): The ID of the scene.
+        - "idx" (int): The ID of the scene.
         - "heading" (str): The heading of the scene.
         - "text" (str): Text content of the scene including scene heading and dialogue/action.
     """
@@ -191,7 +498,7 @@ def split_script_fountain(filename):
                     if current_scene_heading and current_scene_lines:
                         scenes.append(
                             {
-                                "id": scene_id,
+                                "idx": scene_id,
                                 "heading": current_scene_heading,
                                 "text": f"{current_scene_heading}\n"
                                 + "\n".join(current_scene_lines),
@@ -237,66 +544,107 @@ def split_script_fountain(filename):
     return scenes
 
 
-def split_script(filename, file_path):
+def _extract_pdf_pages(filename: str, page_numbers: list[int]) -> list[str]:
+    """Extracts the text of the given pages; runs inside the splitter's process pool."""
+    with pdfplumber.open(filename) as pdf:
+        return [pdf.pages[number].extract_text() or "" for number in page_numbers]
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _PDF_POOL
+    with _PDF_POOL_LOCK:
+        if _PDF_POOL is None:
+            # Spawned, not forked: the server process holds CUDA state and models.
+            _PDF_POOL = ProcessPoolExecutor(
+                max_workers=constants.ScriptSplitWorkers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _PDF_POOL
+
+
+def iter_pdf_lines(filename: str) -> Iterator[str]:
+    """Yields the text lines of a PDF in page order.
+
+    Pages are extracted in chunks on a process pool; results are consumed in
+    order so lines stream out as soon as the leading chunk is done.
     """
-    Parses a script file (PDF or text) and extracts scenes.
+    with pdfplumber.open(filename) as pdf:
+        num_pages = len(pdf.pages)
+        if num_pages <= PDF_PAGES_PER_TASK or constants.ScriptSplitWorkers <= 1:
+            for page in pdf.pages:
+                yield from (page.extract_text() or "").split("\n")
+            return
+
+    chunks = [
+        list(range(start, min(start + PDF_PAGES_PER_TASK, num_pages)))
+        for start in range(0, num_pages, PDF_PAGES_PER_TASK)
+    ]
+    pool = _get_pdf_pool()
+    futures = [pool.submit(_extract_pdf_pages, filename, chunk) for chunk in chunks]
+    try:
+        for future in futures:
+            for text in future.result():
+                yield from text.split("\n")
+    finally:
+        for future in futures:
+            future.cancel()
 
-    Args:
-    - filename (str): The path to the script file.
-    - file_path (str): The type of file, either ".pdf" or ".txt".
 
-    Returns:
-    - list of dicts: List of scenes extracted from the script file. Each scene is represented as a dictionary with keys:
-        - "idx" (int): Index of the scene.
-        - "heading" (str): The heading of the scene.
-        - "text" (str): Text content of the scene including scene heading and dialogue/action.
+def iter_text_lines(filename: str) -> Iterator[str]:
+    with open(filename, "r", encoding="utf-8") as file:
+        yield from file
+
+
+def iter_scenes(lines: Iterable[str]) -> Iterator[dict]:
+    """Groups script lines into scenes, yielding each one as soon as it is complete.
+
+    A scene starts at every line containing INT or EXT; "CONTINUED" markers
+    and blank lines are skipped.
     """
-    scenes = []
     current_scene_lines = []  # List to store current scene's lines
     current_scene_heading = None  # Current scene heading
     current_idx = 0  # Scene index
 
-    try:
-        if file_path.endswith(".pdf"):
-            with pdfplumber.open(filename) as pdf:
-                entire_text = ""
-                for page in pdf.pages:
-                    entire_text += page.extract_text() + "\n"
-            lines = entire_text.split("\n")
+    for line in lines:
+        line = line.strip()
+        if not line or "CONTINUED" in line:
+            continue
+
+        elif "INT" in line or "EXT" in line:  # Scene Heading
+            if current_scene_lines:  # Yield the previous scene if exists
+                text = f"{current_scene_heading}\n" + "\n".join(current_scene_lines)
+                yield {
+                    "idx": current_idx,
+                    "heading": current_scene_heading,
+                    "text": text,
+                }
+                current_scene_lines = []  # Reset current scene lines
+
+            # Process the new scene heading
+            current_scene_heading = line
+            current_idx += 1  # Increment scene index
+
         else:
-            with open(filename, "r", encoding="utf-8") as file:
-                lines = file.readlines()
+            if current_scene_heading:
+                current_scene_lines.append(line)
 
-        for line in lines:
-            line = line.strip()
-            if not line or "CONTINUED" in line:
-                continue
+    if current_scene_lines and current_scene_heading:
+        text = f"{current_scene_heading}\n" + "\n".join(current_scene_lines)
+        yield {"idx": current_idx, "heading": current_scene_heading, "text": text}
 
-            elif "INT" in line or "EXT" in line:  # Scene Heading
-                if current_scene_lines:  # Add the previous scene if exists
-                    text = f"{current_scene_heading}\n" + "\n".join(current_scene_lines)
-                    scenes.append(
-                        {
-                            "idx": current_idx,
-                            "heading": current_scene_heading,
-                            "text": text,
-                        }
-                    )
-                    current_scene_lines = []  # Reset current scene lines
-
-                # Process the new scene heading
-                current_scene_heading = line
-                current_idx += 1  # Increment scene index
-
-            else:
-                if current_scene_heading:
-                    current_scene_lines.append(line)
-        if current_scene_lines and current_scene_heading:
-            text = f"{current_scene_heading}\n" + "\n".join(current_scene_lines)
-            scenes.append(
-                {"idx": current_idx, "heading": current_scene_heading, "text": text}
-            )
 
+def iter_split_script(filename: str, file_path: str) -> Iterator[dict]:
+    """Streaming variant of `split_script`; yields scenes as they are found.
+
+    `filename` is read in place (e.g. the request's temp file), it is never
+    copied or loaded whole into memory.
+    """
+    try:
+        if file_path.endswith(".pdf"):
+            lines = iter_pdf_lines(filename)
+        else:
+            lines = iter_text_lines(filename)
+        yield from iter_scenes(lines)
     except FileNotFoundError as exc:
         raise errors.FileNotFoundError(
             f"File '{filename}' not found or cannot be accessed.", "E-3-1-10"
@@ -306,4 +654,19 @@ def split_script(filename, file_path):
             f"An unknown error occurred while processing '{filename}'.", "E-3-1-09"
         ) from exc
 
-    return scenes
+
+def split_script(filename, file_path):
+    """
+    Parses a script file (PDF or text) and extracts scenes.
+
+    Args:
+    - filename (str): The path to the script file.
+    - file_path (str): The type of file, either ".pdf" or ".txt".
+
+    Returns:
+    - list of dicts: List of scenes extracted from the script file. Each scene is represented as a dictionary with keys:
+        - "idx" (int): Index of the scene.
+        - "heading" (str): The heading of the scene.
+        - "text" (str): Text content of the scene including scene heading and dialogue/action.
+    """
+    return list(iter_split_script(filename, file_path))
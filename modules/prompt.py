@@ -1,4 +1,6 @@
 """Library for generating prompts."""
+import functools
+import os
 import re
 from typing import Mapping
 
@@ -9,9 +11,44 @@ from modules import schema
 from presets import extract_shot_breakdown
 from presets import generate_character_profile
 from presets import generate_frame
+from utils import constants
 
 PromptDict = Mapping[str, str]
 
+# Every preset template, compiled once at import.
+TEMPLATE_SOURCES = {
+    "extract_shot_breakdown.preamble": extract_shot_breakdown.PREAMBLE,
+    "extract_shot_breakdown.user_script": extract_shot_breakdown.USER_SCRIPT,
+    "extract_shot_breakdown.additional_info": extract_shot_breakdown.SCENE_ADDITIONAL_INFO,
+    "generate_frame.storyboard_preamble": generate_frame.STORYBOARD_PREAMBLE,
+    "generate_frame.comic_preamble": generate_frame.COMIC_PREAMBLE,
+    "generate_character_profile.preamble": generate_character_profile.PREAMBLE,
+}
+
+
+def _bytecode_cache():
+    if not constants.PromptTemplateCacheDir:
+        return None
+    os.makedirs(constants.PromptTemplateCacheDir, exist_ok=True)
+    return jinja2.FileSystemBytecodeCache(constants.PromptTemplateCacheDir)
+
+
+TEMPLATE_ENV = jinja2.Environment(
+    loader=jinja2.DictLoader(TEMPLATE_SOURCES), bytecode_cache=_bytecode_cache()
+)
+TEMPLATES = {name: TEMPLATE_ENV.get_template(name) for name in TEMPLATE_SOURCES}
+
+
+def render(name: str, **context) -> str:
+    """Renders a precompiled preset template."""
+    return TEMPLATES[name].render(context)
+
+
+@functools.lru_cache(maxsize=256)
+def render_cached(name: str, **context) -> str:
+    """Like `render`, memoized; only for contexts with a handful of values."""
+    return render(name, **context)
+
 
 def prepare_prompt_to_extract_shot_breakdown(
     request: schema.ExtractShotBreakdownRequest,
@@ -20,37 +57,34 @@ def prepare_prompt_to_extract_shot_breakdown(
 
     # Generate the user facing prompt involving details like the actual script,
     # shoot location, genre, etc.
-    user_script = jinja2.Template(source=extract_shot_breakdown.USER_SCRIPT).render(
-        {
-            "SCRIPT": request.script,
-            "ADDITIONAL_INFO": jinja2.Template(
-                source=extract_shot_breakdown.SCENE_ADDITIONAL_INFO
-            ).render(
-                {
-                    "LOCATION": request.location,
-                    "FRAMES": request.num_frames,
-                    "GENRE": request.genre,
-                }
-            ),
-        }
+    user_script = render(
+        "extract_shot_breakdown.user_script",
+        SCRIPT=request.script,
+        ADDITIONAL_INFO=render(
+            "extract_shot_breakdown.additional_info",
+            LOCATION=request.location,
+            FRAMES=request.num_frames,
+            GENRE=request.genre,
+        ),
     )
 
     # Populate the preamble part to be supplied to the model along with the
     # user script.
     #
     # Note: We explicitly pass an example output format for consistency reasons.
-    preamble = jinja2.Template(source=extract_shot_breakdown.PREAMBLE).render(
-        {"sample_output": extract_shot_breakdown.SAMPLE_OUTPUT}
+    preamble = render_cached(
+        "extract_shot_breakdown.preamble",
+        sample_output=extract_shot_breakdown.JSON_SAMPLE_OUTPUT
+        if request.json_mode
+        else extract_shot_breakdown.SAMPLE_OUTPUT,
     )
     return {"system": preamble, "user": user_script}
 
 
 def prepare_prompt_for_comic(request: schema.ExtractShotBreakdownRequest) -> PromptDict:
     """Create a prompt for comic generation using a text2image model."""
-    user_script = jinja2.Template(extract_shot_breakdown.COMIC_PREAMBLE).render(
-        {"sample_output": extract_shot_breakdown.SAMPLE_OUTPUT}
-    )
-    return {"system": user_script, "user": request.script}
+    preamble = render_cached("generate_frame.comic_preamble")
+    return {"system": preamble, "user": request.script}
 
 
 def prepare_prompt_to_generate_frame(
@@ -61,8 +95,9 @@ def prepare_prompt_to_generate_frame(
     visual_style = request.parameters.visual_style
 
     # Render the preamble template based on the visual style.
-    preamble = jinja2.Template(generate_frame.STORYBOARD_PREAMBLE).render(
-        {"SAMPLE_PROMPT": generate_frame.styles[visual_style]["SAMPLE"]}
+    preamble = render_cached(
+        "generate_frame.storyboard_preamble",
+        SAMPLE_PROMPT=generate_frame.styles[visual_style]["SAMPLE"],
     )
     user_script = f"The scene details are as below:\n{request.scene}\n"
     # user_script += f"The associated character profiles are:\n{request.characters}"
@@ -76,8 +111,9 @@ def prepare_prompt_to_generate_comic(
     """Create a prompt for generating frame images using text2image models."""
 
     visual_style = request.parameters.visual_style
-    preamble = jinja2.Template(generate_frame.COMIC_PREAMBLE).render(
-        {"SAMPLE_PROMPT": generate_frame.styles[visual_style]["SAMPLE"]}
+    preamble = render_cached(
+        "generate_frame.comic_preamble",
+        SAMPLE_PROMPT=generate_frame.styles[visual_style]["SAMPLE"],
     )
     user_script = f"The panels details are as below:\n{request.scene}\n"
     # user_script += f"The associated character profiles are:\n{request.characters}"
@@ -90,7 +126,7 @@ def prepare_prompt_to_generate_character_profile(
     """Create a prompt for generating character profiles images using text2image models."""
 
     # Populate the preamble with a sample prompt output based on the frame visual style.
-    preamble = jinja2.Template(source=generate_character_profile.PREAMBLE).render()
+    preamble = render_cached("generate_character_profile.preamble")
     user_script = (
         f"The details about the person are as below:\n{str(request.character)}"
     )
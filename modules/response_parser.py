@@ -0,0 +1,231 @@
+"""Safe single-pass parser for the structured blocks in LLM responses.
+
+Model responses carry Python/JSON style literals (lists of dicts) inside
+fenced blocks such as ```characters and ```frames. This module tokenizes
+them in one pass and builds the values with a small recursive descent parser
+instead of `eval`. Well formed blocks take a fast path through
+`ast.literal_eval`, which never executes code. It is lenient with the usual model quirks (trailing
+commas, tuples, single quotes, `true`/`null`, empty values such as
+`"age": ,`) and recovers every well formed item that precedes a syntax error.
+"""
+import ast
+import json
+import re
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Optional
+
+from modules import errors
+
+TOKEN_RE = re.compile(
+    r"""
+    (?P<ws>\s+)
+    |(?P<str>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')
+    |(?P<num>-?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+    |(?P<name>[A-Za-z_][A-Za-z0-9_]*)
+    |(?P<punct>[{}\[\](),:])
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+ESCAPE_RE = re.compile(r"\\(u[0-9a-fA-F]{4}|.)", re.DOTALL)
+ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "/": "/"}
+NAMES = {
+    "True": True,
+    "true": True,
+    "False": False,
+    "false": False,
+    "None": None,
+    "null": None,
+}
+CLOSING = {"{": "}", "[": "]", "(": ")"}
+FENCE = "```"
+
+
+class LiteralSyntaxError(ValueError):
+    """Raised when the literal can't be parsed at `position`."""
+
+    def __init__(self, message: str, position: int):
+        super().__init__(f"{message} at offset {position}")
+        self.position = position
+
+
+@dataclass
+class ParseResult:
+    """Items recovered from a list literal and the error that stopped parsing."""
+
+    items: list = field(default_factory=list)
+    header: str = ""
+    error: Optional[LiteralSyntaxError] = None
+    complete: bool = True
+
+
+def _unescape(match: re.Match) -> str:
+    escaped = match.group(1)
+    if escaped[0] == "u" and len(escaped) == 5:
+        return chr(int(escaped[1:], 16))
+    return ESCAPES.get(escaped, escaped)
+
+
+def _decode_string(raw: str) -> str:
+    # Raw newlines inside strings are dropped, matching the legacy line joining.
+    body = raw[1:-1].replace("\n", "")
+    return ESCAPE_RE.sub(_unescape, body) if "\\" in body else body
+
+
+class _Parser:
+    def __init__(self, text: str, pos: int = 0):
+        self.text = text
+        self.pos = pos
+        self.kind = None
+        self.value = None
+        self.start = pos
+        self.advance()
+
+    def advance(self):
+        """Moves to the next non whitespace token."""
+        text = self.text
+        while True:
+            self.start = self.pos
+            if self.pos >= len(text):
+                self.kind, self.value = "eof", None
+                return
+            match = TOKEN_RE.match(text, self.pos)
+            if match is None:
+                raise LiteralSyntaxError(f"Unexpected {text[self.pos]!r}", self.pos)
+            self.pos = match.end()
+            if match.lastgroup != "ws":
+                self.kind, self.value = match.lastgroup, match.group()
+                return
+
+    def expect(self, punct: str):
+        if self.kind != "punct" or self.value != punct:
+            raise LiteralSyntaxError(f"Expected {punct!r}", self.start)
+        self.advance()
+
+    def at(self, punct: str) -> bool:
+        return self.kind == "punct" and self.value == punct
+
+    def parse_value(self) -> Any:
+        kind, value = self.kind, self.value
+        if kind == "str":
+            self.advance()
+            return _decode_string(value)
+        if kind == "num":
+            self.advance()
+            return float(value) if any(c in value for c in ".eE") else int(value)
+        if kind == "name":
+            if value not in NAMES:
+                raise LiteralSyntaxError(f"Unknown name {value!r}", self.start)
+            self.advance()
+            return NAMES[value]
+        if kind == "punct" and value == "{":
+            return self.parse_dict()
+        if kind == "punct" and value in "[(":
+            return self.parse_sequence()
+        raise LiteralSyntaxError(f"Unexpected token {value!r}", self.start)
+
+    def parse_dict(self) -> dict:
+        self.expect("{")
+        result = {}
+        while not self.at("}"):
+            key = self.parse_value()
+            self.expect(":")
+            # Models sometimes leave a value empty, e.g. `"age": ,`.
+            result[key] = None if self.at(",") or self.at("}") else self.parse_value()
+            if not self.at("}"):
+                self.expect(",")
+        self.advance()
+        return result
+
+    def parse_sequence(self):
+        opening = self.value
+        closing = CLOSING[opening]
+        self.advance()
+        items = []
+        while not self.at(closing):
+            items.append(self.parse_value())
+            if not self.at(closing):
+                self.expect(",")
+        self.advance()
+        return tuple(items) if opening == "(" else items
+
+
+def parse_literal(text: str) -> Any:
+    """Parses a single Python/JSON literal; raises LiteralSyntaxError."""
+    parser = _Parser(text)
+    value = parser.parse_value()
+    if parser.kind != "eof":
+        raise LiteralSyntaxError("Trailing data", parser.start)
+    return value
+
+
+def parse_list(text: str, pos: int = 0) -> ParseResult:
+    """Parses a list literal starting at `pos`, keeping every item before an error."""
+    result = ParseResult()
+    try:
+        parser = _Parser(text, pos)
+        if not parser.at("["):
+            raise LiteralSyntaxError("Expected '['", parser.start)
+        parser.advance()
+        while not parser.at("]"):
+            if parser.kind == "eof":
+                raise LiteralSyntaxError("Unterminated list", parser.start)
+            result.items.append(parser.parse_value())
+            if not parser.at("]"):
+                parser.expect(",")
+    except LiteralSyntaxError as exc:
+        result.error = exc
+        result.complete = False
+    return result
+
+
+def parse_block(model_response: str, name: str) -> Optional[ParseResult]:
+    """Parses the list in a ```<name> block; returns None if there is no block.
+
+    The first line of the block (e.g. `total: 3`) is returned as `header`.
+    """
+    start = model_response.find(f"{FENCE}{name}")
+    if start == -1:
+        return None
+    header_start = model_response.find("\n", start)
+    if header_start == -1:
+        return ParseResult(complete=False)
+    list_start = model_response.find("[", header_start)
+    if list_start == -1:
+        return ParseResult(complete=False)
+    header = model_response[header_start:list_start].strip()
+    list_end = model_response.find(FENCE, list_start)
+    if list_end != -1:
+        try:
+            items = ast.literal_eval(
+                model_response[list_start:list_end].replace("\n", "")
+            )
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            items = None
+        if isinstance(items, list):
+            return ParseResult(items=items, header=header)
+    result = parse_list(model_response, list_start)
+    result.header = header
+    return result
+
+
+def parse_json_object(model_response: str) -> dict:
+    """Parses a `response_format={"type": "json_object"}` completion."""
+    try:
+        value = json.loads(model_response)
+    except json.JSONDecodeError:
+        # Fall back to the lenient parser for almost-JSON output.
+        try:
+            value = parse_literal(model_response)
+        except LiteralSyntaxError as exc:
+            raise errors.ModelResponseParseError(
+                f"Model response is not a valid JSON object.\nModel response: {model_response}",
+                "E-3-2-38",
+            ) from exc
+    if not isinstance(value, dict):
+        raise errors.ModelResponseParseError(
+            f"Expected a JSON object in model response.\nModel response: {model_response}",
+            "E-3-2-38",
+        )
+    return value
@@ -0,0 +1,288 @@
+"""Single GPU worker that serializes and coalesces image generation jobs."""
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Callable
+from typing import Hashable
+
+from modules import errors
+from modules import schema
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass(order=True)
+class GenerationJob:
+    """A queued text2image request; ordered by (priority, sequence)."""
+
+    priority: int
+    sequence: int
+    prompt: str = field(compare=False)
+    params: schema.ImageGenParameters = field(compare=False)
+    use_ip_adapter: bool = field(compare=False, default=False)
+    character_images: list = field(compare=False, default_factory=list)
+    character_keys: tuple = field(compare=False, default=None)
+    # (width, height) the job is generated at, e.g. its resolution bucket.
+    size: tuple = field(compare=False, default=None)
+    deadline: float = field(compare=False, default=None)
+    on_step: Callable[[int, int], None] = field(compare=False, default=None)
+    enqueued_at: float = field(compare=False, default_factory=time.monotonic)
+    future: Future = field(compare=False, default_factory=Future)
+
+    def batch_key(self) -> Hashable:
+        """Jobs with equal keys can share a single pipeline call."""
+        if self.use_ip_adapter and self.character_keys is None:
+            # Without a stable identity for the reference images we can't tell
+            # whether two jobs condition on the same characters.
+            return ("unique", self.sequence)
+        return (
+            self.size or (self.params.width, self.params.height),
+            self.params.num_inference_steps,
+            self.params.guidance_scale,
+            self.params.residual_cache_threshold,
+            self.use_ip_adapter,
+            self.character_keys if self.use_ip_adapter else None,
+            self.params.ip_adapter_scale if self.use_ip_adapter else None,
+        )
+
+
+class GpuScheduler:
+    """Owns the GPU: a single worker thread drains a bounded priority queue.
+
+    Compatible jobs (same size, steps, guidance and adapter inputs) waiting in
+    the queue are coalesced into one `predict_batch` call. Exceptions raised by
+    the model are delivered to the affected futures and never stop the worker.
+    `size_fn` maps a requested (width, height) to the size it is generated at,
+    so jobs snapping to the same resolution bucket can share a batch.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        max_queue_size: int = 64,
+        max_batch_size: int = 4,
+        metrics_window: int = 256,
+        size_fn: Callable[[int, int], tuple[int, int]] = None,
+    ):
+        self.model = model
+        self.size_fn = size_fn
+        self.max_batch_size = max_batch_size
+        self._queue: queue.PriorityQueue = queue.PriorityQueue(maxsize=max_queue_size)
+        self._sequence = itertools.count()
+        self._stopped = threading.Event()
+
+        self._metrics_lock = threading.Lock()
+        self._wait_times = deque(maxlen=metrics_window)
+        self._batch_sizes = deque(maxlen=metrics_window)
+        self._counters = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "expired": 0,
+            "rejected": 0,
+            "batches": 0,
+        }
+
+        self._worker = threading.Thread(
+            target=self._run, name="gpu-scheduler", daemon=True
+        )
+        self._worker.start()
+
+    def _count(self, name: str, value: int = 1):
+        with self._metrics_lock:
+            self._counters[name] += value
+
+    def submit(
+        self,
+        prompt: str,
+        params: schema.ImageGenParameters,
+        use_ip_adapter: bool = False,
+        character_images: list = [],
+        character_keys: list[str] = None,
+        priority: int = 0,
+        timeout: float = None,
+        on_step: Callable[[int, int], None] = None,
+    ) -> Future:
+        """Queues a generation job and returns a future resolving to the image.
+
+        Lower `priority` values run first. `character_keys` (ETag-qualified S3
+        keys of the reference images) allow IP-Adapter jobs to be batched
+        together.
+        `on_step` receives (completed_steps, total_steps) while the job runs.
+        """
+        job = GenerationJob(
+            priority=priority,
+            sequence=next(self._sequence),
+            prompt=prompt,
+            params=params,
+            use_ip_adapter=use_ip_adapter,
+            character_images=character_images,
+            character_keys=tuple(character_keys) if character_keys else None,
+            size=self.size_fn(params.width, params.height) if self.size_fn else None,
+            deadline=time.monotonic() + timeout if timeout else None,
+            on_step=on_step,
+        )
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full as exc:
+            self._count("rejected")
+            raise errors.SchedulerQueueFullError(
+                f"GPU job queue is full ({self._queue.maxsize} jobs). Retry later.",
+                "E-4-5-01",
+            ) from exc
+        self._count("submitted")
+        return job.future
+
+    def predict(
+        self,
+        prompt: str,
+        params: schema.ImageGenParameters,
+        use_ip_adapter: bool = False,
+        character_images: list = [],
+        character_keys: list[str] = None,
+        priority: int = 0,
+        timeout: float = None,
+        on_step: Callable[[int, int], None] = None,
+    ):
+        """Blocking variant of `submit` with the same signature as `FluxModel.predict`."""
+        future = self.submit(
+            prompt,
+            params,
+            use_ip_adapter=use_ip_adapter,
+            character_images=character_images,
+            character_keys=character_keys,
+            priority=priority,
+            timeout=timeout,
+            on_step=on_step,
+        )
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError as exc:
+            future.cancel()
+            raise errors.DeadlineExceededError(
+                f"Image generation didn't finish within {timeout} seconds.",
+                "E-4-5-02",
+            ) from exc
+        except CancelledError as exc:
+            raise errors.JobCancelledError(
+                "Image generation was cancelled before it ran.", "E-4-5-03"
+            ) from exc
+
+    def _take_batch(self, first: GenerationJob) -> list[GenerationJob]:
+        """Removes queued jobs compatible with `first` without reordering the rest."""
+        key = first.batch_key()
+        with self._queue.mutex:
+            pending = self._queue.queue
+            compatible = sorted(job for job in pending if job.batch_key() == key)
+            taken = compatible[: self.max_batch_size - 1]
+            if taken:
+                taken_ids = {id(job) for job in taken}
+                pending[:] = [job for job in pending if id(job) not in taken_ids]
+                heapq.heapify(pending)
+                self._queue.not_full.notify(len(taken))
+        return [first] + taken
+
+    def _is_runnable(self, job: GenerationJob, now: float) -> bool:
+        if not job.future.set_running_or_notify_cancel():
+            self._count("cancelled")
+            return False
+        if job.deadline is not None and now > job.deadline:
+            self._count("expired")
+            job.future.set_exception(
+                errors.DeadlineExceededError(
+                    f"Job expired after waiting {now - job.enqueued_at:.2f} seconds in queue.",
+                    "E-4-5-02",
+                )
+            )
+            return False
+        return True
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            now = time.monotonic()
+            batch = [
+                job for job in self._take_batch(first) if self._is_runnable(job, now)
+            ]
+            if not batch:
+                continue
+
+            with self._metrics_lock:
+                self._wait_times.extend(now - job.enqueued_at for job in batch)
+                self._batch_sizes.append(len(batch))
+                self._counters["batches"] += 1
+
+            step_callbacks = [job.on_step for job in batch if job.on_step]
+
+            def on_step(step, total):
+                for callback in step_callbacks:
+                    try:
+                        callback(step, total)
+                    except Exception as exc:
+                        LOGGER.warning(f"Progress callback failed: {exc}")
+
+            try:
+                images = self.model.predict_batch(
+                    prompts=[job.prompt for job in batch],
+                    params=batch[0].params,
+                    use_ip_adapter=batch[0].use_ip_adapter,
+                    character_images=batch[0].character_images,
+                    seeds=[job.params.seed for job in batch],
+                    negative_prompts=[job.params.negative_prompt for job in batch],
+                    character_keys=batch[0].character_keys,
+                    on_step=on_step if step_callbacks else None,
+                    sizes=[(job.params.width, job.params.height) for job in batch],
+                )
+                for job, image in zip(batch, images):
+                    job.future.set_result(image)
+                self._count("completed", len(batch))
+            except (Exception, errors.BaseCustomError) as exc:
+                LOGGER.error(f"GPU batch of {len(batch)} job(s) failed: {exc}")
+                for job in batch:
+                    job.future.set_exception(exc)
+                self._count("failed", len(batch))
+
+    def metrics(self) -> dict:
+        """Snapshot of queue depth, recent wait times and batch sizes."""
+        with self._metrics_lock:
+            wait_times = sorted(self._wait_times)
+            batch_sizes = list(self._batch_sizes)
+            counters = dict(self._counters)
+
+        def percentile(values, pct):
+            if not values:
+                return 0.0
+            return values[min(len(values) - 1, int(len(values) * pct))]
+
+        return {
+            "queue_depth": self._queue.qsize(),
+            "wait_time_seconds": {
+                "p50": percentile(wait_times, 0.5),
+                "p95": percentile(wait_times, 0.95),
+                "max": wait_times[-1] if wait_times else 0.0,
+            },
+            "batch_size": {
+                "mean": sum(batch_sizes) / len(batch_sizes) if batch_sizes else 0.0,
+                "max": max(batch_sizes, default=0),
+            },
+            **counters,
+        }
+
+    def shutdown(self):
+        self._stopped.set()
+        self._worker.join()
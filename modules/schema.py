@@ -3,6 +3,7 @@ import enum
 from typing import List
 
 from pydantic import BaseModel
+from pydantic import conint
 
 Enum = enum.Enum
 
@@ -61,6 +62,9 @@ class ExtractShotBreakdownRequest(BaseModel):
     location: str = ""
     num_frames: int = 0
     genre: str = ""
+    # Ask the model for a JSON object (response_format=json_object) instead of
+    # fenced Python literals.
+    json_mode: bool = False
 
 
 class Gender(str, Enum):
@@ -99,6 +103,22 @@ class ExtractShotBreakdownResponse(BaseModel):
     characters: list[Character]
 
 
+class ImageOutputFormat(str, Enum):
+    JPEG = "JPEG"
+    WEBP = "WEBP"
+    AVIF = "AVIF"
+    PNG = "PNG"
+
+
+class ImageOutputOptions(BaseModel):
+    # None keeps the endpoint's default (JPEG, or PNG for inpainting).
+    format: ImageOutputFormat = None
+    quality: conint(ge=1, le=100) = 75  # JPEG/WebP/AVIF quality.
+    png_compress_level: conint(ge=0, le=9) = 6  # 0 (fastest) - 9 (smallest).
+    # Longest side of an additional low-res preview; 0 disables it.
+    preview_size: int = 0
+
+
 class ImageGenParameters(BaseModel):
     positive_prompt: str = ""
     negative_prompt: str = ""
@@ -110,6 +130,12 @@ class ImageGenParameters(BaseModel):
     num_inference_steps: int = 15
     guidance_scale: float = 7.5
     seed: int = None
+    ip_adapter_scale: float = 0.5
+    # Skip the Flux transformer past its first block on steps where that
+    # block's residual changed less than this (relative); 0 disables it.
+    # Around 0.1 roughly halves the denoising time.
+    residual_cache_threshold: float = 0.0
+    output: ImageOutputOptions = ImageOutputOptions()
 
 
 class ImageGenRequest(BaseModel):
@@ -120,10 +146,19 @@ class ImageGenRequest(BaseModel):
     parameters: ImageGenParameters
 
 
+class ResidualCacheStats(BaseModel):
+    threshold: float
+    steps: int  # Transformer calls, i.e. denoising steps.
+    skipped_steps: int
+
+
 class ImageGenResult(BaseModel):
     prompt: str
     data: str  # base64 encoded Image
     time_taken: str
+    media_type: str = "image/jpeg"
+    preview: str = ""  # base64 encoded low-res preview, if requested.
+    residual_cache: ResidualCacheStats = None
 
 
 class GenerateSceneRequest(BaseModel):
@@ -138,6 +173,21 @@ class GenerateSceneResponse(BaseModel):
     result: ImageGenResult
 
 
+class GenerateStoryboardRequest(BaseModel):
+    breakdown: ExtractShotBreakdownResponse
+    # character_id -> path of the character image stored inside S3 bucket.
+    character_images: dict[str, str] = {}
+    use_refiner: bool = True
+    parameters: ImageGenParameters
+
+
+class StoryboardFrameResult(BaseModel):
+    scene_id: str
+    description: str = ""
+    result: ImageGenResult = None
+    error: str = ""
+
+
 class CharacterProfileRequest(BaseModel):
     character: Character
     use_refiner: bool = True
@@ -186,12 +236,17 @@ class GenerateCharacterPortrait(BaseModel):
 
 class ExtractScenesRequest(BaseModel):
     filename_url: str
+    # Keep the ids of scenes unchanged since the last split of this url and
+    # flag the rest with `changed`.
+    incremental: bool = False
 
 
 class Frame(BaseModel):
     idx: int
     heading: str
     text: str
+    text_hash: str = ""
+    changed: bool = True
 
 
 class ExtractScenesResponse(BaseModel):
@@ -219,3 +274,35 @@ class FrameGenerationRequest(BaseModel):
 class FrameGenerationResponse(BaseModel):
     prompt: str
     image: str
+    media_type: str = "image/jpeg"
+    preview: str = ""
+    residual_cache: ResidualCacheStats = None
+
+
+class JobStatus(str, Enum):
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    SUCCEEDED = "SUCCEEDED"
+    FAILED = "FAILED"
+
+
+class JobProgress(BaseModel):
+    step: int = 0
+    total_steps: int = 0
+
+
+class JobSubmissionResponse(BaseModel):
+    job_id: str
+    status: JobStatus
+
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: JobStatus
+    progress: JobProgress = JobProgress()
+    result: dict = None
+    error: str = ""
+    callback_url: str = ""
+    created_at: float
+    updated_at: float
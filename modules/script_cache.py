@@ -0,0 +1,162 @@
+"""Cache of split scripts keyed by the S3 object revision."""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+Scenes = list[dict]
+
+
+def scene_hash(scene: dict) -> str:
+    return hashlib.sha256(scene["text"].encode("utf-8")).hexdigest()[:16]
+
+
+def scene_idx(scene: dict) -> int:
+    # Scenes cached before the Fountain splitter emitted `idx` carry an `id`.
+    return scene["idx"] if "idx" in scene else scene["id"]
+
+
+def reconcile(previous: Scenes, scenes: Scenes) -> Scenes:
+    """Carries scene ids over from the previous revision of a script.
+
+    Scenes whose text is unchanged keep their previous `idx` and are marked
+    `changed=False`; new or edited scenes get fresh ids after the largest one
+    used so far, so ids stay stable for downstream consumers.
+    """
+    unchanged: dict[str, list[int]] = {}
+    for scene in previous:
+        unchanged.setdefault(scene["text_hash"], []).append(scene_idx(scene))
+    next_idx = max((scene_idx(scene) for scene in previous), default=0) + 1
+
+    reconciled = []
+    for scene in scenes:
+        ids = unchanged.get(scene["text_hash"])
+        if ids:
+            reconciled.append({**scene, "idx": ids.pop(0), "changed": False})
+        else:
+            reconciled.append({**scene, "idx": next_idx, "changed": True})
+            next_idx += 1
+    return reconciled
+
+
+class ScriptCache:
+    """LRU of split scripts with an optional on-disk tier.
+
+    Entries are keyed by the script url and its revision (S3 ETag or content
+    hash). For incremental splitting the last result served per url is kept as
+    a baseline so the next revision can be reconciled against it. On disk both
+    kinds are stored under their own filename prefix and pruned separately, so
+    churning revisions can't evict the baselines.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 128,
+        cache_dir: Optional[str] = None,
+        max_disk_entries: int = 4096,
+    ):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.max_disk_entries = max_disk_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, Scenes] = OrderedDict()
+        self._baselines: OrderedDict[str, tuple[str, Scenes]] = OrderedDict()
+        self._lock = threading.Lock()
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(url: str, revision: str) -> str:
+        return hashlib.sha256(f"{url}|{revision}".encode("utf-8")).hexdigest()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, f"{name}.json")
+
+    def _read(self, name: str):
+        try:
+            with open(self._path(name), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _write(self, name: str, value):
+        path = self._path(name)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(value, file)
+        os.replace(tmp_path, path)
+
+    def _prune_disk(self, prefix: str):
+        paths = [
+            os.path.join(self.cache_dir, name)
+            for name in os.listdir(self.cache_dir)
+            if name.startswith(prefix) and name.endswith(".json")
+        ]
+        if len(paths) <= self.max_disk_entries:
+            return
+        paths.sort(key=os.path.getmtime)
+        for path in paths[: len(paths) - self.max_disk_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _remember(self, entries: OrderedDict, key: str, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Scenes]:
+        with self._lock:
+            scenes = self._entries.get(key)
+            if scenes is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return scenes
+
+        scenes = self._read(f"scenes-{key}") if self.cache_dir else None
+        with self._lock:
+            if scenes is None:
+                self.misses += 1
+                return None
+            self._remember(self._entries, key, scenes)
+            self.hits += 1
+            return scenes
+
+    def put(self, key: str, scenes: Scenes):
+        with self._lock:
+            self._remember(self._entries, key, scenes)
+        if self.cache_dir:
+            self._write(f"scenes-{key}", scenes)
+            self._prune_disk("scenes-")
+
+    def baseline(self, url: str) -> Optional[tuple[str, Scenes]]:
+        """Returns the (key, scenes) last served for `url` in incremental mode."""
+        name = f"baseline-{self.make_key(url, '')}"
+        with self._lock:
+            baseline = self._baselines.get(url)
+        if baseline is None and self.cache_dir:
+            stored = self._read(name)
+            baseline = (stored["key"], stored["scenes"]) if stored else None
+        return baseline
+
+    def set_baseline(self, url: str, key: str, scenes: Scenes):
+        with self._lock:
+            self._remember(self._baselines, url, (key, scenes))
+        if self.cache_dir:
+            self._write(
+                f"baseline-{self.make_key(url, '')}", {"key": key, "scenes": scenes}
+            )
+            self._prune_disk("baseline-")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,97 @@
+"""LRU cache for model conditioning tensors with optional safetensors persistence."""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import torch
+from safetensors.torch import load_file
+from safetensors.torch import save_file
+
+Tensors = dict[str, torch.Tensor]
+
+
+def _nbytes(tensors: Tensors) -> int:
+    return sum(t.numel() * t.element_size() for t in tensors.values())
+
+
+class TensorCache:
+    """Size-bounded in-memory LRU of named tensor groups.
+
+    When `cache_dir` is set every entry is also written to disk as a safetensors
+    file so that it survives restarts; disk hits are promoted back to memory on
+    `device`.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        cache_dir: Optional[str] = None,
+        device: str = "cuda",
+    ):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.device = device
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._entries: OrderedDict[str, Tensors] = OrderedDict()
+        self._lock = threading.Lock()
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.safetensors")
+
+    def _insert(self, key: str, tensors: Tensors):
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= _nbytes(previous)
+            self._entries[key] = tensors
+            self._bytes += _nbytes(tensors)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= _nbytes(evicted)
+
+    def get(self, key: str) -> Optional[Tensors]:
+        with self._lock:
+            tensors = self._entries.get(key)
+            if tensors is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return tensors
+
+        if self.cache_dir and os.path.exists(self._path(key)):
+            tensors = load_file(self._path(key), device=self.device)
+            self._insert(key, tensors)
+            with self._lock:
+                self.hits += 1
+            return tensors
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, tensors: Tensors):
+        self._insert(key, tensors)
+        if self.cache_dir:
+            path = self._path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            save_file(
+                {name: t.detach().contiguous().cpu() for name, t in tensors.items()},
+                tmp_path,
+                metadata={"key": key},
+            )
+            os.replace(tmp_path, path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
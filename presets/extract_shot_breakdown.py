@@ -86,6 +86,29 @@ total: 2
 ```
 """
 
+JSON_SAMPLE_OUTPUT = """\
+Reply with a single JSON object and nothing else, in the following shape:
+{
+    "total_characters": 1,
+    "characters": [
+        {"name": "", "age": -1, "gender": "", "description": ""}
+    ],
+    "total_frames": 1,
+    "frames": [
+        {
+            "frame_id": "",
+            "description": "",
+            "shot_type": "",
+            "camera_angle": "",
+            "location": "",
+            "character_expressions": [["Character_name", "expression"]],
+            "tips_for_director": "",
+            "original_script_chunk": ""
+        }
+    ]
+}
+"""
+
 USER_SCRIPT = """\
 The script is:
 
@@ -1,17 +1,22 @@
 """Common utility functions used throughout the server."""
-import base64
+import threading
 from io import BytesIO
 from typing import Union
 from urllib.parse import urlparse
 
-import boto3
 import numpy as np
 from PIL import Image
 
 from modules import schema
+from utils import constants
+from utils import image_buffer
+from utils import s3_cache
 
 Gender = schema.Gender
 
+_S3_CACHES: dict[str, s3_cache.S3Cache] = {}
+_S3_CACHES_LOCK = threading.Lock()
+
 
 def get_gender(value: str) -> Gender:
     if value.lower() == "male":
@@ -23,10 +28,7 @@ def get_gender(value: str) -> Gender:
 
 
 def convert_to_b64(image: Image) -> str:
-    buffered = BytesIO()
-    image.save(buffered, format="JPEG")
-    img_b64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
-    return img_b64
+    return image_buffer.to_base64(image, format="JPEG")
 
 
 def read_image_from_s3(image_url: str) -> str:
@@ -45,10 +47,22 @@ def load_img_to_array(img_p):
         return np.array(img)
 
 
-def fetch_s3_file(source: Union[str, dict], region_name: str = "ap-south-1") -> bytes:
-    print(f"The url is: {source}")
-    s3_client = boto3.client("s3", region_name=region_name)
+def get_s3_cache(region_name: str = "ap-south-1") -> s3_cache.S3Cache:
+    """Returns the process wide S3 cache for the given region."""
+    with _S3_CACHES_LOCK:
+        if region_name not in _S3_CACHES:
+            _S3_CACHES[region_name] = s3_cache.S3Cache(
+                cache_dir=constants.S3CacheDir,
+                max_disk_bytes=constants.S3CacheMaxDiskBytes,
+                max_memory_bytes=constants.S3CacheMaxMemoryBytes,
+                revalidate_after=constants.S3CacheRevalidateSeconds,
+                region_name=region_name,
+            )
+        return _S3_CACHES[region_name]
 
+
+def parse_s3_source(source: Union[str, dict]) -> tuple[str, str]:
+    """Returns the (bucket, key) pair for an S3 URL or a bucket/key dict."""
     if isinstance(source, str):
         # Handle URL input
         parsed_url = urlparse(source)
@@ -62,9 +76,28 @@ def fetch_s3_file(source: Union[str, dict], region_name: str = "ap-south-1") ->
             raise ValueError(
                 "Dictionary input must contain 'bucket_name' and 'file_key'"
             )
+    return bucket_name, file_path
+
 
+def fetch_s3_file(source: Union[str, dict], region_name: str = "ap-south-1") -> bytes:
+    print(f"The url is: {source}")
+    bucket_name, file_path = parse_s3_source(source)
     print(f"Bucket: {bucket_name} and path: {file_path}")
-    response = s3_client.get_object(Bucket=bucket_name, Key=file_path)
-    file_content = response["Body"].read()
+    return get_s3_cache(region_name).get(bucket_name, file_path)
+
+
+def fetch_s3_etag(source: Union[str, dict], region_name: str = "ap-south-1") -> str:
+    """Returns the ETag of an S3 object without downloading it."""
+    bucket_name, file_path = parse_s3_source(source)
+    return get_s3_cache(region_name).etag(bucket_name, file_path)
+
+
+def s3_etag_key(source: str, etag: str = None) -> str:
+    """`source` qualified with its ETag; a cache key that changes with the object."""
+    return f"{source}@{etag or fetch_s3_etag(source)}"
+
 
-    return file_content
+def split_s3_etag_key(key: str) -> tuple[str, str]:
+    """Inverse of `s3_etag_key`: (source, etag), etag is empty if unqualified."""
+    source, _, etag = key.rpartition("@")
+    return (source, etag) if source else (key, "")
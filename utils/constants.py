@@ -5,6 +5,11 @@ from dotenv import load_dotenv
 
 load_dotenv()
 OPEN_AI_API_KEY = os.environ.get("OPENAI_KEY")
+# Optional override, e.g. to point the server at `utils/openai_stub.py`.
+OPEN_AI_BASE_URL = os.environ.get("OPENAI_BASE_URL") or None
+OPEN_AI_MAX_CONCURRENCY = int(os.environ.get("OPENAI_MAX_CONCURRENCY", 16))
+OPEN_AI_TIMEOUT = float(os.environ.get("OPENAI_TIMEOUT", 120))
+OPEN_AI_CACHE_TTL = float(os.environ.get("OPENAI_CACHE_TTL", 0))
 os.environ["AWS_ACCESS_KEY_ID"] = os.environ.get("AWS_ACCESS_KEY_ID")
 os.environ["AWS_SECRET_ACCESS_KEY"] = os.environ.get("AWS_SECRET_ACCESS_KEY")
 
@@ -12,6 +17,65 @@ os.environ["AWS_SECRET_ACCESS_KEY"] = os.environ.get("AWS_SECRET_ACCESS_KEY")
 ModelBaseDir = "/home/immer-dev/hf"
 ModelCacheDir = os.path.join(ModelBaseDir, "hf_cache")
 FluxModelPath = "/home/immer-dev/model2"
+# Safetensors packages written by `python -m models.checkpoint`; components
+# without one fall back to the pickles in FluxModelPath.
+FluxSafetensorsDir = os.environ.get(
+    "FLUX_SAFETENSORS_DIR", os.path.join(FluxModelPath, "safetensors")
+)
+FluxShardLoadWorkers = int(os.environ.get("FLUX_SHARD_LOAD_WORKERS", 4))
+# `bf16`, or `int8`/`float8` to load the quantized packages from
+# `<FluxQuantizedDir>/<weights>/` made with `models.checkpoint --quantize`.
+FluxWeights = os.environ.get("FLUX_WEIGHTS", "bf16")
+FluxQuantizedDir = os.environ.get(
+    "FLUX_QUANTIZED_DIR", os.path.join(FluxModelPath, "quantized")
+)
+# Snap requested sizes to the resolution buckets in `models/resolution.py`.
+ResolutionBuckets = os.environ.get("RESOLUTION_BUCKETS", "1") == "1"
+# Compile the Flux transformer blocks while warming up every bucket.
+FluxCompile = os.environ.get("FLUX_COMPILE", "0") == "1"
+# Max compatible GPU jobs generated in one pipeline call; every batch size up to
+# it is warmed up per bucket.
+FluxMaxBatchSize = int(os.environ.get("FLUX_MAX_BATCH_SIZE", 4))
+TorchCompileCacheDir = os.environ.get(
+    "TORCH_COMPILE_CACHE_DIR", "/home/immer-dev/torch_compile_cache"
+)
+# (priority, timeout in seconds) of the GPU jobs of each endpoint. Lower
+# priorities run first; jobs still queued after the timeout are failed.
+GpuJobPolicies = {
+    "regenerate_scene": (0, float(os.environ.get("REGENERATE_SCENE_TIMEOUT", 120))),
+    "generate_image": (0, float(os.environ.get("GENERATE_IMAGE_TIMEOUT", 120))),
+    "generate_scene": (1, float(os.environ.get("GENERATE_SCENE_TIMEOUT", 180))),
+    "generate_character_profile": (
+        1,
+        float(os.environ.get("GENERATE_CHARACTER_PROFILE_TIMEOUT", 180)),
+    ),
+    "generate_storyboard": (2, float(os.environ.get("STORYBOARD_FRAME_TIMEOUT", 600))),
+}
+# Models loaded in the background at startup (and required for `/ready`); the
+# others (lama, mask_model, prompt_enhancer) load on first use.
+EagerModels = {
+    name.strip()
+    for name in os.environ.get("EAGER_MODELS", "flux,ip_adapter").split(",")
+    if name.strip()
+}
+
+# Local read-through cache for objects fetched from S3.
+S3CacheDir = os.environ.get("S3_CACHE_DIR", "/home/immer-dev/s3_cache")
+S3CacheMaxDiskBytes = int(os.environ.get("S3_CACHE_MAX_DISK_BYTES", 10 * 1024**3))
+S3CacheMaxMemoryBytes = int(
+    os.environ.get("S3_CACHE_MAX_MEMORY_BYTES", 256 * 1024**2)
+)
+S3CacheRevalidateSeconds = float(os.environ.get("S3_CACHE_REVALIDATE_SECONDS", 60))
+
+# Cache of IP-Adapter image embeds for character reference images.
+ImageEmbedsCacheDir = os.environ.get("IMAGE_EMBEDS_CACHE_DIR") or None
+ImageEmbedsCacheMaxBytes = int(
+    os.environ.get("IMAGE_EMBEDS_CACHE_MAX_BYTES", 64 * 1024**2)
+)
+# Cache of Flux text encoder outputs keyed by the exact prompt text.
+PromptEmbedsCacheMaxBytes = int(
+    os.environ.get("PROMPT_EMBEDS_CACHE_MAX_BYTES", 512 * 1024**2)
+)
 
 
 # Directory to store API specific presets.
@@ -27,4 +91,45 @@ ReferenceImageConfigDir = os.path.join(
 
 S3_BUCKET_PATH = os.environ.get("S3_BUCKET_PATH")
 S3_MODEL_PATH = os.environ.get("S3_MODEL_PATH")
+# Comma separated WebUI hosts (`host` or `host:port`); requests are balanced across them.
 WEBUI_INSTANCE_IP = os.environ.get("WEBUI_INSTANCE_IP")
+WEBUI_TIMEOUT = float(os.environ.get("WEBUI_TIMEOUT", 300))
+WEBUI_MAX_RETRIES = int(os.environ.get("WEBUI_MAX_RETRIES", 2))
+WEBUI_HEALTH_INTERVAL = float(os.environ.get("WEBUI_HEALTH_INTERVAL", 15))
+
+# Store for async job records: `memory` or `sqlite:<path to db file>`.
+JobStore = os.environ.get("JOB_STORE", "memory")
+
+# Finished job records are evicted after this many seconds, or earlier (oldest
+# first) once the store holds more than JobMaxRecords records.
+JobTTLSeconds = float(os.environ.get("JOB_TTL_SECONDS", 3600))
+JobMaxRecords = int(os.environ.get("JOB_MAX_RECORDS", 1000))
+
+# Max number of storyboard frames expanded/rendered concurrently.
+StoryboardConcurrency = int(os.environ.get("STORYBOARD_CONCURRENCY", 16))
+
+# Worker processes used to extract PDF pages for /split_script.
+ScriptSplitWorkers = int(
+    os.environ.get("SCRIPT_SPLIT_WORKERS", min(4, os.cpu_count() or 1))
+)
+
+# Split scripts cached per url + revision; the disk tier is skipped when unset.
+ScriptCacheDir = (
+    os.environ.get("SCRIPT_CACHE_DIR", "/home/immer-dev/script_cache") or None
+)
+ScriptCacheMaxEntries = int(os.environ.get("SCRIPT_CACHE_MAX_ENTRIES", 128))
+
+# Optional directory for Jinja bytecode of the prompt templates.
+PromptTemplateCacheDir = os.environ.get("PROMPT_TEMPLATE_CACHE_DIR") or None
+
+# Threads encoding output images (JPEG/WebP/AVIF/PNG) off the request path.
+ImageEncodeWorkers = int(
+    os.environ.get("IMAGE_ENCODE_WORKERS", min(8, os.cpu_count() or 1))
+)
+
+# Character reference images are downloaded and decoded concurrently with the
+# prompt call; decoded images are cached up to the byte limit.
+ImagePrefetchWorkers = int(os.environ.get("IMAGE_PREFETCH_WORKERS", 16))
+ImagePrefetchCacheBytes = int(
+    os.environ.get("IMAGE_PREFETCH_CACHE_BYTES", 256 * 1024**2)
+)
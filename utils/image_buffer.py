@@ -0,0 +1,114 @@
+"""Reusable output buffers for encoding images without intermediate copies."""
+import base64
+import threading
+from contextlib import contextmanager
+from io import BytesIO
+from typing import Iterator
+
+from PIL import Image
+
+# Enough for a 1024x1024 PNG in most cases; the buffer grows when needed.
+DEFAULT_CAPACITY = 4 * 1024**2
+# Thread buffers grown past this by an oversized encode are dropped afterwards
+# instead of pinning the memory for the lifetime of the thread.
+MAX_RETAINED_CAPACITY = 16 * 1024**2
+
+MEDIA_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "AVIF": "image/avif",
+}
+
+
+class EncodeBuffer:
+    """Write-only file object over a preallocated, growable bytearray.
+
+    PIL encoders write straight into it; `view()` exposes the written bytes as
+    a memoryview, so nothing is copied until the caller needs its own bytes.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self._data = bytearray(capacity)
+        self._size = 0
+
+    def write(self, chunk) -> int:
+        size = len(chunk)
+        end = self._size + size
+        if end > len(self._data):
+            self._data.extend(bytes(max(end, 2 * len(self._data)) - len(self._data)))
+        self._data[self._size : end] = chunk
+        self._size = end
+        return size
+
+    def tell(self) -> int:
+        return self._size
+
+    @property
+    def capacity(self) -> int:
+        return len(self._data)
+
+    def flush(self):
+        pass
+
+    def reset(self):
+        self._size = 0
+
+    def view(self) -> memoryview:
+        return memoryview(self._data)[: self._size]
+
+
+_LOCAL = threading.local()
+
+
+def _thread_buffer() -> EncodeBuffer:
+    buffer = getattr(_LOCAL, "buffer", None)
+    if buffer is None:
+        buffer = _LOCAL.buffer = EncodeBuffer()
+    return buffer
+
+
+@contextmanager
+def encoded(image: Image.Image, format: str = "JPEG", **params) -> Iterator[memoryview]:
+    """Encodes `image` into this thread's reusable buffer.
+
+    The yielded view is only valid inside the `with` block.
+    """
+    buffer = _thread_buffer()
+    buffer.reset()
+    try:
+        image.save(buffer, format=format, **params)
+        view = buffer.view()
+        try:
+            yield view
+        finally:
+            view.release()
+    finally:
+        if buffer.capacity > MAX_RETAINED_CAPACITY:
+            del _LOCAL.buffer
+
+
+def to_base64(image: Image.Image, format: str = "JPEG", **params) -> str:
+    with encoded(image, format, **params) as view:
+        return base64.b64encode(view).decode("ascii")
+
+
+def to_bytes(image: Image.Image, format: str = "JPEG", **params) -> bytes:
+    with encoded(image, format, **params) as view:
+        return view.tobytes()
+
+
+def from_base64(data: str) -> Image.Image:
+    """Opens a base64 encoded image; the decoded bytes are shared, not copied."""
+    return Image.open(BytesIO(base64.b64decode(data)))
+
+
+def sniff_media_type(data: bytes) -> str:
+    """Media type of already encoded image bytes, e.g. WebUI output."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return MEDIA_TYPES["PNG"]
+    if data[:3] == b"\xff\xd8\xff":
+        return MEDIA_TYPES["JPEG"]
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return MEDIA_TYPES["WEBP"]
+    return "application/octet-stream"
@@ -0,0 +1,79 @@
+"""Image encoding stage with per-request format/quality on a dedicated pool."""
+import logging
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from PIL import Image
+
+from modules import schema
+from utils import constants
+from utils import image_buffer
+
+LOGGER = logging.getLogger(__name__)
+
+try:
+    # Pillow < 11.2 only saves AVIF through this optional plugin.
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+# Register every available encoder up front so `Image.SAVE` is complete.
+Image.init()
+
+ENCODE_POOL = ThreadPoolExecutor(
+    max_workers=constants.ImageEncodeWorkers, thread_name_prefix="encode"
+)
+
+
+@dataclass
+class EncodedImage:
+    data: str  # base64
+    media_type: str
+    preview: str = ""  # base64, empty unless requested
+
+
+def resolve_format(options: schema.ImageOutputOptions, default: str) -> str:
+    image_format = options.format.value if options.format else default
+    if image_format == "AVIF" and "AVIF" not in Image.SAVE:
+        LOGGER.warning("AVIF encoding is not available, falling back to WebP.")
+        return "WEBP"
+    return image_format
+
+
+def save_params(options: schema.ImageOutputOptions, image_format: str) -> dict:
+    if image_format == "PNG":
+        return {"compress_level": options.png_compress_level}
+    if image_format == "WEBP":
+        return {"quality": options.quality, "method": 4}
+    return {"quality": options.quality}
+
+
+def _prepare(image: Image.Image, image_format: str) -> Image.Image:
+    if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+        return image.convert("RGB")
+    return image
+
+
+def encode(
+    image: Image.Image, options: schema.ImageOutputOptions, default: str = "JPEG"
+) -> EncodedImage:
+    image_format = resolve_format(options, default)
+    image = _prepare(image, image_format)
+    params = save_params(options, image_format)
+    data = image_buffer.to_base64(image, image_format, **params)
+
+    preview = ""
+    if options.preview_size > 0:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((options.preview_size, options.preview_size))
+        preview = image_buffer.to_base64(thumbnail, image_format, **params)
+    return EncodedImage(
+        data=data, media_type=image_buffer.MEDIA_TYPES[image_format], preview=preview
+    )
+
+
+def encode_async(
+    image: Image.Image, options: schema.ImageOutputOptions, default: str = "JPEG"
+) -> "Future[EncodedImage]":
+    """Encodes on the encode pool so GPU/request threads move on right away."""
+    return ENCODE_POOL.submit(encode, image, options, default)
@@ -0,0 +1,148 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Point `OpenAIModel(base_url=...)` (or `OPENAI_BASE_URL`) at it for tests and
+benchmarks; `stream=True` requests get the reply word by word as server-sent
+events:
+
+    python -m utils.openai_stub --port 8089 --latency 0.5 --failure-rate 0.1
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+
+class StubConfig:
+    def __init__(
+        self, latency: float = 0.0, failure_rate: float = 0.0, reply: str = ""
+    ):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        # When empty, the last user message is echoed back.
+        self.reply = reply
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+def make_handler(config: StubConfig):
+    class ChatCompletionsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: dict):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _send_stream(self, model: str, content: str):
+            """Streams `content` word by word as server-sent events."""
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            deltas = [{"role": "assistant", "content": ""}]
+            deltas += [
+                {"content": word} for word in re.findall(r"\S*\s*", content) if word
+            ]
+            for idx, delta in enumerate(deltas + [{}]):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "delta": delta,
+                            "finish_reason": None if idx < len(deltas) else "stop",
+                        }
+                    ],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            with config.lock:
+                config.requests += 1
+
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+                return
+            time.sleep(config.latency)
+            if random.random() < config.failure_rate:
+                self._send(
+                    random.choice([429, 500, 503]),
+                    {"error": {"message": "Injected failure", "type": "stub_error"}},
+                )
+                return
+
+            messages = request.get("messages", [])
+            user_messages = [m["content"] for m in messages if m.get("role") == "user"]
+            content = config.reply or (user_messages[-1] if user_messages else "")
+            if request.get("stream"):
+                self._send_stream(request.get("model", "stub"), content)
+                return
+            self._send(
+                200,
+                {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "stub"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": 0,
+                        "completion_tokens": 0,
+                        "total_tokens": 0,
+                    },
+                },
+            )
+
+    return ChatCompletionsHandler
+
+
+def start_stub_server(
+    host: str = "127.0.0.1", port: int = 0, **config_kwargs
+) -> tuple[ThreadingHTTPServer, StubConfig]:
+    """Starts the stub on a daemon thread; `port=0` picks a free port.
+
+    The base url for clients is `http://{host}:{server.server_port}/v1`.
+    """
+    config = StubConfig(**config_kwargs)
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, config
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--reply", default="")
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency, args.failure_rate, args.reply)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config))
+    print(f"OpenAI stub listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
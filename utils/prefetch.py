@@ -0,0 +1,113 @@
+"""Concurrent prefetching of character reference images from S3."""
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+from typing import Optional
+
+from PIL import Image
+
+from modules import errors
+from utils import common
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _nbytes(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+class ImagePrefetcher:
+    """Downloads and decodes S3 images on a bounded pool, caching the results.
+
+    Call `prefetch` as soon as the request is parsed so the downloads overlap
+    with the prompt expansion, then `resolve` right before generation. Concurrent
+    requests for the same url share one download; decoded images are kept in
+    a size-bounded LRU keyed by url + ETag.
+    """
+
+    def __init__(self, max_workers: int = 16, max_bytes: int = 256 * 1024**2):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="prefetch"
+        )
+        self._inflight: dict[str, Future] = {}
+        self._images: OrderedDict[tuple[str, str], Image.Image] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _load(self, image_url: str) -> tuple[str, Image.Image]:
+        try:
+            key = (image_url, common.fetch_s3_etag(image_url))
+            etag_key = common.s3_etag_key(*key)
+            with self._lock:
+                image = self._images.get(key)
+                if image is not None:
+                    self._images.move_to_end(key)
+                    self.hits += 1
+                    return etag_key, image
+                self.misses += 1
+
+            image = common.read_image_from_s3(image_url).convert("RGB")
+            with self._lock:
+                if key not in self._images:
+                    self._images[key] = image
+                    self._bytes += _nbytes(image)
+                while self._bytes > self.max_bytes and len(self._images) > 1:
+                    _, evicted = self._images.popitem(last=False)
+                    self._bytes -= _nbytes(evicted)
+            return etag_key, image
+        finally:
+            with self._lock:
+                self._inflight.pop(image_url, None)
+
+    def prefetch(self, image_urls: Iterable[str]) -> dict[str, Future]:
+        """Starts loading every url not already in flight; returns their futures."""
+        futures = {}
+        with self._lock:
+            for image_url in image_urls:
+                if image_url in futures:
+                    continue
+                future = self._inflight.get(image_url)
+                if future is None:
+                    future = self._executor.submit(self._load, image_url)
+                    self._inflight[image_url] = future
+                futures[image_url] = future
+        return futures
+
+    def resolve(
+        self, image_urls: list[str], futures: dict[str, Future] = None
+    ) -> tuple[list[str], list[Optional[Image.Image]]]:
+        """Waits for the images of `image_urls`, in order.
+
+        Returns the ETag-qualified keys (`common.s3_etag_key`) resolved while
+        loading, so the ETag is only requested once per image, and the images.
+        Images that fail to load are logged and returned as None with the bare
+        url as key, so the model can fall back to fetching them itself.
+        """
+        futures = futures or self.prefetch(image_urls)
+        keys, images = [], []
+        for image_url in image_urls:
+            future = futures.get(image_url) or self.prefetch([image_url])[image_url]
+            try:
+                key, image = future.result()
+            except (errors.BaseCustomError, Exception) as exc:
+                LOGGER.warning(f"Prefetch of {image_url} failed: {exc}")
+                key, image = image_url, None
+            keys.append(key)
+            images.append(image)
+        return keys, images
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "images": len(self._images),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "inflight": len(self._inflight),
+            }
@@ -0,0 +1,249 @@
+"""Read-through, content-addressed cache in front of S3 object fetches."""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+import boto3
+from botocore.exceptions import ClientError
+
+
+@dataclass
+class CacheEntry:
+    bucket: str
+    key: str
+    etag: str
+    size: int
+    path: str
+    validated_at: float
+
+
+class S3Cache:
+    """Two tier (memory + disk) LRU cache for S3 objects keyed by bucket/key/ETag.
+
+    * Small objects are additionally kept in an in-memory hot tier.
+    * Entries older than `revalidate_after` seconds are revalidated with a
+      conditional GET (`IfNoneMatch`), so unchanged objects cost a 304 only.
+    * Concurrent requests for the same object share a single download.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_disk_bytes: int = 10 * 1024**3,
+        max_memory_bytes: int = 256 * 1024**2,
+        max_memory_object_bytes: int = 8 * 1024**2,
+        revalidate_after: float = 60.0,
+        region_name: str = "ap-south-1",
+    ):
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        self.max_memory_object_bytes = max_memory_object_bytes
+        self.revalidate_after = revalidate_after
+        self.client = boto3.client("s3", region_name=region_name)
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple[str, str], CacheEntry] = OrderedDict()
+        self._disk_bytes = 0
+        self._memory: OrderedDict[tuple[str, str], bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._inflight: dict[tuple[str, str], Future] = {}
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _object_path(self, bucket: str, key: str, etag: str) -> str:
+        digest = hashlib.sha256(f"{bucket}/{key}/{etag}".encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest)
+
+    def _load_index(self):
+        """Rebuilds the in-memory index from the metadata stored on disk."""
+        metas = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".meta"):
+                continue
+            meta_path = os.path.join(self.cache_dir, name)
+            try:
+                with open(meta_path, "r", encoding="utf-8") as file:
+                    meta = json.load(file)
+                data_path = meta_path[: -len(".meta")]
+                metas.append((os.path.getatime(data_path), meta, data_path))
+            except (OSError, ValueError):
+                continue
+        for _, meta, data_path in sorted(metas, key=lambda item: item[0]):
+            entry = CacheEntry(
+                bucket=meta["bucket"],
+                key=meta["key"],
+                etag=meta["etag"],
+                size=meta["size"],
+                path=data_path,
+                validated_at=0.0,
+            )
+            self._entries[(entry.bucket, entry.key)] = entry
+            self._disk_bytes += entry.size
+        self._evict_disk()
+
+    def _remove_files(self, entry: CacheEntry):
+        for path in (entry.path, entry.path + ".meta"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.max_disk_bytes and self._entries:
+            cache_key, entry = self._entries.popitem(last=False)
+            self._disk_bytes -= entry.size
+            self._drop_memory(cache_key)
+            self._remove_files(entry)
+
+    def _drop_memory(self, cache_key: tuple[str, str]):
+        data = self._memory.pop(cache_key, None)
+        if data is not None:
+            self._memory_bytes -= len(data)
+
+    def _remember(self, cache_key: tuple[str, str], data: bytes):
+        if len(data) > self.max_memory_object_bytes:
+            return
+        self._drop_memory(cache_key)
+        self._memory[cache_key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _store(self, bucket: str, key: str, etag: str, data: bytes) -> CacheEntry:
+        path = self._object_path(bucket, key, etag)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+        with open(path + ".meta", "w", encoding="utf-8") as file:
+            json.dump(
+                {"bucket": bucket, "key": key, "etag": etag, "size": len(data)}, file
+            )
+
+        entry = CacheEntry(bucket, key, etag, len(data), path, time.monotonic())
+        cache_key = (bucket, key)
+        with self._lock:
+            previous = self._entries.pop(cache_key, None)
+            if previous is not None:
+                self._disk_bytes -= previous.size
+                if previous.path != path:
+                    self._remove_files(previous)
+            self._entries[cache_key] = entry
+            self._disk_bytes += entry.size
+            self._remember(cache_key, data)
+            self._evict_disk()
+        return entry
+
+    def _read_cached(self, cache_key: tuple[str, str], entry: CacheEntry) -> bytes:
+        with self._lock:
+            data = self._memory.get(cache_key)
+            if data is not None:
+                self._memory.move_to_end(cache_key)
+                return data
+        with open(entry.path, "rb") as file:
+            data = file.read()
+        with self._lock:
+            self._remember(cache_key, data)
+        return data
+
+    def _fetch(self, bucket: str, key: str) -> bytes:
+        cache_key = (bucket, key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None:
+                self._entries.move_to_end(cache_key)
+
+        if entry is not None:
+            if time.monotonic() - entry.validated_at < self.revalidate_after:
+                try:
+                    return self._read_cached(cache_key, entry)
+                except FileNotFoundError:
+                    entry = None
+
+        kwargs = {"Bucket": bucket, "Key": key}
+        if entry is not None:
+            kwargs["IfNoneMatch"] = entry.etag
+        try:
+            response = self.client.get_object(**kwargs)
+        except ClientError as exc:
+            status = exc.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+            if entry is None or status != 304:
+                raise
+            entry.validated_at = time.monotonic()
+            try:
+                return self._read_cached(cache_key, entry)
+            except FileNotFoundError:
+                # Removed from disk since it was validated; download it again.
+                response = self.client.get_object(Bucket=bucket, Key=key)
+
+        data = response["Body"].read()
+        self._store(bucket, key, response.get("ETag", "").strip('"'), data)
+        return data
+
+    def get(self, bucket: str, key: str) -> bytes:
+        """Returns the object bytes, downloading at most once per concurrent burst."""
+        cache_key = (bucket, key)
+        with self._lock:
+            data = self._memory.get(cache_key)
+            entry = self._entries.get(cache_key)
+            if (
+                data is not None
+                and entry is not None
+                and time.monotonic() - entry.validated_at < self.revalidate_after
+            ):
+                self._memory.move_to_end(cache_key)
+                self._entries.move_to_end(cache_key)
+                return data
+
+            future = self._inflight.get(cache_key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._inflight[cache_key] = future
+
+        if not is_leader:
+            return future.result()
+
+        try:
+            data = self._fetch(bucket, key)
+            future.set_result(data)
+            return data
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(cache_key, None)
+
+    def etag(self, bucket: str, key: str) -> str:
+        """Returns the current ETag of the object, via HEAD if the entry is stale."""
+        cache_key = (bucket, key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+        if (
+            entry is not None
+            and time.monotonic() - entry.validated_at < self.revalidate_after
+        ):
+            return entry.etag
+
+        etag = self.client.head_object(Bucket=bucket, Key=key)["ETag"].strip('"')
+        if entry is not None and entry.etag == etag:
+            entry.validated_at = time.monotonic()
+        return etag
+
+    def invalidate(self, bucket: str, key: str):
+        """Drops the given object from both tiers."""
+        with self._lock:
+            entry = self._entries.pop((bucket, key), None)
+            self._drop_memory((bucket, key))
+            if entry is not None:
+                self._disk_bytes -= entry.size
+                self._remove_files(entry)
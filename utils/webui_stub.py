@@ -0,0 +1,101 @@
+"""Local stand-in for the Stable Diffusion WebUI API.
+
+Serves `/sdapi/v1/img2img`, `/sdapi/v1/txt2img` and `/internal/ping`. Point
+`WEBUI_INSTANCE_IP` (or `WebUIClient` hosts) at one or more instances:
+
+    python -m utils.webui_stub --port 7860 --latency 2 --failure-rate 0.1
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+# 1x1 white PNG returned as the rendered image.
+BLANK_PNG_B64 = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8/5+hHgAHggJ/PchI7wAAAABJRU5ErkJggg=="
+
+
+class StubConfig:
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+
+def make_handler(config: StubConfig):
+    class WebUIHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status: int, body: dict):
+            payload = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path.rstrip("/") == "/internal/ping":
+                self._send(200, {})
+            else:
+                self._send(404, {"detail": "Not Found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path.rstrip("/") not in ("/sdapi/v1/img2img", "/sdapi/v1/txt2img"):
+                self._send(404, {"detail": "Not Found"})
+                return
+
+            with config.lock:
+                config.requests += 1
+                config.in_flight += 1
+                config.max_in_flight = max(config.max_in_flight, config.in_flight)
+            try:
+                time.sleep(config.latency)
+                if random.random() < config.failure_rate:
+                    self._send(random.choice([500, 503]), {"error": "Injected failure"})
+                    return
+                self._send(
+                    200,
+                    {
+                        "images": [BLANK_PNG_B64],
+                        "parameters": {"prompt": request.get("prompt", "")},
+                        "info": "{}",
+                    },
+                )
+            finally:
+                with config.lock:
+                    config.in_flight -= 1
+
+    return WebUIHandler
+
+
+def start_stub_server(
+    host: str = "127.0.0.1", port: int = 0, **config_kwargs
+) -> tuple[ThreadingHTTPServer, StubConfig]:
+    """Starts the stub on a daemon thread; `port=0` picks a free port."""
+    config = StubConfig(**config_kwargs)
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, config
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7860)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency, args.failure_rate)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config))
+    print(f"WebUI stub listening on http://{args.host}:{args.port}")
+    server.serve_forever()